@@ -9,6 +9,10 @@ contains the code to break expressions into tokens then parse them into
 an expression tree for evaluation.
 """
 
+__version__ = '2.8.0'
+
 # Hoist some core names straight into the public namespace
-from .core import basic, verbose, Mode, compile, tokenize, tokenize_lazy
+from .core import (basic, basic_many, distribution, simulate, verbose, Mode, Engine, Parser,
+                   compile, tokenize, tokenize_lazy, cache_info, cache_clear, set_cache_size,
+                   set_trusted, save_cache, load_cache)
 from .lib.exceptions import RollError, ParseError, EvaluationError
@@ -1,10 +1,22 @@
+import collections
 import enum
 import typing
 
-from .lib.evaltree import EvalTree, EvalTreeNode
-from .lib.exceptions import InputTypeError
-from .lib.operators import OPERATORS
-from .lib.tokenizer import Token, tokens_lazy
+from .lib.bytecode import Program
+from .lib.cache import CacheInfo, LRUCache
+from .lib.compiler import lower_tree
+from .lib.distribution import Distribution, distribution as _distribution
+from .lib.evaltree import AVERAGE, CRITICAL, EvalTree, EvalTreeNode, Final, MAXIMUM
+from .lib.exceptions import ArgumentValueError, EvaluationError, InputTypeError
+from .lib import helpers as _helpers
+from .lib.optimizer import check_rerolls, check_types, fold_constants
+from .lib.pratt import parse as _pratt
+from .lib import store as _store
+from .lib.rng import as_rng
+from .lib.simulation import Histogram, simulate as _simulate
+from .lib.vectorized import evaluate_batch
+from .lib.operators import OPERATORS, respecialize
+from .lib.tokenizer import Token, tokens, tokens_lazy
 
 
 class Mode(enum.Enum):
@@ -35,16 +47,193 @@ class Mode(enum.Enum):
         return encode.get(string.lower(), cls.NORMAL)
 
 
+class Engine(enum.Enum):
+    """Choose how a compiled expression gets rolled by ``basic``.
+
+    Tree walks the expression tree on every roll, annotating each node
+    with its value as it goes. Closure lowers the tree once, at compile
+    time, into a chain of Python functions that skip the walk entirely.
+    Bytecode flattens the tree into postfix instructions run by a small
+    stack machine, which handles expressions of any depth without
+    recursing. Rolls in the other modes use the same engine as normal
+    ones, while verbose rolls always walk the tree.
+
+    All give identical results for the same seed, with one exception:
+    Closure counts the successes in a set of dice, like ``15d6t5``, with
+    a single draw rather than by rolling every die. Every count is just
+    as likely as with the other engines, but a given seed gives a
+    different count.
+    """
+    TREE = 0
+    CLOSURE = 1
+    BYTECODE = 2
+
+
+class Parser(enum.Enum):
+    """Choose how ``compile`` turns a string into an expression tree.
+
+    Shunting yard splits the string into a list of tokens and then
+    arranges them into a tree, one token at a time. Pratt does both in a
+    single pass with precedence climbing, which is quicker. Both give
+    identical trees and raise identical errors.
+    """
+    SHUNTING_YARD = 0
+    PRATT = 1
+
+
 def _add_modifiers(tree: EvalTree, modifiers) -> EvalTree:
     # Manually stick the + <modifier> onto the root of the tree so it gets evaluated at the end
     tree.root = EvalTreeNode(OPERATORS['+'],
                              tree.root,
                              EvalTreeNode(modifiers))
+    tree.evaluator = None
+    tree.recipe = None
+    tree.variants = {}
     return tree
 
 
+# Trees parsed from strings by basic and verbose. Those rolled by basic
+# are lowered the first time they are rolled, as verbose never needs it.
+_parsed = LRUCache(1024)
+
+
+def _parse(expr: typing.Union[str, int, float, EvalTree]) -> EvalTree:
+    """Get the tree for an expression, from the cache if it's a string.
+
+    Trees that come from the cache are shared, so they must not be
+    modified or have their nodes filled in by ``EvalTree.evaluate``.
+    """
+    if isinstance(expr, str):
+        tree = _parsed.get(expr, lambda: compile(expr, parser=Parser.PRATT))
+        if isinstance(tree, Program):
+            # Loaded by load_cache and not used since. It becomes a tree
+            # like any freshly parsed one, so that it is lowered the same
+            # way and the same seed always gives the same roll.
+            tree = tree.to_tree()
+            if _helpers.is_trusted():
+                check_types(tree)
+            _parsed.put(expr, tree)
+        return tree
+    return EvalTree(expr)
+
+
+def cache_info() -> CacheInfo:
+    """Report on the cache of parsed expressions used by ``basic`` and ``verbose``.
+
+    :return: The number of hits, misses, and evictions so far, along
+        with the current and maximum number of cached expressions.
+    """
+    return _parsed.info()
+
+
+def cache_clear() -> None:
+    """Empty the cache of parsed expressions and reset its statistics."""
+    _parsed.clear()
+
+
+def set_cache_size(maxsize: int) -> None:
+    """Change how many parsed expressions are cached.
+
+    :param maxsize: The most expressions to keep. Zero turns the cache
+        off.
+    """
+    _parsed.resize(maxsize)
+
+
+def set_trusted(trusted: bool = True) -> None:
+    """Trust that expressions are well formed, and roll them without checking.
+
+    Some operators, like ``h`` and ``!``, check the type of every
+    argument each time they are called, and every roll is wrapped so
+    that any error comes out as an ``EvaluationError``. In trusted mode,
+    the types of operands are checked once when an expression is
+    compiled, wherever they can be told from the expression, and
+    neither is done while rolling. An expression that is wrong in a way
+    the compile-time check can't see then fails with whatever error
+    Python raises rather than one of the ``RollError`` family.
+
+    The cache of parsed expressions is cleared, as it holds expressions
+    compiled in the old mode. Other compiled expressions that roll
+    through a tree or bytecode follow the new mode straight away, while
+    those that use the closure engine keep rolling as they were
+    compiled.
+
+    :param trusted: Whether to switch trusted mode on or off.
+    """
+    _helpers.set_trusted(trusted)
+    respecialize()
+    _parsed.clear()
+
+
+def save_cache(path: str) -> None:
+    """Save every cached expression to a file, for ``load_cache`` to read.
+
+    :param path: The file to write. It is replaced if it exists.
+    """
+    _store.save(path, collections.OrderedDict(_parsed.items()))
+
+
+def load_cache(path: str) -> int:
+    """Fill the cache of parsed expressions from a file made by ``save_cache``.
+
+    Nothing is loaded if the file doesn't exist or was saved by a
+    different version of this package or with different operators. If
+    the file holds more expressions than the cache does, only the last
+    ones saved are kept.
+
+    :param path: The file to read.
+    :return: How many of the expressions from the file the cache holds.
+    :raises InputTypeError: If the expressions in the file are malformed.
+    """
+    try:
+        programs = _store.load(path)
+    except FileNotFoundError:
+        return 0
+    for expr, program in programs.items():
+        _parsed.put(expr, program)
+    return sum(1 for expr in programs if expr in _parsed)
+
+
+# The operators that each mode rolls in place of the usual dice, so
+# that a tree can be rolled in a mode without being rewritten
+_MODES = {
+    Mode.AVERAGE: AVERAGE,
+    Mode.CRIT: CRITICAL,
+    Mode.MAX: MAXIMUM,
+}
+
+
+def _variant(tree: EvalTree, mode: Mode, engine: 'Engine') -> typing.Callable[..., Final]:
+    """Get the evaluator that rolls a tree in a mode, building it the first time.
+
+    The tree is rewritten for the mode, folded, and prepared for its
+    engine just once, so later rolls in the same mode cost no more than
+    normal ones. As rolling the average or maximum involves no
+    randomness, those modes usually fold down to a single constant.
+
+    :param engine: The engine to roll with, unless the tree was compiled
+        with one of its own.
+    """
+    evaluator = tree.variants.get(mode)
+    if evaluator is None:
+        if tree.recipe is not None:
+            engine = tree.recipe[1][0]
+        evaluator = _build_variant(tree, mode, engine)
+        tree.variants[mode] = evaluator
+    return evaluator
+
+
+@_helpers.wrap_exceptions_with(EvaluationError, 'Failed to evaluate expression.')
+def _build_variant(tree: EvalTree, mode: Mode, engine: 'Engine') -> typing.Callable[..., Final]:
+    random = frozenset(code for code, op in OPERATORS.items() if op.stochastic)
+    folded = fold_constants(tree.rewritten(_MODES[mode]), random)
+    # Only a folded tree gets an evaluator for the tree engine, which
+    # this already is
+    return _evaluator(folded, engine, engine == Engine.TREE, _helpers.is_trusted())
+
+
 def verbose(expr: typing.Union[str, int, float, EvalTree], mode: Mode = Mode.NORMAL,
-            modifiers=0) -> str:
+            modifiers=0, rng=None) -> str:
     """Create a string that shows the actual values rolled alongside the final value.
 
     :param expr: The rollable string or precompiled expression tree.
@@ -52,27 +241,27 @@ def verbose(expr: typing.Union[str, int, float, EvalTree], mode: Mode = Mode.NOR
         maximum value.
     :param modifiers: A number that can be added on to the expression at
         the very end.
+    :param rng: The random number generator to roll with. This can be a
+        ``random.Random``, a NumPy generator, a seed, or anything else
+        with ``randint`` and ``choice`` methods. The global generator in
+        the ``random`` module is used by default.
     :return: A string showing the expression with rolls evaluated
         alongside the final result.
     """
     if not isinstance(expr, (str, int, float, EvalTree)):
         raise InputTypeError("This function can only take a rollable string, a number, or a "
                              "compiled evaluation tree.")
-    tree = EvalTree(expr)
-    if mode:
-        if mode == Mode.AVERAGE:
-            tree.averageify()
-        if mode == Mode.CRIT:
-            tree.critify()
-        if mode == Mode.MAX:
-            tree.maxify()
+    # A tree of our own, so the modifiers don't change one that is shared,
+    # and rolled without touching the nodes
+    tree = EvalTree(_parse(expr))
     if modifiers != 0:
         _add_modifiers(tree, modifiers)
-    tree.evaluate()
-    return tree.verbose_result()
+    return tree.roll(rng, _MODES.get(mode)).verbose_result()
 
 
-def compile(expr: typing.Union[str, int, float], modifiers=0) -> EvalTree:
+def compile(expr: typing.Union[str, int, float], modifiers=0,
+            engine: Engine = Engine.TREE, optimize=False,
+            parser: Parser = Parser.SHUNTING_YARD, modes: typing.Iterable[Mode] = ()) -> EvalTree:
     """Parse an expression into an evaluation tree to save time at later executions.
 
     You want to use this when the particular expression is going to be
@@ -84,19 +273,78 @@ def compile(expr: typing.Union[str, int, float], modifiers=0) -> EvalTree:
     :param expr: The rollable string.
     :param modifiers: A number that can be added on to the expression at
         the very end.
+    :param engine: How ``basic`` should roll the compiled expression.
+        Use ``Engine.CLOSURE`` for expressions that will be rolled very
+        many times. For a given seed, it counts successes differently
+        from the other engines; see ``Engine``.
+    :param optimize: Fold all the parts of the expression that don't
+        involve dice into constants ahead of time. The tree that is
+        returned still holds the expression as it was written so that
+        verbose rolls show it in full; only ``basic`` uses the
+        optimized form.
+    :param parser: How to parse the string. ``Parser.PRATT`` is faster
+        and gives the same tree.
+    :param modes: Modes that ``basic`` should be ready to roll the tree
+        in straight away. Any other mode is prepared the first time the
+        tree is rolled in it, and kept with the tree from then on.
     :return: An evaluation tree that can be passed to one of the roll
         functions or be manipulated on its own.
+    :raises ArgumentValueError: If the expression rerolls a die until
+        clear on a condition that every side of it meets.
+    :raises ArgumentTypeError: In trusted mode, if an operand is certain
+        to be of the wrong type. See ``set_trusted``.
     """
     if not isinstance(expr, (str, int, float)):
         raise InputTypeError("You can only compile a string or a number into an EvalTree.")
-    tree = EvalTree(expr)
+    if parser == Parser.PRATT and isinstance(expr, str):
+        tree = _pratt(expr)
+    else:
+        tree = EvalTree(expr)
     if modifiers != 0:
         _add_modifiers(tree, modifiers)
+    check_rerolls(tree)
+    trusted = _helpers.is_trusted()
+    if trusted:
+        check_types(tree)
+    _equip(tree, engine, optimize, trusted)
+    for mode in modes:
+        if mode in _MODES:
+            _variant(tree, mode, engine)
     return tree
 
 
+def _evaluator(tree: EvalTree, engine: Engine, optimize: bool,
+               trusted: bool) -> typing.Optional[typing.Callable[..., Final]]:
+    """Make the evaluator that ``basic`` rolls a compiled tree with.
+
+    This is the recipe kept with the tree, so it gives the same kind of
+    evaluator again when the tree is unpickled, whatever mode the
+    process unpickling it is in.
+    """
+    executed = fold_constants(tree) if optimize else tree
+    if engine == Engine.CLOSURE:
+        with _helpers.trusting(trusted):
+            return lower_tree(executed)
+    if engine == Engine.BYTECODE:
+        program = Program.from_tree(executed)
+        return _helpers.unchecked(program.evaluate) if trusted else program
+    if optimize:
+        # Rolled without filling in the nodes, as the folded tree is
+        # shared by every roll
+        roll = _helpers.unchecked(executed.roll) if trusted else executed.roll
+        return lambda rng=None: roll(rng).final
+    return None
+
+
+def _equip(tree: EvalTree, engine: Engine, optimize: bool, trusted: bool) -> None:
+    """Give a tree its evaluator, along with the recipe to make it again."""
+    options = engine, optimize, trusted
+    tree.evaluator = _evaluator(tree, *options)
+    tree.recipe = None if tree.evaluator is None else (_evaluator, options)
+
+
 def basic(expr: typing.Union[str, int, float, EvalTree], mode: Mode = Mode.NORMAL,
-          modifiers=0) -> typing.Union[int, float]:
+          modifiers=0, rng=None) -> typing.Union[int, float]:
     """Roll an expression and return just the end result.
 
     :param expr: The rollable string or precompiled expression tree.
@@ -104,6 +352,12 @@ def basic(expr: typing.Union[str, int, float, EvalTree], mode: Mode = Mode.NORMA
         maximum value.
     :param modifiers: A number that can be added on to the expression at
         the very end.
+    :param rng: The random number generator to roll with. This can be a
+        ``random.Random``, a NumPy generator, a seed, or anything else
+        with ``randint`` and ``choice`` methods. The global generator in
+        the ``random`` module is used by default. Strings are rolled
+        like trees compiled with ``Engine.CLOSURE``, so for a given seed
+        a count of successes may not match the one ``verbose`` gives.
     :return: The final number that is calculated.
     """
     if isinstance(expr, (int, float)):
@@ -111,15 +365,119 @@ def basic(expr: typing.Union[str, int, float, EvalTree], mode: Mode = Mode.NORMA
     if not isinstance(expr, (str, EvalTree)):
         raise InputTypeError("This function can only take a rollable string, a number, or a "
                              "compiled evaluation tree.")
+    tree = _parse(expr)
+    if mode in _MODES:
+        # Strings are rolled with the closure engine, like they are normally
+        engine = Engine.CLOSURE if isinstance(expr, str) else Engine.TREE
+        return _variant(tree, mode, engine)(as_rng(rng)) + modifiers
+    if tree.evaluator is None and isinstance(expr, str):
+        # Kept with the cached tree, so this is only done once
+        _equip(tree, Engine.CLOSURE, False, _helpers.is_trusted())
+    if tree.evaluator is not None:
+        return tree.evaluator(as_rng(rng)) + modifiers
+    roll = _helpers.unchecked(tree.roll) if _helpers.is_trusted() else tree.roll
+    return roll(rng).final + modifiers
+
+
+def basic_many(expr: typing.Union[str, int, float, EvalTree], number: int,
+               mode: Mode = Mode.NORMAL, modifiers=0, rng=None):
+    """Roll an expression many times in one go and return all the results.
+
+    Rather than rolling the expression over and over, this rolls every
+    trial at once using NumPy arrays, which is dramatically faster for
+    large numbers of rolls. NumPy must be installed for this to work.
+
+    :param expr: The rollable string or precompiled expression tree.
+    :param number: How many times to roll the expression.
+    :param mode: Roll this as an average, a critical hit, or to find the
+        maximum value.
+    :param modifiers: A number that can be added on to the expression at
+        the very end.
+    :param rng: A NumPy random ``Generator`` or a seed for one.
+    :return: A NumPy array holding the result of each roll.
+    :raises ArgumentValueError: If the expression rerolls a die until
+        clear on a condition that every side of it meets.
+    """
+    if not isinstance(expr, (str, int, float, EvalTree)):
+        raise InputTypeError("This function can only take a rollable string, a number, or a "
+                             "compiled evaluation tree.")
+    tree = EvalTree(expr)
+    check_rerolls(tree)
+    if mode in _MODES:
+        # Don't let the mode leak into a tree passed in by the caller
+        tree = tree.rewritten(_MODES[mode])
+    return evaluate_batch(tree, number, rng) + modifiers
+
+
+def distribution(expr: typing.Union[str, int, float, EvalTree], mode: Mode = Mode.NORMAL,
+                 modifiers=0) -> Distribution:
+    """Find the exact probability of every possible result of an expression.
+
+    Nothing is rolled: the probabilities are worked out directly from
+    the expression, as exact fractions. This answers questions like the
+    chance that 4d6h3 comes out to 15 or more immediately and without
+    any sampling error.
+
+    :param expr: The rollable string or precompiled expression tree.
+    :param mode: Roll this as an average, a critical hit, or to find the
+        maximum value.
+    :param modifiers: A number that can be added on to the expression at
+        the very end.
+    :return: A mapping from each possible result to its probability.
+    :raises EvaluationError: If the expression can't be rolled, or uses
+        a combination of operators whose distribution can't be found
+        exactly.
+    """
+    if not isinstance(expr, (str, int, float, EvalTree)):
+        raise InputTypeError("This function can only take a rollable string, a number, or a "
+                             "compiled evaluation tree.")
     tree = EvalTree(expr)
-    if mode:
-        if mode == Mode.AVERAGE:
-            tree.averageify()
-        if mode == Mode.CRIT:
-            tree.critify()
-        if mode == Mode.MAX:
-            tree.maxify()
-    return tree.evaluate() + modifiers
+    if mode in _MODES:
+        # Don't let the mode leak into a tree passed in by the caller
+        tree = tree.rewritten(_MODES[mode])
+    result = _distribution(tree)
+    if modifiers != 0:
+        result = Distribution((value + modifiers, p) for value, p in result.items())
+    return result
+
+
+def simulate(expr: typing.Union[str, int, float, EvalTree], trials: int, workers: int = None,
+             seed: int = None, mode: Mode = Mode.NORMAL, modifiers=0) -> Histogram:
+    """Roll an expression a great many times, spread over several processes.
+
+    The trials are rolled in fixed-size shards, each seeded from the
+    master ``seed``, so a given seed always produces the same results
+    however many workers are used.
+
+    :param expr: The rollable string or precompiled expression tree.
+        Trees are pickled to send them to the workers.
+    :param trials: How many times to roll the expression.
+    :param workers: How many processes to roll in. Defaults to the
+        number of processors on the machine.
+    :param seed: Makes the results reproducible. If not given, every
+        run is different.
+    :param mode: Roll this as an average, a critical hit, or to find the
+        maximum value.
+    :param modifiers: A number that can be added on to the expression at
+        the very end.
+    :return: A ``Counter`` of how many times each result came up.
+    :raises ArgumentValueError: If the number of trials is negative, or
+        the expression rerolls a die until clear on a condition that
+        every side of it meets.
+    """
+    if not isinstance(expr, (str, int, float, EvalTree)):
+        raise InputTypeError("You can only simulate a rollable string, a number, or a tree.")
+    if not isinstance(trials, int):
+        raise InputTypeError("The number of trials must be an integer.")
+    if trials < 0:
+        raise ArgumentValueError("The number of trials can't be negative.")
+    # Parse and check once here so that errors show up before any worker starts
+    check_rerolls(EvalTree(expr))
+    histogram = _simulate(expr, trials, workers, seed, _MODES.get(mode))
+    if modifiers != 0:
+        histogram = collections.Counter({value + modifiers: count
+                                         for value, count in histogram.items()})
+    return histogram
 
 
 def tokenize(expr: typing.Union[str, int, float], modifiers=0) -> typing.List[Token]:
@@ -130,6 +488,8 @@ def tokenize(expr: typing.Union[str, int, float], modifiers=0) -> typing.List[To
         semantics are like (expr)+modifiers.
     :return: The list of tokens.
     """
+    if isinstance(expr, str) and modifiers == 0:
+        return tokens(expr)
     return list(tokenize_lazy(expr, modifiers))
 
 
@@ -0,0 +1,206 @@
+"""Flatten expression trees into postfix instructions for a stack machine.
+
+A ``Program`` is the postfix (reverse Polish) form of an ``EvalTree``.
+It is made of two parts: a pool of constants, which are the values
+held in the leaves of the tree, and an array of instructions. Each
+instruction is a single integer. A negative instruction ``i`` pushes
+the constant in slot ``~i`` onto the stack, while a non-negative one
+pops two operands and applies the operator with that index in
+``OPCODES``. Operators that only take one operand are given an empty
+``None`` constant in place of the other, exactly like the tree walker
+passes ``None`` for a missing child.
+
+Running a program is a simple loop over the instructions, so it never
+recurses no matter how deep the original tree was, and the whole thing
+is made of plain integers, numbers, and tuples so it can be stored and
+loaded without reparsing anything.
+"""
+import array
+import typing
+
+from .evaltree import EvalTree, EvalTreeNode, Final, Result
+from .exceptions import EvaluationError, InputTypeError
+from .helpers import wrap_exceptions_with
+from .operators import OPERATORS, Operator, Roll
+
+#: The operator codes that instructions refer to by index. These are
+#: sorted so that the numbering is stable from run to run.
+OPCODES = tuple(sorted(OPERATORS))  # type: typing.Tuple[str, ...]
+_OPCODE_INDEX = {code: i for i, code in enumerate(OPCODES)}
+
+
+def resolve_opcodes() -> typing.Tuple[Operator, ...]:
+    """Look up the operator for each of ``OPCODES`` as they are now."""
+    return tuple(OPERATORS[op] for op in OPCODES)
+
+
+class Program:
+    """An expression compiled to postfix instructions."""
+    __slots__ = 'code', 'constants', 'operators'
+
+    def __init__(self, code: typing.Iterable[int], constants: typing.Sequence,
+                 operators: typing.Tuple[Operator, ...] = None):
+        """Create a program from its raw instructions and constants.
+
+        :param code: The instructions, as described for this module.
+        :param constants: The values that the push instructions refer
+            to.
+        :param operators: The operators for each of ``OPCODES``, if they
+            have already been looked up, to share between many programs.
+        """
+        self.code = array.array('l', code)
+        self.constants = tuple(constants)
+        # Resolve the operators once rather than on every run
+        if operators is None:
+            operators = resolve_opcodes()
+        self.operators = operators  # type: typing.Tuple[Operator, ...]
+
+    @classmethod
+    def from_tree(cls, tree: EvalTree) -> 'Program':
+        """Lower an expression tree into a program.
+
+        :param tree: The tree to lower. Only operators in ``OPERATORS``
+            can be represented.
+        :raises InputTypeError: If the tree holds an operator that isn't
+            registered in ``OPERATORS``.
+        """
+        code = []  # type: typing.List[int]
+        constants = []
+        slots = {}  # type: typing.Dict[typing.Tuple[type, typing.Any], int]
+
+        def push(value):
+            # Distinguish by type as well, otherwise 1, 1.0, and True
+            # would all share a slot
+            key = (type(value), value)
+            if key not in slots:
+                slots[key] = len(constants)
+                constants.append(value)
+            code.append(~slots[key])
+
+        if tree.root is None:
+            return cls(code, constants)
+        # An iterative post-order traversal, so that trees of any depth
+        # can be lowered
+        stack = [(tree.root, False)]  # type: typing.List[typing.Tuple[EvalTreeNode, bool]]
+        while stack:
+            node, expanded = stack.pop()
+            if node is None:
+                push(None)
+            elif node.is_leaf():
+                push(node.payload)
+            elif expanded:
+                if not (isinstance(node.payload, Operator) and node.payload.code in _OPCODE_INDEX):
+                    fmt = "Can't compile the unregistered operator {} to bytecode."
+                    raise InputTypeError(fmt.format(node.payload))
+                code.append(_OPCODE_INDEX[node.payload.code])
+            else:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+        return cls(code, constants)
+
+    def __len__(self):
+        return len(self.code)
+
+    def __eq__(self, other):
+        if isinstance(other, Program):
+            return self.code == other.code and self.constants == other.constants
+        return NotImplemented
+
+    def __repr__(self):
+        return 'Program({}, {})'.format(self.code.tolist(), self.constants)
+
+    def __reduce__(self):
+        # The operators are looked up again on the other side
+        return Program, (self.code.tolist(), self.constants)
+
+    def __call__(self, rng=None) -> Final:
+        return self.evaluate(rng)
+
+    @wrap_exceptions_with(EvaluationError, 'Failed to evaluate expression.')
+    def evaluate(self, rng=None) -> Final:
+        """Run the program and return the single final value.
+
+        This gives exactly the result that ``EvalTree.evaluate`` would
+        on the tree the program was made from.
+
+        :param rng: The random number generator to roll dice with. The
+            global one is used by default.
+        """
+        if not self.code:
+            # An empty tree evaluates to nothing
+            return 0
+        final = self.__run(None, rng)
+        if isinstance(final, Roll):
+            return final.total()
+        try:
+            return sum(final)
+        except TypeError:
+            return final
+
+    @wrap_exceptions_with(EvaluationError, 'Failed to evaluate expression.')
+    def trace(self, rng=None) -> typing.List[Result]:
+        """Run the program, recording the value produced by every instruction.
+
+        As the instructions are in post-order, the values line up with a
+        post-order traversal of the original tree, including a ``None``
+        for each missing operand of a unary operator.
+
+        :param rng: The random number generator to roll dice with.
+        """
+        values = []  # type: typing.List[Result]
+        if self.code:
+            self.__run(values, rng)
+        return values
+
+    def to_tree(self, values: typing.Sequence[Result] = None) -> EvalTree:
+        """Rebuild the expression tree that this program was made from.
+
+        :param values: A trace of this program. If given, each node of
+            the new tree has its ``value`` filled in from it, ready for
+            ``EvalTree.verbose_result``.
+        """
+        tree = EvalTree(None)
+        nodes = []  # type: typing.List[typing.Optional[EvalTreeNode]]
+        for i, instruction in enumerate(self.code):
+            if instruction < 0:
+                value = self.constants[~instruction]
+                node = None if value is None else EvalTreeNode(value)
+            else:
+                right = nodes.pop()
+                left = nodes.pop()
+                node = EvalTreeNode(self.operators[instruction], left, right)
+            if node is not None and values is not None:
+                node.value = values[i]
+            nodes.append(node)
+        if nodes:
+            tree.root = nodes.pop()
+        return tree
+
+    def annotated(self, rng=None) -> EvalTree:
+        """Roll this program and return a tree annotated with the values rolled.
+
+        This is the bytecode equivalent of calling ``EvalTree.evaluate``
+        for the side effect of filling in the nodes, so that verbose
+        output can be produced.
+
+        :param rng: The random number generator to roll dice with.
+        """
+        return self.to_tree(self.trace(rng))
+
+    def __run(self, record: typing.Optional[typing.List[Result]], rng) -> Result:
+        """The actual stack machine."""
+        constants = self.constants
+        operators = self.operators
+        stack = []  # type: typing.List[Result]
+        push = stack.append
+        pop = stack.pop
+        for instruction in self.code:
+            if instruction < 0:
+                push(constants[~instruction])
+            else:
+                right = pop()
+                push(operators[instruction].apply(pop(), right, rng))
+            if record is not None:
+                record.append(stack[-1])
+        return stack[-1]
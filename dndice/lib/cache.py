@@ -0,0 +1,102 @@
+"""Remember the results of expensive work, like parsing expressions.
+
+``LRUCache`` is a bounded, thread-safe mapping that forgets whatever
+was used least recently once it is full. It keeps count of how well it
+is doing: how often a lookup found what it wanted (a hit), how often
+it had to build it (a miss), and how many entries were pushed out to
+make room (evictions).
+"""
+import collections
+import threading
+import typing
+
+#: A summary of the state of a cache.
+CacheInfo = collections.namedtuple('CacheInfo', 'hits misses evictions size maxsize')
+
+K = typing.Hashable
+V = typing.Any
+
+
+class LRUCache:
+    """A mapping of limited size that evicts the least recently used entries."""
+    __slots__ = 'maxsize', 'hits', 'misses', 'evictions', '_entries', '_lock'
+
+    def __init__(self, maxsize: int = 1024):
+        """Create an empty cache.
+
+        :param maxsize: The most entries to hold at once. Zero disables
+            the cache entirely.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()  # type: typing.MutableMapping[K, V]
+        self._lock = threading.Lock()
+
+    def get(self, key: K, build: typing.Callable[[], V]) -> V:
+        """Look up an entry, building and storing it if it isn't there.
+
+        :param key: What to look up.
+        :param build: Creates the entry if it isn't cached. If this
+            raises, nothing is stored.
+        :return: The cached or newly built entry.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # Build outside of the lock, so one slow build doesn't hold up
+        # every other lookup
+        value = build()
+        with self._lock:
+            if self.maxsize > 0:
+                self._entries[key] = value
+                self.__trim()
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        """Store an entry as the most recently used, without counting a hit or miss."""
+        with self._lock:
+            if self.maxsize > 0:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                self.__trim()
+
+    def items(self) -> typing.List[typing.Tuple[K, V]]:
+        """List the entries from the least to the most recently used."""
+        with self._lock:
+            return list(self._entries.items())
+
+    def resize(self, maxsize: int) -> None:
+        """Change the most entries the cache can hold, evicting any extras."""
+        if maxsize < 0:
+            raise ValueError('The size of a cache cannot be negative.')
+        with self._lock:
+            self.maxsize = maxsize
+            self.__trim()
+
+    def clear(self) -> None:
+        """Forget every entry and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        """Report how the cache is doing."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             len(self._entries), self.maxsize)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __trim(self) -> None:
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
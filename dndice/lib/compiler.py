@@ -0,0 +1,350 @@
+"""Lower an expression tree into a chain of plain Python closures.
+
+Walking an ``EvalTree`` costs a method call, an ``is_leaf`` check, and
+a trip through ``Operator.__call__`` for every node on every roll, plus
+a write to each node's ``value``. For an expression that is going to be
+rolled over and over, it pays to do all of that inspection once.
+``lower`` visits the tree a single time and produces a function that,
+when called, performs the same operations in the same order as
+``EvalTree.evaluate`` without ever looking at the tree again.
+
+The lowered function does not annotate the nodes with their values, so
+it can't be used to produce verbose output. It takes the random number
+generator to roll with as its argument, which every closure passes down
+to its operands.
+
+Since nothing can look at the individual dice, a set of dice whose only
+use is to be added up, like the ``100d6`` in ``100d6+20``, is rolled
+straight into a running total. The random number generator is called
+exactly as ``roll_basic`` would call it, so the result is the same, but
+no list or ``Roll`` is ever built, except for the huge sets that
+``roll_basic`` would roll as counts anyway.
+
+Likewise, counting the successes in a set of dice, like ``15d6t5``,
+takes a single draw of how many succeeded from the binomial
+distribution rather than rolling every die. This gives the same chance
+of every count, but it uses the random number generator differently,
+so for a given seed the count isn't the one ``EvalTree.evaluate`` would
+give.
+
+Long chains of additions or multiplications, like the trees built by
+adding up every die in a volley of attacks, are applied in a single
+loop rather than through one closure per operator.
+
+In trusted mode, the closures call the functions behind the operators
+without the checks that ``check_simple_types`` puts around them, and
+errors come out as they are rather than wrapped in an
+``EvaluationError``.
+"""
+import typing
+
+from . import operators
+from .bytecode import Program
+from .evaltree import EvalTree, EvalTreeNode, Final, Result
+from .exceptions import EvaluationError
+from .helpers import is_trusted, unchecked, wrap_exceptions_with
+from .operators import (OPERATORS, Roll, Side, counts_pay_off, roll_basic, roll_counts,
+                        threshold_lower, threshold_upper)
+from .sampling import binomial
+
+Thunk = typing.Callable[[typing.Any], Result]
+
+
+def lower(root: typing.Optional[EvalTreeNode]) -> typing.Callable[..., Final]:
+    """Turn the tree under ``root`` into a function that rolls it.
+
+    :param root: The root node of the tree to lower.
+    :return: A function that evaluates the expression, giving exactly
+        the result that ``EvalTree.evaluate`` would, apart from counts of
+        successes. It optionally takes the random number generator to
+        roll with.
+    """
+    if root is None:
+        # An empty tree evaluates to nothing
+        return lambda rng=None: 0
+    total = _sum_only(root)
+    compute = total or _lower_node(root)
+    if total is not None or _is_scalar(root):
+        def final(rng=None):
+            return compute(rng)
+    else:
+        def final(rng=None):
+            value = compute(rng)
+            if isinstance(value, Roll):
+                return value.total()
+            try:
+                return sum(value)
+            except TypeError:
+                return value
+    if is_trusted():
+        return final
+    return wrap_exceptions_with(EvaluationError, 'Failed to evaluate expression.')(final)
+
+
+def lower_tree(tree: EvalTree) -> typing.Callable[..., Final]:
+    """Lower a whole tree, or make a program of it if it is too deep.
+
+    Lowering recurses down the tree, so a tree as deep as a long chain
+    of subtractions is rolled by the bytecode engine instead, which
+    never recurses.
+
+    :param tree: The tree to lower.
+    :return: A function that rolls the tree, just like one from
+        ``lower``.
+    """
+    try:
+        return lower(tree.root)
+    except RecursionError:
+        program = Program.from_tree(tree)
+        return unchecked(program.evaluate) if is_trusted() else program
+
+
+def _is_scalar(node: EvalTreeNode) -> bool:
+    """Check whether a node is certain to produce a single number.
+
+    Leaves holding numbers obviously do. Of the operators, only the
+    builtin ones that collapse all of their operands are known to give
+    a number back; anything else may produce a ``Roll``.
+    """
+    if node.is_leaf():
+        return isinstance(node.payload, (int, float))
+    operator = node.payload
+    builtin = OPERATORS.get(operator.code)
+    return (builtin is not None
+            and builtin.function is operator.function
+            and operator.cajole & operator.arity == operator.arity)
+
+
+def _collapse(value: Result) -> Result:
+    if isinstance(value, Roll):
+        return value.total()
+    if isinstance(value, tuple):
+        return sum(value)
+    return value
+
+
+def _lower_node(node: EvalTreeNode) -> Thunk:
+    """Recursively build the closure that computes this subtree."""
+    if node.is_leaf():
+        value = node.payload
+        return lambda rng: value
+    operator = node.payload
+    function = unchecked(operator.function) if is_trusted() else operator.function
+    stochastic = operator.stochastic
+    if operator.arity == Side.BOTH and node.left and node.right:
+        chain = _chain(node)
+        if chain is not None:
+            return chain
+        return _binary(function, stochastic,
+                       _operand(node.left, operator.cajole & Side.LEFT),
+                       _operand(node.right, operator.cajole & Side.RIGHT))
+    if operator.arity == Side.LEFT and node.left and not node.right:
+        return _unary(function, stochastic, _operand(node.left, operator.cajole & Side.LEFT))
+    if operator.arity == Side.RIGHT and node.right and not node.left:
+        return _unary(function, stochastic, _operand(node.right, operator.cajole & Side.RIGHT))
+    # The node doesn't have the shape its operator expects, so just do
+    # whatever the tree walker would do with it
+    left = node.left and _lower_node(node.left)
+    right = node.right and _lower_node(node.right)
+    return lambda rng: operator(left and left(rng), right and right(rng), rng)
+
+
+# Operands are either a constant (for leaves) or a thunk that computes
+# the value, tagged so that the parent can be specialized on them
+Operand = typing.Tuple[bool, typing.Any]
+
+
+def _operand(node: EvalTreeNode, cajole: int) -> Operand:
+    """Prepare one operand of an operator.
+
+    Constant leaves are collapsed ahead of time if need be, while other
+    nodes only get wrapped in a collapsing step when they could actually
+    produce a ``Roll``.
+    """
+    if node.is_leaf():
+        value = node.payload
+        return True, _collapse(value) if cajole else value
+    if cajole:
+        total = _sum_only(node)
+        if total is not None:
+            return False, total
+    compute = _lower_node(node)
+    if not cajole or _is_scalar(node):
+        return False, compute
+
+    def collapsed(rng):
+        return _collapse(compute(rng))
+
+    return False, collapsed
+
+
+def _is_chained(node: EvalTreeNode, code: str) -> bool:
+    """Check whether a node applies the builtin operator with this code to two operands."""
+    if node.is_leaf() or node.left is None or node.right is None:
+        return False
+    operator = node.payload
+    builtin = OPERATORS[code]
+    return (operator.code == code
+            and operator.function is builtin.function
+            and operator.arity == builtin.arity
+            and operator.cajole == builtin.cajole)
+
+
+def _chain(node: EvalTreeNode) -> typing.Optional[Thunk]:
+    """Add or multiply a whole chain of operands in one loop.
+
+    As ``a+b+c`` is the same as ``(a+b)+c``, a long sum leans all the
+    way to the left, with one ``+`` node per term. The operands down its
+    left edge are gathered up and added in a single loop, in exactly the
+    order and grouping that the tree gives them, so even sums of floats
+    come out the same. Products are treated the same way.
+
+    :return: The thunk computing the chain, or None if the node doesn't
+        start a chain of at least three operands.
+    """
+    code = node.payload.code
+    if (code not in ('+', '*') or not _is_chained(node, code)
+            or not _is_chained(node.left, code)):
+        return None
+    cajole = node.payload.cajole
+    terms = []
+    while _is_chained(node, code):
+        terms.append(_thunk(_operand(node.right, cajole & Side.RIGHT)))
+        node = node.left
+    first = _thunk(_operand(node, cajole & Side.LEFT))
+    terms.reverse()
+    if code == '+':
+        def chain(rng):
+            result = first(rng)
+            for term in terms:
+                result = result + term(rng)
+            return result
+    else:
+        def chain(rng):
+            result = first(rng)
+            for term in terms:
+                result = result * term(rng)
+            return result
+    return chain
+
+
+def _is_plain_dice(node: EvalTreeNode) -> bool:
+    """Check whether a node rolls a number of ordinary dice with the builtin roller."""
+    if node.is_leaf() or node.left is None or node.right is None:
+        return False
+    operator = node.payload
+    sides = node.right.payload
+    return (operator.function is roll_basic
+            and operator.arity == Side.BOTH
+            and node.right.is_leaf()
+            and isinstance(sides, int) and not isinstance(sides, bool))
+
+
+def _sum_only(node: EvalTreeNode) -> typing.Optional[Thunk]:
+    """Roll a node straight into its total, if it is a set of dice or counts successes in one.
+
+    This is only correct where the ``Roll`` would be summed right away,
+    so it is up to the caller to use it only in those places.
+
+    :return: A thunk computing the total, or None if the node isn't one
+        of those.
+    """
+    if _is_plain_dice(node):
+        return _dice_total(node)
+    if _is_success_count(node):
+        return _success_count(node)
+    return None
+
+
+def _dice_total(node: EvalTreeNode) -> Thunk:
+    operator = node.payload
+    count = _thunk(_operand(node.left, operator.cajole & Side.LEFT))
+    sides = node.right.payload
+
+    def total(rng):
+        number = count(rng)
+        if counts_pay_off(number, sides):
+            return roll_counts(number, sides, rng).total()
+        if hasattr(rng, 'randints'):
+            return sum(rng.randints(sides, number))
+        # Looked up on every roll, exactly like single_die does, so that
+        # replacing the global generator still takes effect
+        randint = (operators.random if rng is None else rng).randint
+        result = 0
+        for _ in range(number):
+            result += randint(1, sides)
+        return result
+
+    return total
+
+
+def _is_success_count(node: EvalTreeNode) -> bool:
+    """Check whether a node counts the plain dice meeting a constant threshold."""
+    if node.is_leaf() or node.left is None or node.right is None:
+        return False
+    operator = node.payload
+    threshold = node.right.payload
+    return (operator.function in (threshold_lower, threshold_upper)
+            and operator.arity == Side.BOTH
+            and node.right.is_leaf()
+            and isinstance(threshold, int) and not isinstance(threshold, bool)
+            and _is_plain_dice(node.left)
+            # Dice without sides have to fail just as rolling them would
+            and node.left.right.payload >= 1)
+
+
+def _success_count(node: EvalTreeNode) -> Thunk:
+    dice = node.left
+    count = _thunk(_operand(dice.left, dice.payload.cajole & Side.LEFT))
+    sides = dice.right.payload
+    threshold = node.right.payload
+    if node.payload.function is threshold_lower:
+        successes = sides - max(threshold, 1) + 1
+    else:
+        successes = threshold
+    chance = min(max(successes, 0), sides) / sides
+
+    def total(rng):
+        number = count(rng)
+        if not isinstance(number, int):
+            # Just as rolling that many dice would fail
+            raise TypeError('Can only roll a whole number of dice, not {}'.format(number))
+        return binomial(number, chance, operators.random if rng is None else rng)
+
+    return total
+
+
+def _thunk(operand: Operand) -> Thunk:
+    constant, value = operand
+    if constant:
+        return lambda rng: value
+    return value
+
+
+def _unary(function: typing.Callable, stochastic: bool, operand: Operand) -> Thunk:
+    if stochastic:
+        compute = _thunk(operand)
+        return lambda rng: function(compute(rng), rng=rng)
+    constant, value = operand
+    if constant:
+        return lambda rng: function(value)
+    return lambda rng: function(value(rng))
+
+
+def _binary(function: typing.Callable, stochastic: bool, left: Operand,
+            right: Operand) -> Thunk:
+    if stochastic:
+        # Rolling dice costs far more than the extra calls to fetch
+        # constant operands, so don't bother specializing these
+        computeLeft = _thunk(left)
+        computeRight = _thunk(right)
+        return lambda rng: function(computeLeft(rng), computeRight(rng), rng=rng)
+    leftConstant, leftValue = left
+    rightConstant, rightValue = right
+    if leftConstant and rightConstant:
+        return lambda rng: function(leftValue, rightValue)
+    if leftConstant:
+        return lambda rng: function(leftValue, rightValue(rng))
+    if rightConstant:
+        return lambda rng: function(leftValue(rng), rightValue)
+    return lambda rng: function(leftValue(rng), rightValue(rng))
@@ -0,0 +1,404 @@
+"""Compute the exact probability distribution of a roll expression.
+
+Instead of rolling dice, this walks the expression tree and works out
+the probability of every possible result. Probabilities are kept as
+``Fraction`` objects so there is no rounding anywhere along the way.
+
+Numbers flow through the tree as probability mass functions: mappings
+from each possible value to its probability. Combining two of them
+with an arithmetic operator is a discrete convolution, pairing every
+value on the left with every value on the right.
+
+Sets of dice need more care, as operators like ``h`` and ``r`` care
+about the individual dice rather than just their sum. A set of dice is
+tracked as a ``_Pool``: the number of dice, the distribution of a single
+one of them, and which ranks (in sorted order) survive any ``h`` and
+``l`` operations. The operators that act on each die separately (``r``,
+``R``, ``f``, ``c``, ``t``, and ``T``) simply transform the distribution
+of a single die, using the closed forms for rerolling. The sum of the
+surviving dice is found at the end with order statistics, sweeping
+through the faces of the die while tracking how many dice have been
+placed so far and what the surviving ones add up to.
+
+When the number of dice or the sides of the die are themselves rolled,
+the pool becomes a weighted mixture of the possibilities.
+"""
+import typing
+from fractions import Fraction
+
+from .evaltree import EvalTree, EvalTreeNode
+from .exceptions import ArgumentTypeError, ArgumentValueError, EvaluationError
+from .helpers import wrap_exceptions_with
+from .operators import Number
+
+PMF = typing.Dict[Number, Fraction]
+Transform = typing.Callable[[PMF], PMF]
+
+
+class Distribution(dict):
+    """The probability of each possible result of an expression.
+
+    This is a dictionary mapping each result to its probability, with a
+    few conveniences for asking questions about it.
+    """
+
+    def mean(self) -> Number:
+        """The expected value of the expression."""
+        return sum(value * p for value, p in self.items())
+
+    def variance(self) -> Number:
+        """The variance of the expression."""
+        mean = self.mean()
+        return sum((value - mean) ** 2 * p for value, p in self.items())
+
+    def at_least(self, value: Number) -> Fraction:
+        """The probability that the result is at least ``value``."""
+        return sum((p for result, p in self.items() if result >= value), Fraction(0))
+
+    def at_most(self, value: Number) -> Fraction:
+        """The probability that the result is at most ``value``."""
+        return sum((p for result, p in self.items() if result <= value), Fraction(0))
+
+
+class _Pool:
+    """A set of identical, independent dice, some of which may be discarded."""
+    __slots__ = 'count', 'die', 'base', 'keep', 'after'
+
+    def __init__(self, count: int, die: PMF, base: PMF):
+        """Start a pool where every die is kept.
+
+        :param count: The number of dice.
+        :param die: The distribution of the value of one die.
+        :param base: The distribution of a fresh roll of the die, which
+            is used when dice get rerolled.
+        """
+        self.count = count
+        self.die = die
+        self.base = base
+        # The range of ranks, counting up from the lowest die, that are kept
+        self.keep = None  # type: typing.Optional[typing.Tuple[int, int]]
+        # Transformations applied to each die after some were discarded
+        self.after = []  # type: typing.List[Transform]
+
+    def derive(self) -> '_Pool':
+        new = _Pool(self.count, self.die, self.base)
+        new.keep = self.keep
+        new.after = self.after[:]
+        return new
+
+    def transform(self, transform: Transform) -> '_Pool':
+        """Apply a transformation to each die that is still kept."""
+        new = self.derive()
+        if self.keep is None:
+            new.die = transform(self.die)
+        else:
+            new.after.append(transform)
+        return new
+
+    def take(self, number: int, high: bool) -> '_Pool':
+        """Keep only the highest or lowest dice."""
+        if self.after:
+            raise ArgumentValueError("The exact distribution can't be found when dice are kept "
+                                     "after being modified following an earlier selection.")
+        low, top = self.keep or (0, self.count)
+        number = max(number, 0)
+        if top - low > number:
+            if high:
+                low = top - number
+            else:
+                top = low + number
+        new = self.derive()
+        new.keep = (low, top)
+        return new
+
+    def total(self) -> PMF:
+        """Find the distribution of the sum of the kept dice."""
+        if self.keep is None:
+            return _power(self.die, self.count)
+        low, top = self.keep
+        # Sweep through the faces from lowest to highest. The state is
+        # the number of dice that have been placed so far and the sum of
+        # the kept ones among them, holding the (unconditional)
+        # probability of getting there.
+        states = {(0, 0): Fraction(1)}  # type: typing.Dict[typing.Tuple[int, Number], Fraction]
+        for face, p in sorted(self.die.items()):
+            kernel = {face: Fraction(1)}
+            for transform in self.after:
+                kernel = transform(kernel)
+            powers = {}  # type: typing.Dict[int, PMF]
+            advanced = {}  # type: typing.Dict[typing.Tuple[int, Number], Fraction]
+            for (placed, subtotal), weight in states.items():
+                remaining = self.count - placed
+                ways = 1
+                for j in range(remaining + 1):
+                    # j of the remaining dice come up as this face
+                    if j:
+                        ways = ways * (remaining - j + 1) // j
+                    chance = weight * ways * p ** j
+                    kept = max(0, min(placed + j, top) - max(placed, low))
+                    if kept not in powers:
+                        powers[kept] = _power(kernel, kept)
+                    for value, q in powers[kept].items():
+                        key = (placed + j, subtotal + value)
+                        advanced[key] = advanced.get(key, 0) + chance * q
+            states = advanced
+        result = {}  # type: PMF
+        for (placed, subtotal), weight in states.items():
+            if placed == self.count and weight:
+                result[subtotal] = result.get(subtotal, 0) + weight
+        return result
+
+
+Pools = typing.List[typing.Tuple[Fraction, _Pool]]
+
+
+@wrap_exceptions_with(EvaluationError, 'Failed to compute the distribution of the expression.')
+def distribution(tree: EvalTree) -> Distribution:
+    """Compute the exact distribution of the result of rolling a tree.
+
+    :param tree: The expression to analyze.
+    :return: The probability of every possible result.
+    :raises EvaluationError: If the expression can't be evaluated, or
+        its distribution can't be found exactly.
+    """
+    if tree.root is None:
+        return Distribution({0: Fraction(1)})
+    final = _scalar(_walk(tree.root))
+    return Distribution(sorted((value, p) for value, p in final.items() if p))
+
+
+def _walk(root: EvalTreeNode):
+    """Find the distribution of every node, children before their parents."""
+    done = []
+    stack = [(root, False)]  # type: typing.List[typing.Tuple[EvalTreeNode, bool]]
+    while stack:
+        node, expanded = stack.pop()
+        if node is None:
+            done.append(None)
+        elif node.is_leaf():
+            payload = node.payload
+            done.append(payload if isinstance(payload, tuple) else {payload: Fraction(1)})
+        elif expanded:
+            right = done.pop()
+            left = done.pop()
+            code = getattr(node.payload, 'code', None)
+            if code in _POOL_OPERATIONS:
+                done.append(_POOL_OPERATIONS[code](left, right))
+            else:
+                done.append(_combine(node.payload, left, right))
+        else:
+            stack.append((node, True))
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+    return done.pop()
+
+
+def _scalar(value) -> PMF:
+    """Collapse a value to the distribution of a single number."""
+    if isinstance(value, tuple):
+        return {sum(value): Fraction(1)}
+    if isinstance(value, list):
+        result = {}  # type: PMF
+        for weight, pool in value:
+            for total, p in pool.total().items():
+                result[total] = result.get(total, 0) + weight * p
+        return result
+    return value
+
+
+def _pools(value) -> Pools:
+    if not isinstance(value, list):
+        raise ArgumentTypeError("Expecting a roll, got {} instead.".format(value))
+    return value
+
+
+def _convolve(left: PMF, right: PMF) -> PMF:
+    result = {}  # type: PMF
+    for a, p in left.items():
+        for b, q in right.items():
+            result[a + b] = result.get(a + b, 0) + p * q
+    return result
+
+
+def _power(pmf: PMF, times: int) -> PMF:
+    """The distribution of the sum of ``times`` independent copies."""
+    result = {0: Fraction(1)}  # type: PMF
+    while times > 0:
+        if times & 1:
+            result = _convolve(result, pmf)
+        times >>= 1
+        if times:
+            pmf = _convolve(pmf, pmf)
+    return result
+
+
+def _map(pmf: PMF, function: typing.Callable[[Number], Number]) -> PMF:
+    result = {}  # type: PMF
+    for value, p in pmf.items():
+        mapped = function(value)
+        result[mapped] = result.get(mapped, 0) + p
+    return result
+
+
+def _combine(operator, left, right) -> PMF:
+    """Apply an operator that works on single numbers to two independent operands."""
+    if left is None:
+        return _map(_scalar(right), lambda value: operator(None, value))
+    if right is None:
+        return _map(_scalar(left), lambda value: operator(value, None))
+    result = {}  # type: PMF
+    for a, p in _scalar(left).items():
+        for b, q in _scalar(right).items():
+            value = operator(a, b)
+            result[value] = result.get(value, 0) + p * q
+    return result
+
+
+def _die(sides) -> PMF:
+    """The distribution of a single roll of a die."""
+    if isinstance(sides, tuple) and sides:
+        return {side: Fraction(sides.count(side), len(sides)) for side in set(sides)}
+    if isinstance(sides, int) and sides >= 1:
+        return {face: Fraction(1, sides) for face in range(1, sides + 1)}
+    raise ArgumentTypeError("You can't roll a die with sides: {sides}".format(sides=sides))
+
+
+def _sides(value) -> typing.List[typing.Tuple[Fraction, typing.Any]]:
+    """List the possible sides of a die, with their probabilities."""
+    if isinstance(value, tuple):
+        return [(Fraction(1), value)]
+    # Yeah this can happen, see 2d(1d4)
+    return [(p, sides) for sides, p in _scalar(value).items()]
+
+
+def _rolls(face: typing.Callable[[typing.Any, PMF], PMF], factor: int = 1, rolled_sides=True):
+    """Make the operation for one of the dice rolling operators.
+
+    :param face: Given the sides and the distribution of a normal roll,
+        give the distribution of the value that each die actually takes.
+    :param factor: How many dice to roll for each one asked for.
+    :param rolled_sides: Whether the sides can be given by a roll, in
+        which case the die has as many sides as the roll added up to.
+    """
+    def operation(number, sides) -> Pools:
+        if isinstance(sides, list) and not rolled_sides:
+            raise ArgumentValueError("The exact distribution can't be found for fixed dice "
+                                     "whose sides are a roll.")
+        pools = []  # type: Pools
+        for count, p in _scalar(number).items():
+            if not isinstance(count, int):
+                raise ArgumentTypeError("Expecting the number of dice to be an integer.")
+            for q, option in _sides(sides):
+                base = _die(option)
+                pools.append((p * q, _Pool(max(count, 0) * factor, face(option, base), base)))
+        return pools
+
+    return operation
+
+
+def _average_face(sides) -> PMF:
+    if isinstance(sides, tuple):
+        return {sum(sides) / len(sides): Fraction(1)}
+    return {(sides + 1) / 2: Fraction(1)}
+
+
+def _max_face(sides) -> PMF:
+    return {max(sides) if isinstance(sides, tuple) else sides: Fraction(1)}
+
+
+def _modify(make: typing.Callable[[_Pool, Number], Transform], integer=False):
+    """Make the operation for an operator that transforms each die in a pool.
+
+    :param make: Creates the transformation for one pool given the
+        value of the right operand.
+    :param integer: Whether the right operand has to be an integer.
+    """
+    def operation(pools, target) -> Pools:
+        result = []  # type: Pools
+        for value, q in _scalar(target).items():
+            if integer and not isinstance(value, int):
+                raise ArgumentTypeError("Expecting an integer, got {} instead.".format(value))
+            for p, pool in _pools(pools):
+                result.append((p * q, pool.transform(make(pool, value))))
+        return result
+
+    return operation
+
+
+def _take(high: bool):
+    def operation(pools, number) -> Pools:
+        result = []  # type: Pools
+        for value, q in _scalar(number).items():
+            if not isinstance(value, int):
+                raise ArgumentTypeError("Expecting number to be an integer, got {} "
+                                        "instead.".format(value))
+            for p, pool in _pools(pools):
+                result.append((p * q, pool.take(value, high)))
+        return result
+
+    return operation
+
+
+def _mapping(function: typing.Callable[[Number, Number], Number]):
+    return lambda pool, target: lambda pmf: _map(pmf, lambda value: function(value, target))
+
+
+def _reroll(comparison: typing.Callable[[Number, Number], bool], until_clear: bool):
+    """Make the transformation for a reroll, using the closed-form distributions.
+
+    Rerolling once keeps the dice that don't meet the condition and
+    replaces the rest with a fresh roll. Rerolling until clear replaces
+    them with a roll from the die conditioned on *not* meeting the
+    condition.
+    """
+    def make(pool: _Pool, target: Number) -> Transform:
+        fresh = pool.base
+        if until_clear:
+            allowed = {value: p for value, p in fresh.items() if not comparison(value, target)}
+            mass = sum(allowed.values())
+            if not mass:
+                raise ArgumentValueError("Every side of a die with sides {die} would be "
+                                         "rerolled. This would create an infinite "
+                                         "loop.".format(die=sorted(fresh)))
+            fresh = {value: p / mass for value, p in allowed.items()}
+
+        def transform(pmf: PMF) -> PMF:
+            result = {}  # type: PMF
+            rerolled = 0
+            for value, p in pmf.items():
+                if comparison(value, target):
+                    rerolled += p
+                else:
+                    result[value] = result.get(value, 0) + p
+            if rerolled:
+                for value, p in fresh.items():
+                    result[value] = result.get(value, 0) + rerolled * p
+            return result
+
+        return transform
+
+    return make
+
+
+_POOL_OPERATIONS = {
+    'd': _rolls(lambda sides, base: base),
+    'da': _rolls(lambda sides, base: _average_face(sides), rolled_sides=False),
+    'dc': _rolls(lambda sides, base: base, factor=2),
+    'dm': _rolls(lambda sides, base: _max_face(sides), rolled_sides=False),
+    'h': _take(high=True),
+    'l': _take(high=False),
+    'f': _modify(_mapping(lambda value, bottom: bottom if value < bottom else value)),
+    'c': _modify(_mapping(lambda value, top: top if value > top else value)),
+    't': _modify(_mapping(lambda value, threshold: 1 if value >= threshold else 0), integer=True),
+    'T': _modify(_mapping(lambda value, threshold: 1 if value <= threshold else 0), integer=True),
+    'r': _modify(_reroll(lambda x, y: x == y, False)),
+    'R': _modify(_reroll(lambda x, y: x == y, True)),
+    'r<': _modify(_reroll(lambda x, y: x < y, False)),
+    'R<': _modify(_reroll(lambda x, y: x < y, True)),
+    'rl': _modify(_reroll(lambda x, y: x < y, False)),
+    'Rl': _modify(_reroll(lambda x, y: x < y, True)),
+    'r>': _modify(_reroll(lambda x, y: x > y, False)),
+    'R>': _modify(_reroll(lambda x, y: x > y, True)),
+    'rh': _modify(_reroll(lambda x, y: x > y, False)),
+    'Rh': _modify(_reroll(lambda x, y: x > y, True)),
+}
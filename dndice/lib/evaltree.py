@@ -2,7 +2,8 @@
 
 ``EvalTree`` is naturally the core class here. It provides all the
 functionality for looking at the tree as a unit, while ``EvalTreeNode``
-is the basic component.
+is the basic component. ``Evaluation`` holds the values from rolling a
+tree with ``EvalTree.roll``, which leaves the tree itself untouched.
 """
 import copy
 import typing
@@ -10,12 +11,20 @@ import typing
 from .exceptions import InputTypeError, EvaluationError, ParseError
 from .helpers import wrap_exceptions_with
 from .operators import OPERATORS, Roll, Operator, Side
+from .rng import as_rng
 from .tokenizer import Token, tokens
 
 Result = typing.Union[Roll, int, float]
 Final = typing.Union[int, float]
 Predicate = typing.Callable[['EvalTreeNode'], bool]
 Root = typing.Optional[typing.Union[str, typing.List[Token], 'EvalTree', None]]
+Rewrite = typing.Mapping[str, str]
+
+#: The dice operators replaced by each of the rolling modes, by code.
+#: Crit is superseded by maximum, and average by either of the others.
+CRITICAL = {'d': 'dc', 'da': 'dc'}  # type: Rewrite
+AVERAGE = {'d': 'da'}  # type: Rewrite
+MAXIMUM = {'d': 'dm', 'da': 'dm', 'dc': 'dm'}  # type: Rewrite
 
 
 class EvalTreeNode:
@@ -44,34 +53,59 @@ class EvalTreeNode:
 
     def __repr__(self):
         """Produce a string that could be used to reconstruct this node."""
-        def recursive(current: EvalTreeNode, depth: int) -> str:
+        # The nodes are expanded into their pieces from a stack rather than
+        # by recursing, so that even the deepest trees can be shown
+        pieces = []  # type: typing.List[str]
+        stack = [(self, 1)]  # type: typing.List[typing.Union[str, typing.Tuple[EvalTreeNode, int]]]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+                continue
+            current, depth = item
             if current is None:
-                return repr(current)
-            if current.is_leaf():
-                return 'EvalTreeNode({}, {}, {})'.format(current.payload,
-                                                         current.left,
-                                                         current.right)
-            return ('EvalTreeNode({payload},\n'
-                    '{indent}{left},\n'
-                    '{indent}{right}\n'
-                    '{short})').format(
-                payload=current.payload,
-                left=recursive(current.left, depth + 1),
-                right=recursive(current.right, depth + 1),
-                indent=' ' * len('EvalTreeNode(') * depth,
-                short=' ' * (len('EvalTreeNode(') * depth - 1),
-                align=' ' * len('EvalTreeNode(')
-            )
-
-        return recursive(self, 1)
-
-    def evaluate(self) -> Result:
+                pieces.append(repr(current))
+            elif current.is_leaf():
+                pieces.append('EvalTreeNode({}, {}, {})'.format(current.payload,
+                                                                current.left,
+                                                                current.right))
+            else:
+                indent = ' ' * len('EvalTreeNode(') * depth
+                short = ' ' * (len('EvalTreeNode(') * depth - 1)
+                stack.append('\n{})'.format(short))
+                stack.append((current.right, depth + 1))
+                stack.append(',\n{}'.format(indent))
+                stack.append((current.left, depth + 1))
+                stack.append('EvalTreeNode({},\n{}'.format(current.payload, indent))
+        return ''.join(pieces)
+
+    def __reduce__(self):
+        # Only the shape and payloads, not the values from the last roll
+        return _unflatten, (_flatten(self),)
+
+    def __deepcopy__(self, memo):
+        # Built from the flattened payloads so that it never recurses
+        node = _unflatten([copy.deepcopy(payload, memo) for payload in _flatten(self)])
+        memo[id(self)] = node
+        # Deep copies carry the values from the last roll along with them
+        stack = [(self, node)]
+        while stack:
+            original, duplicate = stack.pop()
+            if original is not None:
+                duplicate.value = copy.deepcopy(original.value, memo)
+                stack.append((original.right, duplicate.right))
+                stack.append((original.left, duplicate.left))
+        return node
+
+    def evaluate(self, rng=None) -> Result:
         """Recursively evaluate this subtree and return its computed value.
 
         As a side effect, it also annotates this node with the value. At
         the EvalTree level, this can be used to compose a more detailed
         report of the dice rolls.
 
+        :param rng: The random number generator to roll dice with. The
+            global one is used by default.
         :return: The value computed.
         """
         if self.is_leaf():
@@ -79,8 +113,9 @@ class EvalTreeNode:
             self.value = self.payload
             return self.value
         else:
-            self.value = self.payload(self.left and self.left.evaluate(),
-                                      self.right and self.right.evaluate())
+            self.value = self.payload.apply(self.left and self.left.evaluate(rng),
+                                            self.right and self.right.evaluate(rng),
+                                            rng)
             return self.value
 
     def is_leaf(self) -> bool:
@@ -99,8 +134,21 @@ class EvalTree:
 
     It is guaranteed that all leaf nodes hold a value (usually an
     integer) while all non-leaf nodes hold an operator.
+
+    A tree may also carry an ``evaluator``, a function that rolls the
+    same expression without walking the tree, taking the random number
+    generator to use as its only argument. This is filled in by
+    ``compile`` on request and used by ``basic``. Anything that changes
+    the structure of the tree drops it, as it would no longer match.
+    The same goes for ``variants``, which holds evaluators for rolling
+    the tree in the other modes, by mode, as ``basic`` builds them.
+
+    Alongside the evaluator, ``recipe`` records how it was made, as a
+    function and the options it was given. Calling the function with
+    the tree and those options makes the same kind of evaluator again,
+    which is how one is restored when the tree is unpickled.
     """
-    __slots__ = 'root',
+    __slots__ = 'root', 'evaluator', 'recipe', 'variants'
 
     def __init__(self, source: Root):
         """Initialize a tree of EvalTreeNodes that represent a given expression.
@@ -109,10 +157,18 @@ class EvalTree:
             tokenized list or compiled tree.
         """
         self.root = None  # type: typing.Optional[EvalTreeNode]
+        self.evaluator = None  # type: typing.Optional[typing.Callable[..., Final]]
+        self.recipe = None  # type: typing.Optional[typing.Tuple[typing.Callable, typing.Tuple]]
+        self.variants = {}  # type: typing.Dict[typing.Any, typing.Callable[..., Final]]
         if isinstance(source, str):
             self.__from_tokens(tokens(source))
         elif isinstance(source, EvalTree):
             self.root = source.root
+            self.evaluator = source.evaluator
+            self.recipe = source.recipe
+            # Shared, as they describe the same nodes; anything that
+            # changes either tree replaces its own rather than clearing it
+            self.variants = source.variants
         elif isinstance(source, list):
             self.__from_tokens(source)
         elif isinstance(source, (int, float)):
@@ -201,15 +257,21 @@ class EvalTree:
     def __concat(self, operation: Operator, other: 'EvalTree') -> 'EvalTree':
         new = self.copy()
         new.root = EvalTreeNode(operation, new.root, other.copy().root)
+        new.evaluator = None
+        new.recipe = None
+        new.variants = {}
         return new
 
     def __in_place_concat(self, operation: Operator, other: 'EvalTree') -> 'EvalTree':
         self.root = EvalTreeNode(operation, self.root, other.root)
+        self.evaluator = None
+        self.recipe = None
+        self.variants = {}
         return self
 
     @wrap_exceptions_with(EvaluationError, 'Failed to evaluate expression.')
-    def evaluate(self) -> Final:
-        r"""Recursively evaluate the tree.
+    def evaluate(self, rng=None) -> Final:
+        r"""Evaluate the tree, filling in the value of every node.
 
         Along the way, the ``value`` of each node is set to the value
         of the expression at this stage, so it can be inspected later.
@@ -236,16 +298,79 @@ class EvalTree:
         the '*' would perform 4 * 5 and store 20. This continues until
         the root is reached, and the final value is returned.
 
+        This applies the operators in exactly the order that
+        ``EvalTreeNode.evaluate`` does, but without recursing, so trees
+        of any depth can be evaluated.
+
+        :param rng: The random number generator to roll dice with, as
+            accepted by ``as_rng``. The global one is used by default.
         :return: The single final value from the tree.
         """
         if self.root is None:
             # An empty tree evaluates to nothing
             return 0
-        final = self.root.evaluate()
-        try:
-            return sum(final)
-        except TypeError:
-            return final
+        rng = as_rng(rng)
+        root = self.root
+        # Visiting the right operand before the left lists the operators
+        # in exactly the reverse of the order they have to be applied in.
+        # Leaves can be filled in straight away, as that has no effect
+        # on the order in which the dice are rolled.
+        operators = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.left is None and node.right is None:
+                node.value = node.payload
+            else:
+                operators.append(node)
+                if node.left is not None:
+                    stack.append(node.left)
+                if node.right is not None:
+                    stack.append(node.right)
+        for node in reversed(operators):
+            left = node.left
+            right = node.right
+            node.value = node.payload.apply(left and left.value, right and right.value, rng)
+        return _final(root.value)
+
+    @wrap_exceptions_with(EvaluationError, 'Failed to evaluate expression.')
+    def roll(self, rng=None, rewrite: Rewrite = None) -> 'Evaluation':
+        """Roll the tree without changing it in any way.
+
+        Unlike ``evaluate``, the values of the nodes are recorded in the
+        ``Evaluation`` that is returned rather than in the nodes, so any
+        number of threads can roll the same tree at once.
+
+        :param rng: The random number generator to roll dice with, as
+            accepted by ``as_rng``. The global one is used by default.
+        :param rewrite: Operators to roll in place of others, by code,
+            like ``CRITICAL``. This rolls the tree as if ``critify`` and
+            the like had been applied to it.
+        :return: The values rolled for this tree.
+        """
+        rng = as_rng(rng)
+        values = {}  # type: typing.Dict[EvalTreeNode, Result]
+        if self.root is None:
+            return Evaluation(self, values)
+        stack = [(self.root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node.is_leaf():
+                values[node] = node.payload
+            elif expanded:
+                op = node.payload
+                if rewrite and op.code in rewrite:
+                    op = OPERATORS[rewrite[op.code]]
+                values[node] = op.apply(None if node.left is None else values[node.left],
+                                        None if node.right is None else values[node.right],
+                                        rng)
+            else:
+                stack.append((node, True))
+                if node.right is not None:
+                    stack.append((node.right, False))
+                if node.left is not None:
+                    stack.append((node.left, False))
+        return Evaluation(self, values)
 
     @wrap_exceptions_with(ParseError, 'Failed to construct an expression from the token list.')
     def __from_tokens(self, tokens: typing.Sequence[Token]) -> None:
@@ -298,34 +423,41 @@ class EvalTree:
             node.left = values.pop()
         values.append(node)
 
-    def in_order(self, abort=None) -> typing.Iterable[EvalTreeNode]:
+    def in_order(self, abort: Predicate = None) -> typing.Iterator[EvalTreeNode]:
         """Perform an in-order/infix traversal of the tree.
 
         This includes a minimal set of parentheses such that the
         original tree can be constructed from the results of this
         iterator.
-        """
-        if abort is not None:
-            return self.__in_order_recursive(self.root, None, abort)
-        else:
-            return self.__in_order_recursive(self.root, None, lambda node: False)
 
-    def __in_order_recursive(self, current: EvalTreeNode, parent: typing.Optional[EvalTreeNode],
-                             abort: Predicate) \
-            -> typing.Iterable[EvalTreeNode]:
-        """Recurse through the tree."""
-        if current.is_leaf() or abort(current):
-            yield current
+        The traversal keeps its own stack rather than recursing, so it
+        takes time in proportion to the size of the tree and copes with
+        trees of any depth.
+
+        :param abort: Called on each operator node as it is reached. If
+            it returns True, the node is given in place of its whole
+            subtree.
+        """
+        if self.root is None:
             return
-        if parent and parent.payload > current.payload:
-            yield EvalTreeNode('(')
-        if current.left:
-            yield from self.__in_order_recursive(current.left, current, abort)
-        yield current
-        if current.right:
-            yield from self.__in_order_recursive(current.right, current, abort)
-        if parent and parent.payload > current.payload:
-            yield EvalTreeNode(')')
+        # Each entry is a node along with its parent, and whether it is
+        # ready to be given out rather than still to be visited
+        stack = [(self.root, None, False)]  # type: typing.List[typing.Tuple[EvalTreeNode, ...]]
+        while stack:
+            current, parent, ready = stack.pop()
+            if ready or current.is_leaf() or (abort is not None and abort(current)):
+                yield current
+                continue
+            parenthesize = parent is not None and parent.payload > current.payload
+            if parenthesize:
+                stack.append((EvalTreeNode(')'), None, True))
+            if current.right:
+                stack.append((current.right, current, False))
+            stack.append((current, None, True))
+            if current.left:
+                stack.append((current.left, current, False))
+            if parenthesize:
+                yield EvalTreeNode('(')
 
     def verbose_result(self) -> str:
         """Forms an infix string of the result, looking like the original with rolls evaluated.
@@ -337,41 +469,32 @@ class EvalTree:
             results from rolls.
         """
 
-        def to_string(node: EvalTreeNode) -> str:
-            if isinstance(node.payload, str):
-                return node.payload
-            if node.is_leaf() or node.payload.precedence >= 6:
-                return str(node.value)
-            return str(node.payload)
         if self.root is None:
             return ''
         if self.root.value is None:
             self.evaluate()
-        tokens = [to_string(node) for node in
-                  self.in_order(lambda node: node.payload.precedence >= 6)]
-        base = ''.join(tokens)
-        try:
-            final = sum(self.root.value)
-        except TypeError:
-            final = self.root.value
-        return base + ' = ' + str(final)
-
-    def pre_order(self, abort=None) -> typing.Iterable[EvalTreeNode]:
-        """Perform a pre-order/breadth-first traversal of the tree."""
-        if abort is not None:
-            return self.__pre_order_recursive(self.root, abort)
-        else:
-            return self.__pre_order_recursive(self.root, lambda node: False)
+        return _describe(self, lambda node: node.value)
 
-    def __pre_order_recursive(self, current: EvalTreeNode, abort: Predicate) -> \
-            typing.Iterable[EvalTreeNode]:
-        """Recurse through the tree."""
-        yield current
-        if not abort(current):
-            if current.left:
-                yield from self.__pre_order_recursive(current.left, abort)
-            if current.right:
-                yield from self.__pre_order_recursive(current.right, abort)
+    def pre_order(self, abort: Predicate = None) -> typing.Iterator[EvalTreeNode]:
+        """Perform a pre-order/depth-first traversal of the tree.
+
+        Like ``in_order``, this keeps its own stack rather than
+        recursing, so it copes with trees of any depth.
+
+        :param abort: Called on each node after it is given. If it
+            returns True, the children of the node are skipped.
+        """
+        if self.root is None:
+            return
+        stack = [self.root]
+        while stack:
+            current = stack.pop()
+            yield current
+            if abort is None or not abort(current):
+                if current.right:
+                    stack.append(current.right)
+                if current.left:
+                    stack.append(current.left)
 
     def critify(self) -> 'EvalTree':
         """Modify rolls in this expression to critical rolls.
@@ -380,10 +503,7 @@ class EvalTree:
         """
         # Note: crit is superseded by maximum
         # Though why you're using roll_max anyway is a mystery
-        for node in self.pre_order():
-            if node.payload == 'd' or node.payload == 'da':
-                node.payload = OPERATORS['dc']
-        return self
+        return self.__rewrite(CRITICAL)
 
     def averageify(self) -> 'EvalTree':
         """Modify rolls in this expression to average rolls.
@@ -391,10 +511,7 @@ class EvalTree:
         :return: This tree after it has been modified in-place.
         """
         # Note: average is superseded by crit or max
-        for node in self.pre_order():
-            if node.payload == 'd':
-                node.payload = OPERATORS['da']
-        return self
+        return self.__rewrite(AVERAGE)
 
     def maxify(self) -> 'EvalTree':
         """Modify rolls in this expression to maximum rolls.
@@ -402,26 +519,193 @@ class EvalTree:
         :return: This tree after it has been modified in-place.
         """
         # Max supersedes all
+        return self.__rewrite(MAXIMUM)
+
+    def rewritten(self, rewrite: Rewrite) -> 'EvalTree':
+        """Copy the structure of this tree with some operators replaced.
+
+        The payloads are shared with this tree, which is left as it is.
+
+        :param rewrite: The operators to replace, by code, like
+            ``CRITICAL``.
+        :return: The new tree, as if ``critify`` and the like had been
+            applied to a copy.
+        """
+        tree = EvalTree(None)
+        tree.root = _unflatten(_flatten(self.root))
+        return tree.__rewrite(rewrite)
+
+    def __rewrite(self, rewrite: Rewrite) -> 'EvalTree':
+        self.evaluator = None
+        self.recipe = None
+        self.variants = {}
         for node in self.pre_order():
-            if node.payload == 'd' or node.payload == 'da' or node.payload == 'dc':
-                node.payload = OPERATORS['dm']
+            if isinstance(node.payload, Operator) and node.payload.code in rewrite:
+                node.payload = OPERATORS[rewrite[node.payload.code]]
         return self
 
     def is_critical(self) -> bool:
         """Checks if this roll contains a d20 roll that is a natural 20."""
-        for node in self.pre_order(lambda node: (isinstance(node.value, Roll)
-                                                 and node.value.die == 20)):
-            if isinstance(node.value, Roll) and node.value.die == 20 and 20 in node.value:
-                return True
-        return False
+        return _natural(self, lambda node: node.value, 20)
 
     def is_fail(self) -> bool:
         """Checks if this roll contains a d20 roll that is a natural 1."""
-        for node in self.pre_order(lambda node: (isinstance(node.value, Roll)
-                                                 and node.value.die == 20)):
-            if isinstance(node.value, Roll) and node.value.die == 20 and 1 in node.value:
-                return True
-        return False
+        return _natural(self, lambda node: node.value, 1)
+
+    def stats(self):
+        """Find the mean, variance, and bounds of this expression without rolling it.
+
+        Sums and products of dice are summarized directly from the
+        sides of each die, without any dice being rolled or ``Roll``
+        objects created. Anything else, like keeping the highest rolls,
+        falls back to finding the exact distribution of that part.
+
+        :return: A ``Stats`` tuple of the mean, variance, minimum, and
+            maximum.
+        """
+        # This is imported here because the analysis itself builds trees
+        from .stats import stats
+        return stats(self)
 
     def copy(self) -> 'EvalTree':
         return copy.deepcopy(self)
+
+    def __reduce__(self):
+        """Pickle the tree compactly, leaving out the values from the last roll.
+
+        The nodes are stored as a flat post-order sequence of payloads,
+        and the registered operators in it by their code alone. An
+        evaluator with a ``recipe`` is made again from it when
+        unpickling, as most can't be pickled themselves.
+        """
+        evaluator = None if self.recipe is not None else self.evaluator
+        return _rebuild, (_flatten(self.root), evaluator, self.recipe)
+
+    def __deepcopy__(self, memo):
+        tree = EvalTree(None)
+        tree.root = copy.deepcopy(self.root, memo)
+        tree.evaluator = copy.deepcopy(self.evaluator, memo)
+        tree.recipe = self.recipe
+        return tree
+
+
+class Evaluation:
+    """The values from one roll of a tree, kept apart from the tree itself.
+
+    This is what ``EvalTree.roll`` returns. It offers the same views of
+    the roll as an evaluated tree does, but reads the values from here
+    rather than from the nodes.
+    """
+    __slots__ = 'tree', 'values', 'final'
+
+    def __init__(self, tree: EvalTree, values: typing.Dict[EvalTreeNode, Result]):
+        """Record the outcome of a roll.
+
+        :param tree: The tree that was rolled.
+        :param values: The value of every node in the tree.
+        """
+        self.tree = tree
+        self.values = values
+        # An empty tree evaluates to nothing
+        self.final = 0 if tree.root is None else _final(values[tree.root])  # type: Final
+
+    def value(self, node: EvalTreeNode) -> typing.Optional[Result]:
+        """Get the value that a node of the tree had in this roll."""
+        return self.values.get(node)
+
+    def verbose_result(self) -> str:
+        """Form an infix string of the result, just like ``EvalTree.verbose_result``."""
+        if self.tree.root is None:
+            return ''
+        return _describe(self.tree, self.values.get)
+
+    def is_critical(self) -> bool:
+        """Checks if this roll contains a d20 roll that is a natural 20."""
+        return _natural(self.tree, self.values.get, 20)
+
+    def is_fail(self) -> bool:
+        """Checks if this roll contains a d20 roll that is a natural 1."""
+        return _natural(self.tree, self.values.get, 1)
+
+
+def _final(value: Result) -> Final:
+    """Collapse the value of the root into the single final result."""
+    if isinstance(value, Roll):
+        return value.total()
+    try:
+        return sum(value)
+    except TypeError:
+        return value
+
+
+def _describe(tree: EvalTree, value_of: typing.Callable[[EvalTreeNode], Result]) -> str:
+    """Show the expression of a rolled tree with its rolls filled in."""
+    def to_string(node: EvalTreeNode) -> str:
+        if isinstance(node.payload, str):
+            return node.payload
+        if node.is_leaf() or node.payload.precedence >= 6:
+            return str(value_of(node))
+        return str(node.payload)
+    tokens = [to_string(node) for node in
+              tree.in_order(lambda node: node.payload.precedence >= 6)]
+    return ''.join(tokens) + ' = ' + str(_final(value_of(tree.root)))
+
+
+def _natural(tree: EvalTree, value_of: typing.Callable[[EvalTreeNode], Result],
+             face: int) -> bool:
+    """Check whether any d20 in a rolled tree came up on a face."""
+    def is_d20(node: EvalTreeNode) -> bool:
+        value = value_of(node)
+        return isinstance(value, Roll) and value.die == 20
+
+    for node in tree.pre_order(is_d20):
+        if is_d20(node) and face in value_of(node):
+            return True
+    return False
+
+
+def _flatten(root: typing.Optional[EvalTreeNode]) -> typing.Tuple:
+    """List the payloads of a subtree in post-order.
+
+    Each operator comes after both of its operands, with None standing
+    in for any missing one.
+    """
+    if root is None:
+        return ()
+    flat = []
+    stack = [(root, False)]  # type: typing.List[typing.Tuple[typing.Optional[EvalTreeNode], bool]]
+    while stack:
+        node, expanded = stack.pop()
+        if node is None:
+            flat.append(None)
+        elif expanded or not isinstance(node.payload, Operator):
+            flat.append(node.payload)
+        else:
+            stack.append((node, True))
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+    return tuple(flat)
+
+
+def _unflatten(flat: typing.Sequence) -> typing.Optional[EvalTreeNode]:
+    """Build a subtree again from its flattened payloads."""
+    nodes = []  # type: typing.List[typing.Optional[EvalTreeNode]]
+    for payload in flat:
+        if isinstance(payload, Operator):
+            right = nodes.pop()
+            nodes.append(EvalTreeNode(payload, nodes.pop(), right))
+        else:
+            nodes.append(None if payload is None else EvalTreeNode(payload))
+    return nodes.pop() if nodes else None
+
+
+def _rebuild(flat: typing.Sequence, evaluator, recipe) -> EvalTree:
+    """Unpickle a tree."""
+    tree = EvalTree(None)
+    tree.root = _unflatten(flat)
+    if recipe is not None:
+        make, options = recipe
+        evaluator = make(tree, *options)
+    tree.evaluator = evaluator
+    tree.recipe = recipe
+    return tree
@@ -1,10 +1,70 @@
-"""A few helper decorators to simplify construction of the code."""
+"""A few helper decorators to simplify construction of the code.
+
+Both decorators leave the function they decorate as ``unchecked`` on
+the result, so that trusted mode can call it directly. See
+``set_trusted``.
+"""
+import contextlib
 import functools
 import inspect
+import types
 import typing
 
 from .exceptions import ArgumentTypeError
 
+# Whether expressions are trusted to be well formed, so that rolling
+# them can skip the checks and wrapping that these decorators add
+_trusted = False
+
+
+def set_trusted(trusted: bool) -> None:
+    """Switch trusted mode on or off.
+
+    This only records the mode. ``dndice.set_trusted`` is what rebuilds
+    everything that depends on it.
+    """
+    global _trusted
+    _trusted = bool(trusted)
+
+
+def is_trusted() -> bool:
+    """Check whether trusted mode is on."""
+    return _trusted
+
+
+@contextlib.contextmanager
+def trusting(trusted: bool) -> typing.Iterator[None]:
+    """Switch trusted mode on or off just while building something.
+
+    Like ``set_trusted``, this only changes the recorded mode, and it
+    changes it for every thread.
+    """
+    global _trusted
+    previous = _trusted
+    _trusted = bool(trusted)
+    try:
+        yield
+    finally:
+        _trusted = previous
+
+
+def unchecked(f: typing.Callable) -> typing.Callable:
+    """Get a function decorated here without its checks or wrapping.
+
+    Bound methods stay bound. Anything not decorated here is returned as
+    it is.
+    """
+    if isinstance(f, types.MethodType):
+        inner = getattr(f.__func__, 'unchecked', None)
+        return f if inner is None else types.MethodType(inner, f.__self__)
+    return getattr(f, 'unchecked', f)
+
+
+def type_error(name: str, expected: type, actual: type) -> ArgumentTypeError:
+    """Make the error for an argument of the wrong type."""
+    fmt = "Expecting {name} to be of type {typ}, was {realtyp} instead."
+    return ArgumentTypeError(fmt.format(name=name, typ=expected, realtyp=actual))
+
 
 def check_simple_types(f: typing.Callable) -> typing.Callable:
     """A decorator that will check the types of the arguments at runtime.
@@ -13,6 +73,9 @@ def check_simple_types(f: typing.Callable) -> typing.Callable:
     of positional arguments, each of which is annotated with a concrete
     type. This means that no fancy `typing` annotations will be
     supported.
+
+    The names and types of the arguments are kept as
+    ``argument_types``, so they can be checked ahead of time.
     """
     spec = inspect.getfullargspec(f)
     annotations = [[name, spec.annotations[name]] for name in spec.args]
@@ -21,12 +84,11 @@ def check_simple_types(f: typing.Callable) -> typing.Callable:
     def ret(*args):
         for i, arg in enumerate(args):
             if not isinstance(arg, annotations[i][1]):
-                fmt = "Expecting {name} to be of type {typ}, was {realtyp} instead."
-                raise ArgumentTypeError(fmt.format(name=annotations[i][0],
-                                                   typ=annotations[i][1],
-                                                   realtyp=type(arg)))
+                raise type_error(annotations[i][0], annotations[i][1], type(arg))
         return f(*args)
 
+    ret.unchecked = f
+    ret.argument_types = tuple((name, typ) for name, typ in annotations)
     return ret
 
 
@@ -60,6 +122,7 @@ def wrap_exceptions_with(ex: type(Exception), message='', target=Exception):
             except target as e:
                 raise ex(message) from e
 
+        wrapped.unchecked = f
         return wrapped
 
     return decorator
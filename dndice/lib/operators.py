@@ -9,19 +9,27 @@ if you want to define your own or otherwise do some customization with
 the operators.
 
 The ``Roll`` object could be useful if you are trying to extend the
-rolling functionality.
+rolling functionality. Very large sets of dice are rolled into a
+``CountedRoll`` instead, which only keeps how many times each value came
+up but otherwise behaves like any other ``Roll``.
 
 All the various functions are not really worth talking about, they just
 implement the operations defined here.
 """
+import collections
 import enum
+import heapq
+import itertools
+import math
 import random
 import typing
+import weakref
+from collections.abc import Sequence
 from contextlib import contextmanager
-from copy import deepcopy
 
 from .exceptions import ArgumentTypeError, ArgumentValueError
-from .helpers import check_simple_types, wrap_exceptions_with
+from .helpers import check_simple_types, is_trusted, unchecked, wrap_exceptions_with
+from .sampling import multinomial
 
 Number = typing.Union[int, float]
 
@@ -39,6 +47,11 @@ class Side(enum.IntEnum):
     NEITHER = 0b00
 
 
+#: Every operator that is still alive, so that ``respecialize`` can find
+#: them all. Operators can't be hashed, so they are kept by their id.
+_LIVE = weakref.WeakValueDictionary()  # type: typing.MutableMapping[int, Operator]
+
+
 class Operator:
     """An operator like + or d that can be applied to values.
 
@@ -50,11 +63,22 @@ class Operator:
     comparing an ``Operator`` to the string that should produce it. For
     instance, the ``Operator`` instance for addition should return
     ``True`` for ``addition == '+'``.
+
+    Operators aren't meant to change once they are made. Calling one has
+    to collapse the right operands and pass along the random number
+    generator, and which of those apply is known from the start, so
+    the operator builds a function that does just that when it is
+    created. This is kept as ``apply``, which the evaluators call
+    directly. Every operator in existence, registered or not, has it
+    rebuilt by ``respecialize``.
     """
+    __slots__ = ('code', 'precedence', 'function', 'arity', 'associativity', 'cajole',
+                 'viewAs', 'stochastic', 'apply', '__weakref__')
 
     def __init__(self, code: str, precedence: int, func: typing.Callable,
                  arity: Side = Side.BOTH,
-                 associativity: Side = Side.LEFT, cajole: Side = Side.BOTH, viewAs: str = None):
+                 associativity: Side = Side.LEFT, cajole: Side = Side.BOTH, viewAs: str = None,
+                 stochastic: bool = False):
         """Create a new operator.
 
         :param code: The string that represents this operation. For
@@ -79,6 +103,9 @@ class Operator:
             single value before operation.
         :param viewAs: If the code is different than the actual
             operation string, fill viewAs with the real string.
+        :param stochastic: Whether ``func`` rolls dice. If so, it is
+            also passed the random number generator to use as the
+            keyword argument ``rng``.
         """
         self.code = code
         self.precedence = precedence
@@ -87,6 +114,10 @@ class Operator:
         self.associativity = associativity
         self.cajole = cajole
         self.viewAs = viewAs
+        self.stochastic = stochastic
+        #: Does exactly what calling the operator does.
+        self.apply = _specialize(self)
+        _LIVE[id(self)] = self
 
     def __ge__(self, other):
         if isinstance(other, str):
@@ -136,7 +167,28 @@ class Operator:
     def __str__(self):
         return self.viewAs or self.code
 
-    def __call__(self, left, right):
+    def __reduce__(self):
+        """Pickle the registered operators by their code alone.
+
+        Most operator functions are lambdas, which can't be pickled, and
+        the receiving end has its own ``OPERATORS`` anyway. Operators
+        that aren't registered are pickled in full, which needs their
+        function to be picklable.
+        """
+        if _is_registered(self):
+            return _registered, (self.code,)
+        return Operator, (self.code, self.precedence, self.function, self.arity,
+                          self.associativity, self.cajole, self.viewAs, self.stochastic)
+
+    def __copy__(self):
+        # Copies are distinct objects, whether or not they are registered
+        return Operator(self.code, self.precedence, self.function, self.arity,
+                        self.associativity, self.cajole, self.viewAs, self.stochastic)
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def __call__(self, left, right, rng=None):
         """Evaluate the function associated with this operator.
 
         Most operator functions are binary and will consume both
@@ -152,16 +204,98 @@ class Operator:
 
         :param left: The left operand. Usually an int or a Roll.
         :param right: The right operand. Even more likely to be an int.
+        :param rng: The random number generator for operators that roll
+            dice. The global one is used by default.
         """
+        return self.apply(left, right, rng)
+
+    def _generic(self, left, right, rng=None):
+        """Call the operator in the way that works for any operands."""
         if self.cajole & Side.LEFT:
-            if isinstance(left, (Roll, tuple)):
-                left = sum(left)
+            left = _collapse(left)
         if self.cajole & Side.RIGHT:
-            if isinstance(right, (Roll, tuple)):
-                right = sum(right)
+            right = _collapse(right)
+        if self.stochastic:
+            return self.function(*filter(lambda v: v is not None, [left, right]), rng=rng)
         return self.function(*filter(lambda v: v is not None, [left, right]))
 
 
+def _collapse(value):
+    if isinstance(value, Roll):
+        return value.total()
+    if isinstance(value, tuple):
+        return sum(value)
+    return value
+
+
+def _specialize(op: Operator) -> typing.Callable:
+    """Build the function that calls an operator, doing only what it needs.
+
+    Operands in the places that ``arity`` says are passed straight to the
+    operator's function, collapsed first only if ``cajole`` says so. Any
+    other arrangement of operands, like a binary operator that is missing
+    one, is handled exactly as it always has been.
+
+    In trusted mode, the function is called without the checks that
+    ``check_simple_types`` adds to it.
+    """
+    function = unchecked(op.function) if is_trusted() else op.function
+    generic = op._generic
+    collapseLeft = bool(op.cajole & Side.LEFT)
+    collapseRight = bool(op.cajole & Side.RIGHT)
+    collapsible = (Roll, tuple)
+    if op.arity == Side.BOTH and op.stochastic:
+        def apply(left, right, rng=None):
+            if left is None or right is None:
+                return generic(left, right, rng)
+            if collapseLeft and isinstance(left, collapsible):
+                left = _collapse(left)
+            if collapseRight and isinstance(right, collapsible):
+                right = _collapse(right)
+            return function(left, right, rng=rng)
+    elif op.arity == Side.BOTH:
+        def apply(left, right, rng=None):
+            if left is None or right is None:
+                return generic(left, right, rng)
+            if collapseLeft and isinstance(left, collapsible):
+                left = _collapse(left)
+            if collapseRight and isinstance(right, collapsible):
+                right = _collapse(right)
+            return function(left, right)
+    elif op.arity == Side.LEFT and not op.stochastic:
+        def apply(left, right, rng=None):
+            if left is None or right is not None:
+                return generic(left, right, rng)
+            if collapseLeft and isinstance(left, collapsible):
+                left = _collapse(left)
+            return function(left)
+    elif op.arity == Side.RIGHT and not op.stochastic:
+        def apply(left, right, rng=None):
+            if right is None or left is not None:
+                return generic(left, right, rng)
+            if collapseRight and isinstance(right, collapsible):
+                right = _collapse(right)
+            return function(right)
+    else:
+        apply = generic
+    return apply
+
+
+# Smaller unsorted rolls are sorted rather than picking out the rolls to
+# keep, as that is quicker for so few
+_SELECTION_MINIMUM = 32
+
+# Values to be sorted into the discards, as a list or with how many
+# times each value came up
+Segment = typing.Union[typing.List[Number], typing.Dict[Number, int]]
+
+
+def _expand(segment: Segment) -> typing.List[Number]:
+    if isinstance(segment, dict):
+        return [value for value in sorted(segment) for _ in range(segment[value])]
+    return sorted(segment)
+
+
 class Roll:
     """A set of rolls.
 
@@ -169,13 +303,18 @@ class Roll:
     well as what die was rolled to get this and any discarded values.
 
     The active rolls are assumed by many of the associated functions to
-    always be sorted ascending. To effect this, a Roll instance will
-    automatically sort the active roll list every time there is an
-    update to it. However, sometimes the index of a particular element
-    does matter, like with the ``reroll_unconditional`` class of
-    functions that repeatedly perform in-place replacements on those
-    elements. Therefore you have the chance to temporarily disable
-    sorting for the duration of these modifications.
+    always be sorted ascending. To effect this, a Roll instance sorts
+    the active roll list whenever it is looked at after an update to it.
+    Nothing that only needs the values, like ``len``, ``total``, or
+    keeping the highest few with ``highest``, has to wait for that sort.
+    However, sometimes the index of a particular element does matter,
+    like with the ``reroll_unconditional`` class of functions that
+    repeatedly perform in-place replacements on those elements.
+    Therefore you have the chance to temporarily disable sorting for the
+    duration of these modifications.
+
+    Values discarded by ``highest`` and ``lowest`` are likewise only
+    sorted into the discards when those are looked at.
 
     This object can be treated like a list in many ways, implementing
     get/set/delitem methods, len, and iter.
@@ -206,28 +345,47 @@ class Roll:
         return iter(self.rolls)
 
     def __len__(self):
-        return len(self.rolls)
+        return len(self.__rolls)
 
     def __getitem__(self, item):
         return self.rolls[item]
 
     def __setitem__(self, key, value):
         self.rolls[key] = value
-        if not self.__disableSorting:
-            self.rolls.sort()
+        self.__sorted = False
 
     def __delitem__(self, key):
         del self.rolls[key]
 
     @property
     def rolls(self) -> typing.List[Number]:
+        if not self.__disableSorting:
+            self._sort()
         return self.__rolls
 
     @rolls.setter
     def rolls(self, val: typing.List[Number]):
         self.__rolls = val
-        if not self.__disableSorting:
+        self.__sorted = False
+
+    @property
+    def discards(self) -> typing.List[Number]:
+        if self.__pending:
+            for segment in self.__pending:
+                self.__discards.extend(_expand(segment))
+            self.__pending = []
+        return self.__discards
+
+    @discards.setter
+    def discards(self, val: typing.List[Number]):
+        self.__discards = val
+        self.__pending = []  # type: typing.List[Segment]
+
+    def _sort(self) -> None:
+        """Sort the active rolls, if they have changed since they last were."""
+        if not self.__sorted:
             self.__rolls.sort()
+            self.__sorted = True
 
     @contextmanager
     def sorting_disabled(self):
@@ -245,11 +403,13 @@ class Roll:
         The example is taken straight from ``reroll_unconditional`` below.
         """
         try:
+            # Start from sorted positions, as everything else sees them
+            self._sort()
             self.__disableSorting = True
             yield self
         finally:
             self.__disableSorting = False
-            self.__rolls.sort()
+            self.__sorted = False
 
     @wrap_exceptions_with(ArgumentValueError, 'Index out of bounds', IndexError)
     def discard(self, index: typing.Union[int, slice]):
@@ -301,14 +461,240 @@ class Roll:
         else:
             raise ArgumentTypeError('You can only index with an int or a slice.')
         self.rolls[index] = new
+        self.__sorted = False
+
+    def _replace_one(self, index: int, new: Number) -> None:
+        """Replace a single roll, for loops that only ever use valid indices.
+
+        This is ``replace`` without the checks, which would only cost
+        time on every die.
+        """
+        self.discards.append(self.rolls[index])
+        self.rolls[index] = new
+        self.__sorted = False
 
     def copy(self) -> 'Roll':
         """Create a copy of this object to avoid mutating an original."""
-        rv = Roll(deepcopy(self.rolls), self.die)
-        # discards won't contain any mutable objects
-        rv.discards = self.discards[:]
+        # The rolls are only ever numbers, so a shallow copy is enough
+        rv = Roll(self.__rolls[:], self.die)
+        if self.__sorted:
+            # Already in order, so this only checks that it is
+            rv._sort()
+        rv._inherit(self)
         return rv
 
+    def total(self) -> Number:
+        """Add up the active rolls."""
+        return sum(self.__rolls)
+
+    def highest(self, number: int) -> 'Roll':
+        """Keep the highest ``number`` rolls and discard the rest, as ``take_high`` does.
+
+        This roll is left as it is. If it hasn't been sorted yet, the
+        rolls to keep are picked out without sorting the rest.
+        """
+        return self.__keep(number, True)
+
+    def lowest(self, number: int) -> 'Roll':
+        """Keep the lowest ``number`` rolls and discard the rest, as ``take_low`` does."""
+        return self.__keep(number, False)
+
+    def __keep(self, number: int, high: bool) -> 'Roll':
+        values = self.__rolls
+        if len(values) <= number:
+            return self.copy()
+        if number <= 0:
+            kept, dropped = [], values[:]
+        elif self.__sorted or len(values) <= _SELECTION_MINIMUM:
+            values = self.rolls
+            split = len(values) - number if high else number
+            kept, dropped = ((values[split:], values[:split]) if high
+                             else (values[:split], values[split:]))
+        else:
+            kept = heapq.nlargest(number, values) if high else heapq.nsmallest(number, values)
+            # Anything past the last value kept is dropped, as are the
+            # extra copies of that value itself
+            edge = kept[-1]
+            dropped = [value for value in values if (value < edge if high else value > edge)]
+            dropped.extend([edge] * (values.count(edge) - kept.count(edge)))
+        rv = Roll(kept, self.die)
+        rv._inherit(self, dropped)
+        return rv
+
+    def _inherit(self, source: 'Roll', dropped: Segment = None) -> None:
+        """Take over the discards of another roll, followed by some more values.
+
+        The new values are only sorted into the discards when they are
+        looked at.
+
+        :param source: The roll whose discards to copy.
+        :param dropped: More values to discard after those, either a list
+            or how many times each value came up.
+        """
+        self.__discards = source.__discards[:]
+        self.__pending = source.__pending[:]
+        if dropped:
+            self.__pending.append(dropped)
+
+
+#: Sets of at least this many dice are rolled into a ``CountedRoll``...
+COUNTED_MINIMUM = 256
+#: ...as long as there are also this many times as many dice as faces.
+COUNTED_RATIO = 8
+
+
+class CountedRoll(Roll):
+    """A set of rolls that only keeps how many times each value came up.
+
+    Rolling a hundred thousand six-sided dice only ever gives six
+    different values, so rather than a list of every die this holds a
+    count for each value. Adding it up, keeping the highest or lowest
+    dice, clamping them, and counting successes all work on the counts
+    directly, so they cost time and memory in proportion to the number of
+    faces rather than the number of dice.
+
+    Anything else that needs the individual rolls, like indexing or
+    rerolling, turns the counts into an ordinary sorted list first, after
+    which this behaves exactly like a ``Roll``.
+    """
+    #: The count of each value rolled, or None once they have been
+    #: listed out.
+    counts = None  # type: typing.Optional[typing.Dict[Number, int]]
+
+    def __init__(self, counts: typing.Mapping[Number, int], die=0):
+        """Create a new roll from counts.
+
+        :param counts: How many times each value was rolled.
+        :param die: The number of sides of the die that was rolled to
+            get those values.
+        """
+        super().__init__(None, die)
+        self.counts = {value: count for value, count in counts.items() if count > 0}
+
+    @property
+    def rolls(self) -> typing.List[Number]:
+        self.__list()
+        return Roll.rolls.fget(self)
+
+    @rolls.setter
+    def rolls(self, val: typing.List[Number]):
+        self.counts = None
+        Roll.rolls.fset(self, val)
+
+    def __iter__(self):
+        if self.counts is None:
+            return super().__iter__()
+        return itertools.chain.from_iterable(itertools.repeat(value, self.counts[value])
+                                             for value in sorted(self.counts))
+
+    def __len__(self):
+        if self.counts is None:
+            return super().__len__()
+        return sum(self.counts.values())
+
+    def _sort(self) -> None:
+        self.__list()
+        super()._sort()
+
+    def __list(self) -> None:
+        """Turn the counts into an ordinary list of rolls, if they haven't been already."""
+        if self.counts is not None:
+            counts, self.counts = self.counts, None
+            Roll.rolls.fset(self, _expand(counts))
+
+    def is_counted(self) -> bool:
+        """Check whether the rolls are still held as counts."""
+        return self.counts is not None
+
+    def total(self) -> Number:
+        if self.counts is None:
+            return super().total()
+        return sum(value * count for value, count in self.counts.items())
+
+    def copy(self) -> Roll:
+        if self.counts is None:
+            return super().copy()
+        return self.__derive(self.counts)
+
+    def __derive(self, counts: typing.Mapping[Number, int],
+                 dropped: typing.Dict[Number, int] = None) -> 'CountedRoll':
+        rv = CountedRoll(counts, self.die)
+        rv._inherit(self, dropped)
+        return rv
+
+    def highest(self, number: int) -> Roll:
+        if self.counts is None:
+            return super().highest(number)
+        return self.__keep(number, sorted(self.counts, reverse=True))
+
+    def lowest(self, number: int) -> Roll:
+        if self.counts is None:
+            return super().lowest(number)
+        return self.__keep(number, sorted(self.counts))
+
+    def __keep(self, number: int, order: typing.Iterable[Number]) -> 'CountedRoll':
+        if len(self) <= number:
+            return self.copy()
+        kept = {}
+        dropped = {}
+        left = max(number, 0)
+        for value in order:
+            count = self.counts[value]
+            kept[value] = min(count, left)
+            dropped[value] = count - kept[value]
+            left -= kept[value]
+        return self.__derive(kept, dropped)
+
+    def clamped(self, bottom: Number = None, top: Number = None) -> 'CountedRoll':
+        """Replace values outside of a range with its ends, like ``floor_val`` and ``ceil_val``."""
+        kept = {}
+        dropped = {}
+        for value, count in self.counts.items():
+            if bottom is not None and value < bottom:
+                dropped[value] = count
+                value = bottom
+            elif top is not None and value > top:
+                dropped[value] = count
+                value = top
+            kept[value] = kept.get(value, 0) + count
+        return self.__derive(kept, dropped)
+
+    def rerolled(self, meets: typing.Callable[[Number], bool],
+                 faces: typing.Sequence[Number], rng) -> 'CountedRoll':
+        """Replace the values that pass a test with new rolls, like ``reroll_unconditional``.
+
+        :param meets: Whether a value should be rerolled.
+        :param faces: The faces to roll instead, as often as each appears
+            on the die.
+        :param rng: The random number generator to roll with.
+        """
+        kept = {}
+        dropped = {}
+        for value, count in self.counts.items():
+            if meets(value):
+                dropped[value] = count
+            else:
+                kept[value] = count
+        weights = collections.Counter(faces)
+        distinct = sorted(weights)
+        fresh = multinomial(sum(dropped.values()), [weights[face] for face in distinct], rng)
+        for face, count in zip(distinct, fresh):
+            kept[face] = kept.get(face, 0) + count
+        return self.__derive(kept, dropped)
+
+    def successes(self, succeeds: typing.Callable[[Number], bool]) -> 'CountedRoll':
+        """Turn each value into a one or a zero.
+
+        This is what ``threshold_lower`` and ``threshold_upper`` do to
+        the values of any other roll.
+        """
+        hits = sum(count for value, count in self.counts.items() if succeeds(value))
+        return self.__derive({0: len(self) - hits, 1: hits}, dict(self.counts))
+
+
+def _is_counted(roll: Roll) -> bool:
+    return isinstance(roll, CountedRoll) and roll.is_counted()
+
 
 @check_simple_types
 def threshold_lower(roll: Roll, threshold: int) -> Roll:
@@ -319,6 +705,8 @@ def threshold_lower(roll: Roll, threshold: int) -> Roll:
     :return: A list of ones and zeros that indicate which rolls met the
         threshold.
     """
+    if _is_counted(roll):
+        return roll.successes(lambda v: v >= threshold)
     modified = Roll([1 if v >= threshold else 0 for v in roll], roll.die)
     modified.discards = roll.discards[:] + roll[:]
     return modified
@@ -333,6 +721,8 @@ def threshold_upper(roll: Roll, threshold: int) -> Roll:
     :return: A list of ones and zeros that indicate which rolls met the
         threshold.
     """
+    if _is_counted(roll):
+        return roll.successes(lambda v: v <= threshold)
     modified = Roll([1 if v <= threshold else 0 for v in roll], roll.die)
     modified.discards = roll.discards[:] + roll[:]
     return modified
@@ -349,11 +739,7 @@ def take_low(roll: Roll, number: int) -> Roll:
     :return: A roll with the lowest rolls preserved and the rest
         discarded.
     """
-    copy = roll.copy()
-    if len(copy) > number:
-        n = len(copy) - number
-        copy.discard(slice(-n, None))
-    return copy
+    return roll.lowest(number)
 
 
 @check_simple_types
@@ -367,28 +753,31 @@ def take_high(roll: Roll, number: int) -> Roll:
     :return: A roll with the highest rolls preserved and the rest
         discarded.
     """
-    copy = roll.copy()
-    if len(copy) > number:
-        n = len(copy) - number
-        copy.discard(slice(None, n))
-    return copy
+    return roll.highest(number)
 
 
 Sides = typing.Union[int, typing.Tuple[float, ...], Roll]
 
 
-def roll_basic(number: int, sides: Sides) -> Roll:
+def roll_basic(number: int, sides: Sides, rng=None) -> Roll:
     """Roll a single set of dice.
 
     :param number: The number of dice to be rolled.
     :param sides: Roll a ``sides``-sided die. Or, if given a collection
         of side values, pick one from there.
+    :param rng: The random number generator to use, instead of the
+        global one.
     :return: A ``Roll`` holding all the dice rolls.
     """
-    return Roll([single_die(sides) for _ in range(number)], sides)
+    if counts_pay_off(number, sides):
+        return roll_counts(number, sides, rng)
+    if isinstance(sides, int) and hasattr(rng, 'randints'):
+        # A buffered generator can roll the whole set at once
+        return Roll(rng.randints(sides, number), sides)
+    return Roll([single_die(sides, rng) for _ in range(number)], sides)
 
 
-def single_die(sides: Sides) -> Number:
+def single_die(sides: Sides, rng=None) -> Number:
     """Roll a single die.
 
     The behavior is different based on what gets passed in. Given an
@@ -401,21 +790,67 @@ def single_die(sides: Sides) -> Number:
     die.
 
     :param sides: The number of sides, or specific side values.
+    :param rng: The random number generator to use, instead of the
+        global one. Anything with ``randint`` and ``choice`` methods
+        like those of ``random.Random`` will do.
     :return: The random value that was rolled.
     """
+    if rng is None:
+        rng = random
     if isinstance(sides, int):
-        return random.randint(1, sides)
+        return rng.randint(1, sides)
     elif isinstance(sides, tuple):
-        return random.choice(sides)
+        return rng.choice(sides)
     elif isinstance(sides, Roll):
         # Yeah this can happen, see 2d(1d4)
-        return random.randint(1, sum(sides))
+        return rng.randint(1, sum(sides))
     raise ArgumentTypeError("You can't roll a die with sides: {sides}".format(sides=sides))
 
 
-def roll_critical(number: int, sides: Sides) -> Roll:
+def counts_pay_off(number: int, sides: Sides) -> bool:
+    """Check whether a set of dice is big enough to be rolled as counts."""
+    if not isinstance(number, int) or number < COUNTED_MINIMUM:
+        return False
+    if isinstance(sides, int):
+        return 0 < sides and number >= COUNTED_RATIO * sides
+    if isinstance(sides, tuple):
+        return 0 < len(sides) and number >= COUNTED_RATIO * len(set(sides))
+    return False
+
+
+def roll_counts(number: int, sides: typing.Union[int, typing.Tuple[float, ...]],
+                rng=None) -> CountedRoll:
+    """Roll a set of dice by drawing how many land on each face.
+
+    The counts have exactly the distribution they would have if every
+    die were rolled, but the random number generator is used in a
+    different way, so the same seed gives different rolls than
+    ``roll_basic`` would for a smaller set.
+
+    :param number: The number of dice to be rolled.
+    :param sides: The number of sides of the die, or its side values.
+    :param rng: The random number generator to use, instead of the
+        global one.
+    """
+    if rng is None:
+        rng = random
+    if isinstance(sides, int):
+        faces = range(1, sides + 1)
+        weights = [1] * sides
+    else:
+        faces = sorted(set(sides))
+        weights = [sides.count(face) for face in faces]
+    counts = multinomial(number, weights, rng)
+    return CountedRoll(dict(zip(faces, counts)), sides)
+
+
+def roll_critical(number: int, sides: Sides, rng=None) -> Roll:
     """Roll double the normal number of dice."""
-    rolls = [single_die(sides) for _ in range(2 * number)]
+    if counts_pay_off(2 * number, sides):
+        return roll_counts(2 * number, sides, rng)
+    if isinstance(sides, int) and hasattr(rng, 'randints'):
+        return Roll(rng.randints(sides, 2 * number), sides)
+    rolls = [single_die(sides, rng) for _ in range(2 * number)]
     return Roll(rolls, sides)
 
 
@@ -447,13 +882,14 @@ def roll_average(number: int, sides: Sides) -> Roll:
 
 
 def reroll_once(original: Roll, target: Number,
-                comp: typing.Callable[[Number, Number], bool]) -> Roll:
+                comp: typing.Callable[[Number, Number], bool], rng=None) -> Roll:
     """Take the roll and reroll values that meet the comparison, taking the new result.
 
     :param original: The set of rolls to inspect.
     :param target: The target to compare against.
     :param comp: The comparison function, that should return true if
         the value should be rerolled.
+    :param rng: The random number generator to reroll with.
     :return: The roll after performing the rerolls.
     """
     modified = original.copy()
@@ -461,75 +897,196 @@ def reroll_once(original: Roll, target: Number,
     with modified.sorting_disabled():
         while i < len(original):
             if comp(modified[i], target):
-                modified.replace(i, single_die(modified.die))
+                modified._replace_one(i, single_die(modified.die, rng))
             i += 1
     return modified
 
 
+def _equal(value: Number, target: Number) -> bool:
+    return value == target
+
+
+def _higher(value: Number, target: Number) -> bool:
+    return value > target
+
+
+def _lower(value: Number, target: Number) -> bool:
+    return value < target
+
+
+class FaceRange(Sequence):
+    """The faces of an ordinary die from ``low`` to ``high``, perhaps with one left out.
+
+    This stands in for a tuple of those faces without listing them, as
+    a die can have millions of sides. Finding the face at an index, and
+    so picking one at random, is just arithmetic.
+    """
+    __slots__ = 'low', 'high', 'skip', 'length'
+
+    def __init__(self, low: int, high: int, skip: int = None):
+        """Describe the faces.
+
+        :param low: The lowest face.
+        :param high: The highest face.
+        :param skip: A face between them that is left out, if any.
+        """
+        self.low = low
+        self.high = high
+        self.skip = skip if skip is not None and low <= skip <= high else None
+        self.length = max(high - low + 1, 0) - (self.skip is not None)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self.face(i) for i in range(*index.indices(self.length)))
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('There are only {} faces.'.format(self.length))
+        return self.face(index)
+
+    def __iter__(self):
+        for value in range(self.low, self.high + 1):
+            if value != self.skip:
+                yield value
+
+    def __contains__(self, value):
+        return (isinstance(value, (int, float)) and float(value).is_integer()
+                and self.low <= value <= self.high and value != self.skip)
+
+    def __repr__(self):
+        return 'FaceRange({}, {}, {})'.format(self.low, self.high, self.skip)
+
+    def face(self, index):
+        """Find the face at an index, without checking it.
+
+        This works just as well on a NumPy array of indices.
+        """
+        value = self.low + index
+        if self.skip is not None:
+            value = value + (value >= self.skip)
+        return value
+
+
+def surviving_faces(die: Sides, target: Number,
+                    comp: typing.Callable[[Number, Number], bool]) -> typing.Sequence[Number]:
+    """List the faces of a die that a reroll condition doesn't apply to.
+
+    :param die: The sides of the die, as ``single_die`` takes them.
+    :param target: The target to compare against.
+    :param comp: The comparison function, that should return true if
+        the value should be rerolled.
+    :return: The faces that would be kept, as often as each appears on
+        the die. For an ordinary die and one of the usual comparisons,
+        this is a ``FaceRange`` rather than a tuple.
+    :raises ArgumentValueError: If every face would be rerolled, so
+        rerolling until clear would never end.
+    """
+    if isinstance(die, Roll):
+        # Just like single_die does, see 2d(1d4)
+        die = die.total()
+    if isinstance(die, tuple):
+        faces = tuple(face for face in die if not comp(face, target))
+    elif isinstance(die, int):
+        faces = _surviving_range(die, target, comp)
+    else:
+        raise ArgumentTypeError("You can't roll a die with sides: {sides}".format(sides=die))
+    if not faces:
+        raise ArgumentValueError("Every side of a die with sides {die} would be rerolled. "
+                                 "This would create an infinite loop.".format(die=die))
+    return faces
+
+
+def _surviving_range(die: int, target: Number,
+                     comp: typing.Callable[[Number, Number], bool]) -> typing.Sequence[Number]:
+    """Work out which faces of an ordinary die survive, without trying each."""
+    if comp is _equal:
+        return FaceRange(1, die, int(target) if float(target).is_integer() else None)
+    if comp is _higher:
+        return FaceRange(1, min(die, math.floor(target)))
+    if comp is _lower:
+        return FaceRange(max(1, math.ceil(target)), die)
+    # Any other condition has to be tried on every face
+    return tuple(face for face in range(1, die + 1) if not comp(face, target))
+
+
 def reroll_unconditional(original: Roll, target: Number,
-                         comp: typing.Callable[[Number, Number], bool]) -> Roll:
+                         comp: typing.Callable[[Number, Number], bool], rng=None) -> Roll:
     """Reroll values that meet the comparison, and keep on rerolling until they don't.
 
+    Rather than actually rolling again and again, each value that meets
+    the comparison is replaced by a single roll of just the faces that
+    don't. The chances of every outcome are exactly the same, but each
+    die costs one roll, and only its original value is discarded.
+
     :param original: The set of rolls to inspect.
     :param target: The target to compare against.
     :param comp: The comparison function, that should return true if the
         value should be rerolled.
+    :param rng: The random number generator to reroll with.
     :return: The roll after performing the rerolls.
+    :raises ArgumentValueError: If every face of the die meets the
+        comparison.
     """
+    faces = surviving_faces(original.die, target, comp)
+    if rng is None:
+        rng = random
+    if _is_counted(original):
+        return original.rerolled(lambda value: comp(value, target), faces, rng)
+    if isinstance(original.die, tuple) or faces[-1] - faces[0] + 1 != len(faces):
+        def draw():
+            return rng.choice(faces)
+    else:
+        low, high = faces[0], faces[-1]
+
+        def draw():
+            return rng.randint(low, high)
     modified = original.copy()
-    i = 0
     with modified.sorting_disabled():
-        while i < len(original):
-            while comp(modified[i], target):
-                modified.replace(i, single_die(modified.die))
-            i += 1
+        for i in range(len(modified)):
+            if comp(modified[i], target):
+                modified._replace_one(i, draw())
     return modified
 
 
-def reroll_once_on(original: Roll, target: Number) -> Roll:
+def reroll_once_on(original: Roll, target: Number, rng=None) -> Roll:
     """Reroll and take the new result when a roll is equal to the given number."""
-    return reroll_once(original, target, lambda x, y: x == y)
+    return reroll_once(original, target, _equal, rng)
 
 
-def reroll_once_higher(original: Roll, target: Number) -> Roll:
+def reroll_once_higher(original: Roll, target: Number, rng=None) -> Roll:
     """Reroll and take the new result when a roll is greater than the given number."""
-    return reroll_once(original, target, lambda x, y: x > y)
+    return reroll_once(original, target, _higher, rng)
 
 
-def reroll_once_lower(original: Roll, target: Number) -> Roll:
+def reroll_once_lower(original: Roll, target: Number, rng=None) -> Roll:
     """Reroll and take the new result when a roll is less than the given number."""
-    return reroll_once(original, target, lambda x, y: x < y)
+    return reroll_once(original, target, _lower, rng)
 
 
-def reroll_unconditional_on(original: Roll, target: Number) -> Roll:
+def reroll_unconditional_on(original: Roll, target: Number, rng=None) -> Roll:
     """Reroll and keep on rerolling when a roll is equal to the given number."""
-    return reroll_unconditional(original, target, lambda x, y: x == y)
+    return reroll_unconditional(original, target, _equal, rng)
 
 
-def reroll_unconditional_higher(original: Roll, target: Number) -> Roll:
+def reroll_unconditional_higher(original: Roll, target: Number, rng=None) -> Roll:
     """Reroll and keep on rerolling when a roll is greater than the given number."""
-    try:
-        min_ = min(original.die)
-    except TypeError:
-        min_ = 1
-    if target < min_:
-        raise ArgumentValueError("A die with sides {die} can never be less than {target}. "
-                                 "This would create an infinite loop.".format(die=original.die,
-                                                                              target=target))
-    return reroll_unconditional(original, target, lambda x, y: x > y)
-
-
-def reroll_unconditional_lower(original: Roll, target: Number) -> Roll:
+    return reroll_unconditional(original, target, _higher, rng)
+
+
+def reroll_unconditional_lower(original: Roll, target: Number, rng=None) -> Roll:
     """Reroll and keep on rerolling when a roll is less than the given number."""
-    try:
-        max_ = max(original.die)
-    except TypeError:
-        max_ = original.die
-    if target > max_:
-        raise ArgumentValueError("A die with sides {die} can never be greater than {target}. "
-                                 "This would create an infinite loop.".format(die=original.die,
-                                                                              target=target))
-    return reroll_unconditional(original, target, lambda x, y: x < y)
+    return reroll_unconditional(original, target, _lower, rng)
+
+
+#: The comparison that each of the functions that reroll until clear uses.
+UNTIL_CLEAR = {
+    reroll_unconditional_on: _equal,
+    reroll_unconditional_higher: _higher,
+    reroll_unconditional_lower: _lower,
+}
 
 
 def floor_val(original: Roll, bottom: Number) -> Roll:
@@ -539,12 +1096,14 @@ def floor_val(original: Roll, bottom: Number) -> Roll:
     :param bottom: The floor to truncate to.
     :return: The modified roll set.
     """
+    if _is_counted(original):
+        return original.clamped(bottom=bottom)
     modified = original.copy()
     i = 0
     with modified.sorting_disabled():
         while i < len(original):
             if modified[i] < bottom:
-                modified.replace(i, bottom)
+                modified._replace_one(i, bottom)
             i += 1
     return modified
 
@@ -556,12 +1115,14 @@ def ceil_val(original: Roll, top: Number) -> Roll:
     :param top: The ceiling to truncate to.
     :return: The modified roll set.
     """
+    if _is_counted(original):
+        return original.clamped(top=top)
     modified = original.copy()
     i = 0
     with modified.sorting_disabled():
         while i < len(original):
             if modified[i] > top:
-                modified.replace(i, top)
+                modified._replace_one(i, top)
             i += 1
     return modified
 
@@ -581,6 +1142,35 @@ def factorial(number: int) -> int:
     return rv
 
 
+def _is_registered(op: Operator) -> bool:
+    """Check whether an operator behaves exactly like the one registered under its code."""
+    registered = OPERATORS.get(op.code)
+    return registered is op or (registered is not None
+                                and registered.function is op.function
+                                and registered.precedence == op.precedence
+                                and registered.arity == op.arity
+                                and registered.associativity == op.associativity
+                                and registered.cajole == op.cajole
+                                and registered.viewAs == op.viewAs
+                                and registered.stochastic == op.stochastic)
+
+
+def respecialize() -> None:
+    """Rebuild ``apply`` for every operator there is.
+
+    This is needed whenever trusted mode is switched on or off. Copies
+    of the registered operators, like the ones in a copied tree, and
+    operators defined elsewhere are rebuilt too.
+    """
+    for op in list(_LIVE.values()):
+        op.apply = _specialize(op)
+
+
+def _registered(code: str) -> Operator:
+    """Find a registered operator again when unpickling."""
+    return OPERATORS[code]
+
+
 #: This contains all of the operators that are actually defined by this module.
 #: It is a map between the codes used to represent the operators, and the actual
 #: ``Operator`` instances that hold the functionality. Visually, it is sorted
@@ -588,24 +1178,24 @@ def factorial(number: int) -> int:
 #: this doesn't actually matter.
 OPERATORS = {
     '!': Operator('!', 8, factorial, arity=Side.LEFT, cajole=Side.LEFT),
-    'd': Operator('d', 7, roll_basic, cajole=Side.LEFT),
+    'd': Operator('d', 7, roll_basic, cajole=Side.LEFT, stochastic=True),
     'da': Operator('da', 7, roll_average, cajole=Side.LEFT),
-    'dc': Operator('dc', 7, roll_critical, cajole=Side.LEFT),
+    'dc': Operator('dc', 7, roll_critical, cajole=Side.LEFT, stochastic=True),
     'dm': Operator('dm', 7, roll_max, cajole=Side.LEFT),
     'h': Operator('h', 6, take_high, cajole=Side.RIGHT),
     'l': Operator('l', 6, take_low, cajole=Side.RIGHT),
     'f': Operator('f', 6, floor_val, cajole=Side.RIGHT),
     'c': Operator('c', 6, ceil_val, cajole=Side.RIGHT),
-    'r': Operator('r', 6, reroll_once_on, cajole=Side.RIGHT),
-    'R': Operator('R', 6, reroll_unconditional_on, cajole=Side.RIGHT),
-    'r<': Operator('r<', 6, reroll_once_lower, cajole=Side.RIGHT),
-    'R<': Operator('R<', 6, reroll_unconditional_lower, cajole=Side.RIGHT),
-    'rl': Operator('rl', 6, reroll_once_lower, cajole=Side.RIGHT),
-    'Rl': Operator('Rl', 6, reroll_unconditional_lower, cajole=Side.RIGHT),
-    'r>': Operator('r>', 6, reroll_once_higher, cajole=Side.RIGHT),
-    'R>': Operator('R>', 6, reroll_unconditional_higher, cajole=Side.RIGHT),
-    'rh': Operator('rh', 6, reroll_once_higher, cajole=Side.RIGHT),
-    'Rh': Operator('Rh', 6, reroll_unconditional_higher, cajole=Side.RIGHT),
+    'r': Operator('r', 6, reroll_once_on, cajole=Side.RIGHT, stochastic=True),
+    'R': Operator('R', 6, reroll_unconditional_on, cajole=Side.RIGHT, stochastic=True),
+    'r<': Operator('r<', 6, reroll_once_lower, cajole=Side.RIGHT, stochastic=True),
+    'R<': Operator('R<', 6, reroll_unconditional_lower, cajole=Side.RIGHT, stochastic=True),
+    'rl': Operator('rl', 6, reroll_once_lower, cajole=Side.RIGHT, stochastic=True),
+    'Rl': Operator('Rl', 6, reroll_unconditional_lower, cajole=Side.RIGHT, stochastic=True),
+    'r>': Operator('r>', 6, reroll_once_higher, cajole=Side.RIGHT, stochastic=True),
+    'R>': Operator('R>', 6, reroll_unconditional_higher, cajole=Side.RIGHT, stochastic=True),
+    'rh': Operator('rh', 6, reroll_once_higher, cajole=Side.RIGHT, stochastic=True),
+    'Rh': Operator('Rh', 6, reroll_unconditional_higher, cajole=Side.RIGHT, stochastic=True),
     't': Operator('t', 6, threshold_lower, cajole=Side.RIGHT),
     'T': Operator('T', 6, threshold_upper, cajole=Side.RIGHT),
     '^': Operator('^', 5, lambda x, y: x ** y, associativity=Side.RIGHT),
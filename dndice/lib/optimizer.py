@@ -0,0 +1,180 @@
+"""Optimization passes that simplify expression trees before they are rolled.
+
+These never touch the tree they are given. They instead build a new,
+equivalent tree that is cheaper to evaluate, which leaves the original
+around for anything that wants to show the expression as it was
+written, like ``EvalTree.verbose_result``.
+
+There is also ``check_rerolls``, which catches rerolls that could never
+finish while the expression is being compiled, and ``check_types``,
+which checks the types of operands ahead of time where it can.
+"""
+import functools
+import inspect
+import typing
+
+from .evaltree import EvalTree, EvalTreeNode
+from .helpers import type_error, unchecked
+from .operators import UNTIL_CLEAR, Side, roll_basic, roll_critical, surviving_faces
+
+#: The codes of the operators that actually roll dice. A subtree that
+#: contains none of these always comes out the same.
+DICE = frozenset({'d', 'da', 'dc', 'dm'})
+
+
+def fold_constants(tree: EvalTree, random: typing.AbstractSet[str] = DICE) -> EvalTree:
+    """Collapse every subtree that doesn't roll any dice into a single value.
+
+    For instance, ``1d20+(2+3)*4`` becomes the equivalent of
+    ``1d20+20``. Subtrees that fail to evaluate are left as they are, so
+    that the error is raised when the tree is actually rolled, just as
+    it would have been without folding.
+
+    :param tree: The tree to fold. It is not modified.
+    :param random: The codes of the operators that can come out
+        differently each time. By default this is all of the dice, but
+        rolling the average or maximum, for instance, always gives the
+        same result, and so can be folded if left out.
+    :return: A new tree with the same value as the original.
+    """
+    folded = EvalTree(None)
+    if tree.root is None:
+        return folded
+    # An iterative post-order traversal so that the children of a node
+    # are already folded by the time the node itself is considered. Each
+    # is kept with its value if that is known, which it may be even when
+    # the node can't be replaced, like a roll that is always the same
+    done = []  # type: typing.List[typing.Tuple[typing.Optional[EvalTreeNode], typing.Any]]
+    stack = [(tree.root, False)]  # type: typing.List[typing.Tuple[EvalTreeNode, bool]]
+    while stack:
+        node, expanded = stack.pop()
+        if node is None:
+            done.append((None, None))
+        elif node.is_leaf():
+            value = node.payload if isinstance(node.payload, (int, float, tuple)) else _UNKNOWN
+            done.append((EvalTreeNode(node.payload), value))
+        elif expanded:
+            right, rightValue = done.pop()
+            left, leftValue = done.pop()
+            done.append(_fold(EvalTreeNode(node.payload, left, right), leftValue, rightValue,
+                              random))
+        else:
+            stack.append((node, True))
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+    folded.root = done.pop()[0]
+    return folded
+
+
+# Stands for the value of a subtree that can't be known ahead of time
+_UNKNOWN = object()
+
+
+def _fold(node: EvalTreeNode, left, right, random: typing.AbstractSet[str]) \
+        -> typing.Tuple[EvalTreeNode, typing.Any]:
+    """Replace a node whose children are known by its value, if possible.
+
+    :return: The node to use in its place, and its value if known.
+    """
+    if getattr(node.payload, 'code', None) in random or left is _UNKNOWN or right is _UNKNOWN:
+        return node, _UNKNOWN
+    try:
+        value = node.payload(left, right)
+    except Exception:
+        # Whatever went wrong, rolling the tree raises it as usual
+        return node, _UNKNOWN
+    if isinstance(value, (int, float)):
+        return EvalTreeNode(value), value
+    return node, value
+
+
+def check_rerolls(tree: EvalTree) -> None:
+    """Make sure that no reroll in a tree could go on forever.
+
+    Rerolling until clear on a condition that every face of the die
+    meets, like ``1d6R<7``, could never finish. This finds those where
+    both the die and the condition are written out in the expression,
+    so the problem shows up when it is compiled rather than when it is
+    rolled.
+
+    :param tree: The tree to check.
+    :raises ArgumentValueError: If a reroll would never finish.
+    """
+    stack = [tree.root] if tree.root is not None else []
+    while stack:
+        node = stack.pop()
+        if node.is_leaf():
+            continue
+        stack.extend(child for child in (node.left, node.right) if child is not None)
+        comparison = UNTIL_CLEAR.get(node.payload.function)
+        target = node.right
+        if comparison is None or target is None or not target.is_leaf():
+            continue
+        # Keeping, clamping and rerolling dice all keep the die they
+        # were rolled with, so look through those for the dice
+        dice = node.left
+        while (dice is not None and not dice.is_leaf()
+               and dice.payload.precedence == node.payload.precedence):
+            dice = dice.left
+        if (dice is None or dice.is_leaf() or dice.right is None or not dice.right.is_leaf()
+                or dice.payload.function not in (roll_basic, roll_critical)):
+            continue
+        sides = dice.right.payload
+        if isinstance(sides, (int, tuple)) and isinstance(target.payload, (int, float)):
+            surviving_faces(sides, target.payload, comparison)
+
+
+def check_types(tree: EvalTree) -> None:
+    """Check the types of operands ahead of time, wherever they are known.
+
+    Operators like ``h`` and ``!`` check the type of every argument each
+    time they are called. Many operands can be told apart just from the
+    expression, as a number is written out or comes from a function that
+    says what it returns, like the dice. This makes the same check once
+    for those, which is all that is done in trusted mode.
+
+    :param tree: The tree to check.
+    :raises ArgumentTypeError: If an operand is certain to be of the
+        wrong type.
+    """
+    # A post-order traversal, so that the kinds of the operands of a
+    # node are known by the time the node itself is checked
+    kinds = []  # type: typing.List[typing.Optional[type]]
+    stack = [(tree.root, False)] if tree.root is not None else []
+    while stack:
+        node, expanded = stack.pop()
+        if node.is_leaf():
+            payload = node.payload
+            kinds.append(type(payload) if isinstance(payload, (int, float, tuple)) else None)
+        elif expanded:
+            operator = node.payload
+            operands = []
+            for child, side in ((node.right, Side.RIGHT), (node.left, Side.LEFT)):
+                if child is not None:
+                    kind = kinds.pop()
+                    operands.insert(0, _collapsed_kind(kind) if operator.cajole & side else kind)
+            expected = getattr(operator.function, 'argument_types', ())
+            if len(expected) == len(operands):
+                for (name, typ), kind in zip(expected, operands):
+                    if kind is not None and not issubclass(kind, typ):
+                        raise type_error(name, typ, kind)
+            kinds.append(_returns(operator.function))
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in (node.right, node.left)
+                         if child is not None)
+
+
+def _collapsed_kind(kind: typing.Optional[type]) -> typing.Optional[type]:
+    """What an operand becomes when it is collapsed, if that can be known."""
+    return kind if kind in (int, float) else None
+
+
+@functools.lru_cache(maxsize=None)
+def _returns(function: typing.Callable) -> typing.Optional[type]:
+    """The type that a function says it returns, if it says."""
+    try:
+        annotation = inspect.signature(unchecked(function)).return_annotation
+    except (TypeError, ValueError):
+        return None
+    return annotation if isinstance(annotation, type) else None
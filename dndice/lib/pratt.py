@@ -0,0 +1,154 @@
+"""Parse an expression straight into a tree in a single pass.
+
+The usual route from a string to an ``EvalTree`` takes two steps: the
+tokenizer builds a list of tokens, and then ``EvalTree`` arranges them
+into a tree with the shunting-yard algorithm, comparing operators
+through their rich comparison methods as it goes. ``parse`` fuses the
+two. It reads the string a token at a time with the tokenizer's
+patterns and builds the tree by `precedence climbing
+<https://en.wikipedia.org/wiki/Operator-precedence_parser#Precedence_climbing_method>`_
+(also known as Pratt parsing), looking binding powers up in a table
+of plain integers.
+
+The trees are exactly those the shunting-yard parser builds. A few
+things the two handle differently, such as a sign directly after
+another sign or after ``^``, and every malformed expression, are
+handed back to ``EvalTree`` so the result or the error is the same.
+"""
+import typing
+
+from .evaltree import EvalTree, EvalTreeNode
+from .operators import OPERATORS, Side
+from .tokenizer import BLANK, DIE_SIDES, EXPR_END, EXPR_START, LIST_VALUE
+
+# How tightly each operator binds to the operand on its left, and the
+# least an operator to its right must have to take the right operand
+# away from it. Doubling the precedence leaves room to make equal
+# precedences group to the right for right associative operators.
+_BINDING = {code: 2 * op.precedence for code, op in OPERATORS.items()}
+_RIGHT = {code: 2 * op.precedence - (op.associativity == Side.RIGHT)
+          for code, op in OPERATORS.items()}
+# A sign that would be the right operand of something this tight is
+# one of the cases where the shunting-yard parser gives an odd result
+_SIGN_LIMIT = 2 * OPERATORS['m'].precedence - 1
+
+
+Node = typing.Optional[EvalTreeNode]
+
+
+class _Unusual(Exception):
+    """The expression needs the full parser."""
+
+
+def _read(expr: str) -> EvalTreeNode:
+    """Build the tree for a well-formed expression.
+
+    Rather than recursing for every operand, the operators still waiting
+    for their right operand are kept on a stack along with the left
+    operand and the limit that was in force before them. An opening
+    parenthesis is kept there too, as an operator of None.
+
+    :raises _Unusual: If the expression isn't one this can be sure of.
+    """
+    if BLANK.match(expr).end() == len(expr):
+        return EvalTreeNode(0)
+    pending = []  # type: typing.List[typing.Tuple[typing.Any, Node, int]]
+    limit = 0
+    start = EXPR_START
+    i = 0
+    while True:
+        # An operand, possibly after some signs and opening parentheses
+        match = start.match(expr, i)
+        if match is None:
+            raise _Unusual
+        i = match.end()
+        groups = match.groups()
+        if groups[0] is not None:
+            left = EvalTreeNode(int(groups[0]))
+        elif groups[1] is not None:
+            pending.append((None, None, limit))
+            limit = 0
+            start = EXPR_START
+            continue
+        elif start is EXPR_START:
+            if limit >= _SIGN_LIMIT:
+                raise _Unusual
+            op = OPERATORS['p'] if groups[2] == '+' else OPERATORS['m']
+            pending.append((op, None, limit))
+            limit = _RIGHT[op.code]
+            continue
+        elif groups[3] is not None:
+            left = EvalTreeNode((-1, 0, 1))
+        else:
+            sides, i = _sides(expr, i)
+            left = EvalTreeNode(sides)
+        # Then whatever follows it, until the next operand is needed
+        while True:
+            match = EXPR_END.match(expr, i)
+            if match is None:
+                raise _Unusual
+            suffix, paren, binary, die = match.groups()
+            code = binary or die or suffix
+            binding = 0 if code is None else _BINDING[code]
+            # Finish off everything waiting that binds at least as tightly
+            while binding <= limit and pending and pending[-1][0] is not None:
+                op, waiting, limit = pending.pop()
+                left = EvalTreeNode(op, waiting, left)
+            if binding > limit:
+                i = match.end()
+                if suffix is not None:
+                    left = EvalTreeNode(OPERATORS[code], left)
+                    continue
+                pending.append((OPERATORS[code], left, limit))
+                limit = _RIGHT[code]
+                start = EXPR_START if die is None else DIE_SIDES
+                break
+            # Only a closing parenthesis or the end of the string is left
+            if paren is None:
+                if pending:
+                    raise _Unusual
+                return left
+            if not pending:
+                raise _Unusual
+            limit = pending.pop()[2]
+            i = match.end()
+
+
+def _sides(expr: str, i: int) -> typing.Tuple[typing.Tuple[float, ...], int]:
+    """Read the rest of a list of sides after its opening bracket.
+
+    :return: The sides and the position just past the closing bracket.
+    """
+    sides = []
+    while True:
+        match = LIST_VALUE.match(expr, i)
+        if match is None:
+            raise _Unusual
+        i = match.end()
+        try:
+            sides.append(float(match.group(1)))
+        except ValueError:
+            raise _Unusual from None
+        if match.group(2) == ']':
+            return tuple(sides), i
+
+
+def parse(expr: str) -> EvalTree:
+    """Build the expression tree for a string in one pass.
+
+    :param expr: The expression to parse.
+    :return: The same tree as ``EvalTree(expr)`` would give.
+    :raises ParseError: If the expression is malformed, exactly as
+        ``EvalTree`` would.
+    """
+    try:
+        root = _read(expr)
+    except _Unusual:
+        root = None
+    if root is None:
+        # Parsed outside of the handler, so that any error it raises
+        # isn't chained to the one that brought us here
+        return EvalTree(expr)
+    tree = EvalTree(None)
+    tree.root = root
+    return tree
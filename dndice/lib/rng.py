@@ -0,0 +1,167 @@
+"""Sources of randomness for rolling dice.
+
+Everything that rolls dice accepts an optional ``rng``. This is any
+object with the two methods of ``random.Random`` that rolling needs:
+``randint(a, b)``, giving an integer from ``a`` to ``b`` inclusive, and
+``choice(seq)``, giving a random element of a sequence. Leaving it out
+(or passing ``None``) uses the global generator in the ``random``
+module, as has always been the case.
+
+The public entry points pass whatever they are given through
+``as_rng`` first, so they also accept seeds and NumPy generators.
+For rolling large numbers of dice, ``BufferedRandom`` is a faster
+alternative to ``random.Random``.
+"""
+import array
+import os
+import random
+import typing
+
+from .exceptions import InputTypeError
+
+
+class NumpyRandom:
+    """Adapt a NumPy random generator to the interface used for rolling."""
+    __slots__ = 'generator',
+
+    def __init__(self, generator):
+        """Wrap a NumPy generator.
+
+        :param generator: A ``numpy.random.Generator`` or the legacy
+            ``numpy.random.RandomState``.
+        """
+        self.generator = generator
+
+    def randint(self, a: int, b: int) -> int:
+        if hasattr(self.generator, 'integers'):
+            return int(self.generator.integers(a, b, endpoint=True))
+        # The legacy interface excludes the upper bound
+        return int(self.generator.randint(a, b + 1))
+
+    def choice(self, seq: typing.Sequence):
+        return seq[self.randint(0, len(seq) - 1)]
+
+
+def as_rng(source):
+    """Turn anything that can be used as a source of randomness into one.
+
+    :param source: ``None`` for the global generator, a seed for a new
+        ``random.Random``, a NumPy generator, or anything with
+        ``randint`` and ``choice`` methods, which is used as-is.
+    :return: ``None`` (standing for the global generator) or an object
+        with ``randint`` and ``choice`` methods.
+    :raises InputTypeError: If the source can't be used.
+    """
+    if source is None:
+        return None
+    if isinstance(source, int):
+        return random.Random(source)
+    if type(source).__module__.split('.')[0] == 'numpy':
+        return NumpyRandom(source)
+    if hasattr(source, 'randint') and hasattr(source, 'choice'):
+        return source
+    raise InputTypeError("Can't use {} as a random number generator.".format(type(source)))
+
+
+# Random words are 32 bits, stored in whichever array type holds that
+_WORD = 'I' if array.array('I').itemsize == 4 else 'L'
+_SPAN = 1 << 32
+
+
+class BufferedRandom:
+    """A random number generator that draws its randomness in large blocks.
+
+    Rolling a die through ``random.randint`` costs several Python-level
+    calls each time. This instead fetches a few thousand random 32-bit
+    words at once and turns each into a die face with a little modular
+    arithmetic. Words that would make some faces more likely than others
+    are thrown away (rejection sampling), so the faces stay perfectly
+    uniform.
+
+    It also has ``randints`` for rolling a whole set of dice in one go,
+    which ``roll_basic`` uses when it is available.
+    """
+    __slots__ = 'source', 'urandom', 'blockSize', 'words', 'position'
+
+    def __init__(self, seed=None, block_size: int = 4096, urandom: bool = False):
+        """Create a new buffered generator.
+
+        :param seed: The seed for the underlying ``random.Random``.
+        :param block_size: How many 32-bit words to draw at a time.
+        :param urandom: Draw from ``os.urandom`` instead, which can't be
+            seeded.
+        """
+        self.source = None if urandom else random.Random(seed)
+        self.urandom = urandom
+        self.blockSize = block_size
+        self.words = []  # type: typing.List[int]
+        self.position = 0
+
+    def __refill(self):
+        if self.urandom:
+            data = os.urandom(4 * self.blockSize)
+        else:
+            bits = self.source.getrandbits(32 * self.blockSize)
+            data = bits.to_bytes(4 * self.blockSize, 'little')
+        block = array.array(_WORD)
+        block.frombytes(data)
+        self.words = block.tolist()
+        self.position = 0
+
+    def __word(self) -> int:
+        if self.position >= len(self.words):
+            self.__refill()
+        word = self.words[self.position]
+        self.position += 1
+        return word
+
+    def randint(self, a: int, b: int) -> int:
+        """Pick an integer from ``a`` to ``b`` inclusive."""
+        span = b - a + 1
+        if 0 < span <= _SPAN:
+            # The common case of a range that fits in one word
+            limit = _SPAN - _SPAN % span
+            while True:
+                if self.position >= len(self.words):
+                    self.__refill()
+                word = self.words[self.position]
+                self.position += 1
+                if word < limit:
+                    return a + word % span
+        if span <= 0:
+            raise ValueError("empty range for randint({}, {})".format(a, b))
+        # Enough words to cover the whole range, then the largest multiple
+        # of the range that fits in them; anything above that is rejected
+        words = (span.bit_length() + 31) // 32
+        total = 1 << (32 * words)
+        limit = total - total % span
+        while True:
+            value = 0
+            for _ in range(words):
+                value = (value << 32) | self.__word()
+            if value < limit:
+                return a + value % span
+
+    def randints(self, sides: int, count: int) -> typing.List[int]:
+        """Roll ``count`` dice with ``sides`` sides.
+
+        This gives exactly the same values as calling
+        ``randint(1, sides)`` that many times, only faster.
+        """
+        if sides <= 0 or sides > _SPAN:
+            return [self.randint(1, sides) for _ in range(count)]
+        limit = _SPAN - _SPAN % sides
+        result = []  # type: typing.List[int]
+        while len(result) < count:
+            if self.position >= len(self.words):
+                self.__refill()
+            chunk = self.words[self.position:self.position + count - len(result)]
+            self.position += len(chunk)
+            result.extend([word % sides + 1 for word in chunk if word < limit])
+        return result
+
+    def choice(self, seq: typing.Sequence):
+        """Pick a random element of a sequence."""
+        if not seq:
+            raise IndexError('Cannot choose from an empty sequence')
+        return seq[self.randint(0, len(seq) - 1)]
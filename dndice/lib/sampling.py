@@ -0,0 +1,129 @@
+"""Draw how many dice land on each face without rolling every die.
+
+Rolling a huge set of dice one at a time costs a call to the random
+number generator per die, when all that matters afterwards is how many
+dice came up as each face. Those counts follow a multinomial
+distribution, which can be sampled directly: the count for the first
+face is binomial, then the count for the next face out of the dice that
+are left, and so on. NumPy generators do the whole thing in one draw.
+
+Everything here only needs the ``randint`` method of a random number
+generator, so it works with any generator the rest of the package
+accepts.
+"""
+import math
+import typing
+
+from .rng import NumpyRandom
+
+# Uniform floats are built from this many random bits, as many as a
+# double can hold exactly
+_BITS = 53
+_SCALE = 1 << _BITS
+# Below this mean the binomial is sampled by walking up its cumulative
+# distribution, which takes about that many steps
+_INVERSION_LIMIT = 10
+
+
+def uniform(rng) -> float:
+    """Pick a float from 0 (inclusive) to 1 (exclusive).
+
+    :param rng: The random number generator to draw from.
+    """
+    return rng.randint(0, _SCALE - 1) / _SCALE
+
+
+def binomial(number: int, probability: float, rng) -> int:
+    """Count the successes in a number of independent trials.
+
+    Small means are sampled by inversion. Larger ones use the
+    transformed rejection method with squeeze (BTRS) from Hörmann's "The
+    generation of binomial random variates" (1993), which takes a couple
+    of draws on average whatever the number of trials.
+
+    :param number: How many trials there are.
+    :param probability: The chance that each one succeeds.
+    :param rng: The random number generator to draw from.
+    :return: The number of successes.
+    """
+    if number <= 0 or probability <= 0:
+        return 0
+    if probability >= 1:
+        return number
+    if isinstance(rng, NumpyRandom):
+        return int(rng.generator.binomial(number, probability))
+    if probability > 0.5:
+        # Both methods assume the smaller probability
+        return number - binomial(number, 1 - probability, rng)
+    if number * probability < _INVERSION_LIMIT:
+        return _inversion(number, probability, rng)
+    return _rejection(number, probability, rng)
+
+
+def _inversion(number: int, probability: float, rng) -> int:
+    ratio = probability / (1 - probability)
+    step = (number + 1) * ratio
+    u = uniform(rng)
+    chance = (1 - probability) ** number
+    k = 0
+    # Should rounding leave a sliver of probability past the end, it
+    # goes to the last count
+    while u > chance and k < number:
+        u -= chance
+        k += 1
+        chance *= step / k - ratio
+    return k
+
+
+def _rejection(number: int, probability: float, rng) -> int:
+    spread = math.sqrt(number * probability * (1 - probability))
+    b = 1.15 + 2.53 * spread
+    a = -0.0873 + 0.0248 * b + 0.01 * probability
+    c = number * probability + 0.5
+    accept = 0.92 - 4.2 / b
+    alpha = (2.83 + 5.1 / b) * spread
+    logRatio = math.log(probability / (1 - probability))
+    mode = math.floor((number + 1) * probability)
+    logMode = math.lgamma(mode + 1) + math.lgamma(number - mode + 1)
+    while True:
+        u = uniform(rng) - 0.5
+        v = uniform(rng)
+        us = 0.5 - abs(u)
+        if us == 0 or v == 0:
+            continue
+        k = math.floor((2 * a / us + b) * u + c)
+        if k < 0 or k > number:
+            continue
+        if us >= 0.07 and v <= accept:
+            return k
+        # Compare against the exact ratio of the probability of k to
+        # that of the mode
+        v = math.log(v * alpha / (a / (us * us) + b))
+        if v <= (logMode - math.lgamma(k + 1) - math.lgamma(number - k + 1)
+                 + (k - mode) * logRatio):
+            return k
+
+
+def multinomial(number: int, weights: typing.Sequence[int], rng) -> typing.List[int]:
+    """Split a number of trials between outcomes at random.
+
+    :param number: How many trials there are.
+    :param weights: The relative chance of each outcome, as whole
+        numbers, like how many sides of a die show each value.
+    :param rng: The random number generator to draw from.
+    :return: How many trials landed on each outcome, in the same order
+        as ``weights``.
+    """
+    if isinstance(rng, NumpyRandom) and number > 0:
+        whole = sum(weights)
+        return [int(count) for count in
+                rng.generator.multinomial(number, [weight / whole for weight in weights])]
+    counts = []
+    remaining = number
+    rest = sum(weights)
+    for weight in weights:
+        count = binomial(remaining, weight / rest, rng) if remaining > 0 else 0
+        counts.append(count)
+        remaining -= count
+        rest -= weight
+    return counts
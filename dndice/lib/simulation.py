@@ -0,0 +1,85 @@
+"""Roll an expression a great many times across several processes.
+
+The trials are split into shards of a fixed size, and each shard is
+rolled by a worker process from a seed of its own. Those seeds all
+come from one master seed, so the same master seed always gives the
+same results, no matter how many workers there are or which of them
+happens to pick up which shard. Each worker sends back only a count
+of how many times each result came up, rather than every single roll.
+"""
+import collections
+import concurrent.futures
+import random
+import typing
+
+from .compiler import lower_tree
+from .evaltree import EvalTree, Rewrite
+
+#: How many trials each worker rolls at a time.
+SHARD_SIZE = 10000
+
+Histogram = typing.Counter
+
+
+def shards(trials: int, seed: typing.Optional[int]) -> typing.List[typing.Tuple[int, int]]:
+    """Split the trials into shards, each with its own seed.
+
+    :param trials: The total number of trials.
+    :param seed: The master seed. If not given, a fresh one is used.
+    :return: The number of trials and the seed for each shard.
+    """
+    master = random.Random(seed)
+    plan = []
+    for start in range(0, trials, SHARD_SIZE):
+        plan.append((min(SHARD_SIZE, trials - start), master.getrandbits(64)))
+    return plan
+
+
+def roll_shard(source: typing.Union[str, int, float, EvalTree], trials: int, seed: int,
+               rewrite: typing.Optional[Rewrite] = None) -> Histogram:
+    """Roll one shard of a simulation. This is what runs in the workers.
+
+    A tree that was compiled with an evaluator is rolled with it, just
+    as ``basic`` would roll it. Anything else is lowered first.
+
+    :param source: The expression to roll.
+    :param trials: How many times to roll it.
+    :param seed: The seed for this shard's random number generator.
+    :param rewrite: Operators to roll in place of others, by code, like
+        ``CRITICAL``.
+    :return: How many times each result came up.
+    """
+    tree = EvalTree(source)
+    if rewrite:
+        tree = tree.rewritten(rewrite)
+    roll = tree.evaluator or lower_tree(tree)
+    rng = random.Random(seed)
+    return collections.Counter(roll(rng) for _ in range(trials))
+
+
+def simulate(source: typing.Union[str, int, float, EvalTree], trials: int,
+             workers: typing.Optional[int] = None, seed: typing.Optional[int] = None,
+             rewrite: typing.Optional[Rewrite] = None) -> Histogram:
+    """Roll an expression many times in a pool of processes.
+
+    :param source: The expression to roll.
+    :param trials: How many times to roll it in total.
+    :param workers: How many processes to use. Defaults to the number
+        of processors on the machine.
+    :param seed: The master seed, which makes the results reproducible.
+    :param rewrite: Operators to roll in place of others, by code, like
+        ``CRITICAL``.
+    :return: How many times each result came up.
+    """
+    histogram = collections.Counter()  # type: Histogram
+    plan = shards(trials, seed)
+    if not plan:
+        return histogram
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(roll_shard, source, size, shard_seed, rewrite)
+                   for size, shard_seed in plan]
+        # Merge in submission order so that the histogram is built the
+        # same way every time
+        for future in futures:
+            histogram.update(future.result())
+    return histogram
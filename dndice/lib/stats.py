@@ -0,0 +1,195 @@
+"""Summarize the result of an expression without rolling it.
+
+The mean, variance, and bounds of most expressions people actually use
+can be found by combining those of the parts of the expression. A die
+with ``s`` sides averages ``(s + 1) / 2``; the sum of independent rolls
+averages the sum of their averages, with the variances adding in the
+same way. These rules are applied node by node, so summarizing
+``3d8+2d6+5`` takes a handful of arithmetic operations and no dice.
+
+Where no such rule applies, as with ``h`` and ``r``, the subtree under
+that node is handed to ``distribution`` to be worked out exactly.
+"""
+import typing
+from fractions import Fraction
+
+from .distribution import distribution
+from .evaltree import EvalTree, EvalTreeNode
+from .operators import OPERATORS, Number, Side
+
+
+class Stats(typing.NamedTuple('Stats', [('mean', Number), ('variance', Number),
+                                        ('minimum', Number), ('maximum', Number)])):
+    """The mean, variance, and the smallest and largest possible results.
+
+    Wherever possible these are exact fractions.
+    """
+    __slots__ = ()
+
+
+def stats(tree: EvalTree) -> Stats:
+    """Summarize the result of an expression tree.
+
+    :param tree: The expression to summarize. It is not modified.
+    :return: The summary of the tree's possible results.
+    :raises EvaluationError: If a part of the expression needs its
+        exact distribution and that can't be found.
+    """
+    if tree.root is None:
+        return Stats(0, 0, 0, 0)
+    done = []  # type: typing.List[typing.Optional[Stats]]
+    stack = [(tree.root, False)]  # type: typing.List[typing.Tuple[EvalTreeNode, bool]]
+    while stack:
+        node, expanded = stack.pop()
+        if node is None:
+            done.append(None)
+        elif node.is_leaf():
+            done.append(_constant(node.payload))
+        elif expanded:
+            right = done.pop()
+            left = done.pop()
+            code = node.payload.code
+            if code in _FACES:
+                summary = _dice(code, left, node.right.payload)
+            else:
+                summary = _COMBINE[code](left, right)
+            done.append(summary if summary is not None else _exactly(node))
+        elif _is_simple(node):
+            stack.append((node, True))
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+        else:
+            done.append(_exactly(node))
+    return done.pop()
+
+
+def _is_simple(node: EvalTreeNode) -> bool:
+    """Check whether a node's summary can be found from those of its children."""
+    operator = node.payload
+    code = getattr(operator, 'code', None)
+    builtin = OPERATORS.get(code)
+    if builtin is None or builtin.function is not operator.function:
+        return False
+    if code in _FACES:
+        return node.left is not None and node.right is not None and node.right.is_leaf()
+    if code in _COMBINE:
+        if operator.arity == Side.RIGHT:
+            return node.left is None and node.right is not None
+        return node.left is not None and node.right is not None
+    return False
+
+
+def _subtree(node: EvalTreeNode) -> EvalTree:
+    tree = EvalTree(None)
+    tree.root = node
+    return tree
+
+
+def _exactly(node: EvalTreeNode) -> Stats:
+    """Summarize a subtree by finding its whole distribution."""
+    result = distribution(_subtree(node))
+    return Stats(result.mean(), result.variance(), min(result), max(result))
+
+
+def _ratio(a: Number, b: Number) -> Number:
+    if isinstance(a, int) and isinstance(b, int):
+        return Fraction(a, b)
+    return a / b
+
+
+def _constant(value) -> Stats:
+    if isinstance(value, tuple):
+        value = sum(value)
+    return Stats(value, 0, value, value)
+
+
+def _dice(code: str, count: Stats, sides) -> typing.Optional[Stats]:
+    """Summarize a roll of a fixed die, if the die is one that can be summarized.
+
+    With a rolled number ``N`` of dice, each with mean ``m`` and
+    variance ``v``, the total has mean ``E[N]m`` and variance
+    ``E[N]v + Var(N)m^2``.
+    """
+    if not isinstance(count.minimum, int) or count.minimum < 0:
+        return None
+    face = _FACES[code](sides)
+    if face is None:
+        return None
+    mean, variance, low, high = face
+    factor = 2 if code == 'dc' else 1
+    number = Stats(count.mean * factor, count.variance * factor ** 2,
+                   count.minimum * factor, count.maximum * factor)
+    corners = [number.minimum * low, number.minimum * high,
+               number.maximum * low, number.maximum * high]
+    return Stats(number.mean * mean,
+                 number.mean * variance + number.variance * mean ** 2,
+                 min(corners), max(corners))
+
+
+def _normal_face(sides) -> typing.Optional[Stats]:
+    if isinstance(sides, tuple) and sides:
+        mean = _ratio(sum(sides), len(sides))
+        variance = sum((side - mean) ** 2 for side in sides) / len(sides)
+        return Stats(mean, variance, min(sides), max(sides))
+    if isinstance(sides, int) and sides >= 1:
+        return Stats(Fraction(sides + 1, 2), Fraction(sides * sides - 1, 12), 1, sides)
+    return None
+
+
+def _average_face(sides) -> typing.Optional[Stats]:
+    if isinstance(sides, tuple) and sides:
+        return _constant(sum(sides) / len(sides))
+    if isinstance(sides, int):
+        return _constant((sides + 1) / 2)
+    return None
+
+
+def _max_face(sides) -> typing.Optional[Stats]:
+    if isinstance(sides, tuple) and sides:
+        return _constant(max(sides))
+    if isinstance(sides, (int, float)):
+        return _constant(sides)
+    return None
+
+
+_FACES = {
+    'd': _normal_face,
+    'dc': _normal_face,
+    'da': _average_face,
+    'dm': _max_face,
+}
+
+
+def _add(left: Stats, right: Stats) -> Stats:
+    return Stats(left.mean + right.mean, left.variance + right.variance,
+                 left.minimum + right.minimum, left.maximum + right.maximum)
+
+
+def _subtract(left: Stats, right: Stats) -> Stats:
+    return Stats(left.mean - right.mean, left.variance + right.variance,
+                 left.minimum - right.maximum, left.maximum - right.minimum)
+
+
+def _multiply(left: Stats, right: Stats) -> Stats:
+    """The product of two independent values."""
+    corners = [left.minimum * right.minimum, left.minimum * right.maximum,
+               left.maximum * right.minimum, left.maximum * right.maximum]
+    variance = (left.variance * right.variance
+                + left.variance * right.mean ** 2
+                + right.variance * left.mean ** 2)
+    return Stats(left.mean * right.mean, variance, min(corners), max(corners))
+
+
+def _negate(right: Stats) -> Stats:
+    return Stats(-right.mean, right.variance, -right.maximum, -right.minimum)
+
+
+#: How to combine the summaries of the operands of the operators that
+#: can be summarized directly.
+_COMBINE = {
+    '+': _add,
+    '-': _subtract,
+    '*': _multiply,
+    'm': lambda left, right: _negate(right),
+    'p': lambda left, right: right,
+}  # type: typing.Dict[str, typing.Callable[[typing.Optional[Stats], Stats], Stats]]
@@ -0,0 +1,143 @@
+"""Save compiled expressions to a file and load them back.
+
+Processes that start often and roll the same expressions every time can
+save their parsed trees once and skip tokenizing and parsing on every
+later start. The trees are stored as ``Program`` instructions, which
+refer to operators only by their code, so the file holds nothing but
+plain numbers, strings, and tuples. They are loaded back as programs,
+which can be rolled straight away and turned back into trees with
+``Program.to_tree`` only when they are needed.
+
+Each file records the version of this package and a fingerprint of the
+operator table that made it. A file made by another version or with
+different operators is treated as empty, so a stale cache is never
+used.
+
+The expressions are kept in the order they were given, so a cache that
+keeps the most recently used expressions can be saved and loaded again
+without losing track of which those are.
+"""
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import typing
+
+from .bytecode import OPCODES, Program, resolve_opcodes
+from .evaltree import EvalTree
+from .exceptions import InputTypeError
+from .operators import OPERATORS
+
+#: Bumped whenever the layout of the file changes.
+FORMAT = 2
+
+
+def fingerprint() -> str:
+    """Summarize the operator table.
+
+    This changes if an operator is added, removed, or renumbered, or
+    changes how it parses or what function it runs.
+    """
+    digest = hashlib.sha256()
+    for code in OPCODES:
+        op = OPERATORS[code]
+        function = getattr(op.function, '__module__', ''), getattr(op.function, '__qualname__', '')
+        digest.update(repr((code, op.precedence, op.arity.value, op.associativity.value,
+                            op.cajole.value, op.viewAs, op.stochastic, function)).encode())
+    return digest.hexdigest()
+
+
+def _header() -> typing.Tuple[int, str, str]:
+    from .. import __version__
+    return FORMAT, __version__, fingerprint()
+
+
+def save(path: str, trees: typing.Mapping[str, typing.Union[EvalTree, Program]]) -> None:
+    """Write expression trees to a file, replacing whatever was there.
+
+    The file is written in full under a temporary name before being
+    moved into place, so other processes never see half of it.
+
+    :param path: Where to save the trees.
+    :param trees: The trees to save, by the expression they came from.
+        Programs can be given in place of trees. They are saved in the
+        order they come out of the mapping.
+    :raises InputTypeError: If a tree holds an operator that isn't
+        registered in ``OPERATORS``.
+    """
+    entries = []
+    for expr, tree in trees.items():
+        program = tree if isinstance(tree, Program) else Program.from_tree(tree)
+        entries.append((expr, (tuple(program.code), program.constants)))
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix='.dndice-')
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            pickle.dump((_header(), entries), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+class _PlainUnpickler(pickle.Unpickler):
+    """Only load builtin values, never anything that would import code."""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError('Saved expressions only hold plain values')
+
+
+def load(path: str) -> typing.Dict[str, Program]:
+    """Read back trees written by ``save``.
+
+    :param path: The file to read.
+    :return: The programs by expression, in the order they were saved,
+        or nothing if the file was made by a different version or
+        operator table or isn't a saved file at all.
+    :raises OSError: If the file can't be read.
+    :raises InputTypeError: If the file was made by this version, but the
+        expressions in it are malformed.
+    """
+    with open(path, 'rb') as file:
+        try:
+            header, entries = _PlainUnpickler(file).load()
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return collections.OrderedDict()
+    if header != _header():
+        return collections.OrderedDict()
+    if not isinstance(entries, list):
+        raise InputTypeError('The saved expressions are not a list.')
+    operators = resolve_opcodes()
+    programs = collections.OrderedDict()
+    for item in entries:
+        expr, (code, constants) = _check(item)
+        programs[expr] = Program(code, constants, operators)
+    return programs
+
+
+def _check(item) -> typing.Tuple[str, typing.Tuple[tuple, tuple]]:
+    """Make sure that a saved expression is a program that can be run.
+
+    :return: The expression and its program, unchanged.
+    :raises InputTypeError: If it isn't.
+    """
+    if not (isinstance(item, tuple) and len(item) == 2):
+        raise InputTypeError('The saved expression {!r} is malformed.'.format(item))
+    expr, entry = item
+    if not (isinstance(expr, str) and isinstance(entry, tuple) and len(entry) == 2
+            and isinstance(entry[0], tuple) and isinstance(entry[1], tuple)):
+        raise InputTypeError('The saved expression {!r} is malformed.'.format(expr))
+    code, constants = entry
+    # Follow the depth of the stack, as every operator takes two values
+    # off it and the whole program has to leave exactly one behind
+    depth = 0
+    for instruction in code:
+        if not isinstance(instruction, int) or not -len(constants) <= instruction < len(OPCODES):
+            raise InputTypeError('The saved expression {!r} has a bad instruction.'.format(expr))
+        if instruction >= 0 and depth < 2:
+            raise InputTypeError('The saved expression {!r} runs out of operands.'.format(expr))
+        depth += 1 if instruction < 0 else -1
+    if depth != (1 if code else 0):
+        raise InputTypeError('The saved expression {!r} is incomplete.'.format(expr))
+    return item
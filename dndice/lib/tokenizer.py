@@ -3,7 +3,16 @@
 Two functions may be useful to the outside: ``tokens`` and
 ``tokens_lazy``. ``tokens`` returns a list of the tokens, while
 ``tokens_lazy`` is a generator
+
+There are two tokenizers behind these. ``tokens_lazy`` runs the state
+machine defined by the ``State`` classes, which knows exactly what went
+wrong and where when it finds an error. ``tokens`` first tries a much
+faster scanner that reads a whole token at a time with a handful of
+regular expressions. That scanner gives up on anything it doesn't
+expect, in which case the state machine takes over to find the same
+tokens or raise the same error as it always has.
 """
+import re
 import string
 from typing import Optional, Tuple, List, Type, Set, Iterable, Sequence, Union
 
@@ -22,7 +31,113 @@ def tokens(s: str) -> List[Token]:
     :param s: The expression to be parsed
     :return: A list of tokens
     """
-    return list(tokens_lazy(s))
+    scanned = _scan(s)
+    if scanned is None:
+        return list(tokens_lazy(s))
+    return scanned
+
+
+# The scanner moves between three states, which match those of the
+# state machine: expecting the start of an expression (ExprStart),
+# expecting the sides of a die (after a Die), and expecting whatever can
+# follow a complete expression (ExprEnd). Each has a pattern that reads
+# the next token along with any whitespace before it. Note that only
+# the ASCII digits and whitespace are recognized by the state machine.
+# The Pratt parser reads expressions with the same patterns, so that
+# the two never disagree about where a token ends.
+_SPACE = '[ \t\n\r\x0b\x0c]*'
+EXPR_START = re.compile(_SPACE + r'(?:([0-9]+)|(\()|([-+]))')
+DIE_SIDES = re.compile(_SPACE + r'(?:([0-9]+)|(\()|(\[)|(F))')
+# The operators are tried longest first, so that this reads the same
+# operator as the state machine's one-character-at-a-time extension
+EXPR_END = re.compile(_SPACE + '(?:(!)|(\\))|({})|(d[acm]?)|$)'.format(
+    '|'.join(re.escape(code) for code in sorted(
+        (code for code, op in OPERATORS.items()
+         if op.arity == Side.BOTH and not code.startswith('d')),
+        key=len, reverse=True))))
+LIST_VALUE = re.compile(_SPACE + '([0-9.]+)' + _SPACE + '([],])')
+BLANK = re.compile(_SPACE)
+
+
+def _scan(s: str) -> Optional[List[Token]]:
+    """Quickly split a well-formed expression into tokens.
+
+    :param s: The expression to be parsed.
+    :return: The list of tokens, or None if anything at all was out of
+        the ordinary.
+    """
+    result = []  # type: List[Token]
+    append = result.append
+    depth = 0
+    i = 0
+    end = len(s)
+    # Leading whitespace, or nothing but
+    if BLANK.match(s).end() == end:
+        return result
+    start = True
+    while True:
+        if start:
+            match = EXPR_START.match(s, i)
+            if match is None:
+                return None
+            i = match.end()
+            integer, paren, sign = match.groups()
+            if integer is not None:
+                append(int(integer))
+                start = False
+            elif paren is not None:
+                append('(')
+                depth += 1
+            else:
+                append(OPERATORS['p'] if sign == '+' else OPERATORS['m'])
+        else:
+            match = EXPR_END.match(s, i)
+            if match is None:
+                return None
+            i = match.end()
+            suffix, paren, binary, die = match.groups()
+            if suffix is not None:
+                append(OPERATORS['!'])
+            elif paren is not None:
+                if depth == 0:
+                    return None
+                append(')')
+                depth -= 1
+            elif binary is not None:
+                append(OPERATORS[binary])
+                start = True
+            elif die is not None:
+                append(OPERATORS[die])
+                match = DIE_SIDES.match(s, i)
+                if match is None:
+                    return None
+                i = match.end()
+                integer, paren, _, fudge = match.groups()
+                if integer is not None:
+                    append(int(integer))
+                elif paren is not None:
+                    append('(')
+                    depth += 1
+                    start = True
+                elif fudge is not None:
+                    append((-1, 0, 1))
+                else:
+                    sides = []
+                    while True:
+                        match = LIST_VALUE.match(s, i)
+                        if match is None:
+                            return None
+                        i = match.end()
+                        try:
+                            sides.append(float(match.group(1)))
+                        except ValueError:
+                            return None
+                        if match.group(2) == ']':
+                            break
+                    append(tuple(sides))
+            else:
+                # Only the end of the string is left
+                return result if depth == 0 else None
 
 
 def tokens_lazy(s: str) -> Iterable[Token]:
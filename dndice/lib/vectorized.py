@@ -0,0 +1,367 @@
+"""Roll one expression many times at once with NumPy.
+
+Rolling an expression a million times through ``basic`` means a million
+trips through the tree walk, each rolling its dice one at a time. This
+module instead evaluates the tree a single time over whole arrays
+of trials. A set of dice becomes a ``Pool``, a two-dimensional array
+with one row per trial and one column per die, alongside a mask of
+which dice are still active (to handle discards, and trials that roll
+different numbers of dice). Every operator then works on entire arrays:
+
+- Rolls draw all of their dice in one call to the generator.
+- ``h`` and ``l`` rank the dice in each row with a partial sort.
+- ``t``, ``T``, ``f``, and ``c`` are plain elementwise comparisons.
+- Rerolls draw fresh dice and keep them wherever the condition holds.
+  Rerolling until clear draws each replacement just once, from the
+  faces that don't meet the condition, like ``reroll_unconditional``.
+- Everything else collapses pools to their per-trial totals and does
+  elementwise arithmetic.
+
+NumPy is an optional dependency. It can be installed along with this
+package as the ``batch`` extra. Note that the results are machine
+numbers, so unlike the normal evaluation, ridiculously large results
+can overflow.
+"""
+import math
+import typing
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from .evaltree import EvalTree, EvalTreeNode
+from .exceptions import ArgumentTypeError, ArgumentValueError, EvaluationError
+from .helpers import wrap_exceptions_with
+from .operators import (UNTIL_CLEAR, FaceRange, reroll_unconditional_higher,
+                        reroll_unconditional_lower, reroll_unconditional_on, surviving_faces)
+
+
+class Pool:
+    """A batch of rolls, holding one row of dice for each trial."""
+    __slots__ = 'values', 'active', 'die'
+
+    def __init__(self, values: 'numpy.ndarray', active: 'numpy.ndarray', die):
+        """Create a new pool of dice.
+
+        :param values: The two-dimensional array of the values rolled.
+        :param active: A boolean array of the same shape that says which
+            of the values are counted.
+        :param die: The sides of the die that was rolled. This can be an
+            int or tuple like for a ``Roll``, or an array of per-trial
+            numbers of sides.
+        """
+        self.values = values
+        self.active = active
+        self.die = die
+
+    def total(self) -> 'numpy.ndarray':
+        """Sum the active dice in each trial."""
+        return numpy.where(self.active, self.values, 0).sum(axis=1)
+
+    def count(self) -> 'numpy.ndarray':
+        """Count the active dice in each trial."""
+        return self.active.sum(axis=1)
+
+
+def evaluate_batch(tree: EvalTree, number: int, rng=None) -> 'numpy.ndarray':
+    """Roll the expression in a tree many times over.
+
+    :param tree: The expression to roll.
+    :param number: How many times to roll it.
+    :param rng: A NumPy ``Generator``, or anything that can seed one.
+        If not given, a freshly seeded generator is used.
+    :return: A one-dimensional array of the results of each roll.
+    :raises ImportError: If NumPy is not installed.
+    :raises EvaluationError: If the roll fails.
+    """
+    if numpy is None:
+        raise ImportError("NumPy is required to roll in batches. Install it directly or through "
+                          "the 'batch' extra of this package.")
+    return _Batch(numpy.random.default_rng(rng), number).evaluate(tree)
+
+
+class _Batch:
+    """Holds the generator and size of one batch evaluation."""
+    __slots__ = 'rng', 'size'
+
+    def __init__(self, rng: 'numpy.random.Generator', size: int):
+        self.rng = rng
+        self.size = size
+
+    @wrap_exceptions_with(EvaluationError, 'Failed to evaluate expression.')
+    def evaluate(self, tree: EvalTree) -> 'numpy.ndarray':
+        if tree.root is None:
+            final = 0
+        else:
+            with numpy.errstate(divide='raise', invalid='raise'):
+                final = _scalar(self.__walk(tree.root))
+        return numpy.broadcast_to(numpy.asarray(final), (self.size,)).copy()
+
+    def __walk(self, root: EvalTreeNode):
+        """Compute the value of every node, children before their parents."""
+        done = []
+        stack = [(root, False)]  # type: typing.List[typing.Tuple[EvalTreeNode, bool]]
+        while stack:
+            node, expanded = stack.pop()
+            if node is None:
+                done.append(None)
+            elif node.is_leaf():
+                done.append(node.payload)
+            elif expanded:
+                right = done.pop()
+                left = done.pop()
+                code = getattr(node.payload, 'code', None)
+                if code not in _KERNELS:
+                    raise ArgumentTypeError("The operator {} can't be rolled in "
+                                            "batches.".format(node.payload))
+                done.append(_KERNELS[code](self, left, right))
+            else:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+        return done.pop()
+
+    def draw(self, sides, shape: typing.Tuple[int, int]) -> 'numpy.ndarray':
+        """Roll an array of dice of the given shape."""
+        if isinstance(sides, tuple):
+            return self.rng.choice(numpy.asarray(sides), size=shape)
+        high = _column(sides)
+        if not numpy.issubdtype(high.dtype, numpy.integer):
+            raise ArgumentTypeError("You can't roll a die with sides: {}".format(sides))
+        return self.rng.integers(1, high, size=shape, endpoint=True)
+
+    def roll(self, number, sides, factor=1) -> Pool:
+        """Roll ``number`` dice in every trial."""
+        counts = _integers(_scalar(number), 'number') * factor
+        counts = numpy.broadcast_to(numpy.maximum(counts, 0), (self.size,))
+        width = int(counts.max()) if self.size else 0
+        active = numpy.arange(width) < counts[:, None]
+        if isinstance(sides, Pool):
+            # Yeah this can happen, see 2d(1d4)
+            sides = sides.total()
+        return Pool(self.draw(sides, (self.size, width)), active, sides)
+
+    def fill(self, number, sides, value) -> Pool:
+        """Make a pool of dice that all come up as the same value."""
+        counts = _integers(_scalar(number), 'number')
+        counts = numpy.broadcast_to(numpy.maximum(counts, 0), (self.size,))
+        width = int(counts.max()) if self.size else 0
+        active = numpy.arange(width) < counts[:, None]
+        values = numpy.broadcast_to(_column(value), (self.size, width)).copy()
+        return Pool(values, active, sides)
+
+    def reroll(self, pool: Pool, condition: typing.Callable) -> Pool:
+        """Reroll the dice in a pool that meet a condition, once."""
+        values = pool.values
+        redo = pool.active & condition(values)
+        if redo.any():
+            values = numpy.where(redo, self.draw(pool.die, values.shape), values)
+        return Pool(values, pool.active, pool.die)
+
+    def reroll_until_clear(self, pool: Pool, target, comp: typing.Callable) -> Pool:
+        """Reroll the dice in a pool that meet a condition until none do.
+
+        Each die that meets the condition is replaced by a single draw
+        from the faces of its die that don't, so this never loops.
+
+        :param comp: The comparison, as ``reroll_unconditional`` takes it.
+        :raises ArgumentValueError: If every face of a die in some trial
+            meets the condition.
+        """
+        values = pool.values.copy()
+        redo = pool.active & comp(values, _column(target))
+        targets = numpy.broadcast_to(numpy.asarray(target), (self.size,))
+        if isinstance(pool.die, tuple):
+            dice = numpy.zeros(self.size, dtype=int)
+        else:
+            dice = numpy.broadcast_to(numpy.asarray(pool.die), (self.size,))
+        # The trials are grouped by their die and target, which are
+        # almost always the same across the whole batch
+        for die in numpy.unique(dice):
+            trials = dice == die
+            for aim in numpy.unique(targets[trials]):
+                group = trials & (targets == aim)
+                faces = surviving_faces(pool.die if isinstance(pool.die, tuple) else die.item(),
+                                        aim.item(), comp)
+                replace = redo & group[:, None]
+                size = int(replace.sum())
+                if isinstance(faces, FaceRange):
+                    # Picked by index, so the faces are never listed out
+                    values[replace] = faces.face(self.rng.integers(0, len(faces), size=size))
+                else:
+                    values[replace] = self.rng.choice(numpy.asarray(faces), size=size)
+        return Pool(values, pool.active, pool.die)
+
+
+def _column(value) -> 'numpy.ndarray':
+    """Shape a per-trial array so that it broadcasts against a pool."""
+    value = numpy.asarray(value)
+    if value.ndim == 1:
+        return value[:, None]
+    return value
+
+
+def _scalar(value):
+    """Collapse a value into one number per trial."""
+    if isinstance(value, Pool):
+        return value.total()
+    if isinstance(value, tuple):
+        return sum(value)
+    if isinstance(value, (numpy.ndarray, numpy.generic)) and value.dtype == numpy.bool_:
+        # Comparisons are numbers to the rest of the package, and numpy
+        # would treat addition of booleans as a logical or
+        return value.astype(numpy.int64)
+    return value
+
+
+def _integers(value, name: str) -> 'numpy.ndarray':
+    array = numpy.asarray(value)
+    if not numpy.issubdtype(array.dtype, numpy.integer):
+        fmt = "Expecting {name} to be an integer, was {realtyp} instead."
+        raise ArgumentTypeError(fmt.format(name=name, realtyp=array.dtype))
+    return array
+
+
+def _pool(value) -> Pool:
+    if not isinstance(value, Pool):
+        raise ArgumentTypeError("Expecting a roll, got {} instead.".format(type(value)))
+    return value
+
+
+def _take(pool, number, high: bool) -> Pool:
+    pool = _pool(pool)
+    keep = _integers(_scalar(number), 'number')
+    width = pool.values.shape[1]
+    fill = -numpy.inf if high else numpy.inf
+    keys = numpy.where(pool.active, pool.values, fill).astype(float)
+    if high:
+        keys = -keys
+    if keep.ndim == 0:
+        k = int(keep)
+        if k <= 0:
+            kept = numpy.zeros_like(pool.active)
+        elif k >= width:
+            kept = pool.active
+        else:
+            chosen = numpy.argpartition(keys, k - 1, axis=1)[:, :k]
+            kept = numpy.zeros_like(pool.active)
+            numpy.put_along_axis(kept, chosen, True, axis=1)
+    else:
+        order = numpy.argsort(keys, axis=1, kind='stable')
+        ranks = numpy.empty_like(order)
+        numpy.put_along_axis(ranks, order, numpy.arange(width)[None, :], axis=1)
+        kept = ranks < keep[:, None]
+    return Pool(pool.values, pool.active & kept, pool.die)
+
+
+def _threshold(pool, threshold, comparison) -> Pool:
+    pool = _pool(pool)
+    target = _column(_integers(_scalar(threshold), 'threshold'))
+    return Pool(comparison(pool.values, target).astype(numpy.int64), pool.active, pool.die)
+
+
+def _clamp(pool, bound, clamp) -> Pool:
+    pool = _pool(pool)
+    values = numpy.where(pool.active, clamp(pool.values, _column(_scalar(bound))), pool.values)
+    return Pool(values, pool.active, pool.die)
+
+
+def _reroll(batch: _Batch, pool, target, comparison) -> Pool:
+    pool = _pool(pool)
+    target = _column(_scalar(target))
+    return batch.reroll(pool, lambda values: comparison(values, target))
+
+
+def _until_clear(function: typing.Callable):
+    """Make the kernel for one of the operators that reroll until clear."""
+    comparison = UNTIL_CLEAR[function]
+    return lambda batch, left, right: batch.reroll_until_clear(_pool(left), _scalar(right),
+                                                               comparison)
+
+
+def _average(batch: _Batch, number, sides) -> Pool:
+    if isinstance(sides, Pool):
+        value = sides.total() / sides.count()
+    elif isinstance(sides, tuple):
+        value = sum(sides) / len(sides)
+    else:
+        value = (numpy.asarray(sides) + 1) / 2
+    return batch.fill(number, sides, value)
+
+
+def _maximum(batch: _Batch, number, sides) -> Pool:
+    if isinstance(sides, Pool):
+        value = numpy.where(sides.active, sides.values, -numpy.inf).max(axis=1)
+    elif isinstance(sides, tuple):
+        value = max(sides)
+    else:
+        value = sides
+    return batch.fill(number, sides, value)
+
+
+def _factorial(value):
+    value = _integers(value, 'number')
+    if numpy.any(value < 0):
+        raise ArgumentValueError("Factorial is undefined for negative numbers.")
+    unique, inverse = numpy.unique(value, return_inverse=True)
+    table = numpy.array([math.factorial(int(v)) for v in unique.flat], dtype=numpy.int64)
+    return table[inverse].reshape(value.shape)
+
+
+def _power(x, y):
+    x = numpy.asarray(x)
+    y = numpy.asarray(y)
+    if numpy.issubdtype(y.dtype, numpy.integer) and numpy.any(y < 0):
+        # Python gives back a fraction here while numpy refuses
+        x = x.astype(float)
+    return numpy.power(x, y)
+
+
+def _binary(function):
+    """Adapt an elementwise function to collapse both of its operands first."""
+    return lambda batch, left, right: _scalar(function(_scalar(left), _scalar(right)))
+
+
+_KERNELS = {
+    '!': lambda batch, left, right: _factorial(_scalar(left)),
+    'd': lambda batch, left, right: batch.roll(left, right),
+    'da': _average,
+    'dc': lambda batch, left, right: batch.roll(left, right, factor=2),
+    'dm': _maximum,
+    'h': lambda batch, left, right: _take(left, right, high=True),
+    'l': lambda batch, left, right: _take(left, right, high=False),
+    'f': lambda batch, left, right: _clamp(left, right, numpy.maximum),
+    'c': lambda batch, left, right: _clamp(left, right, numpy.minimum),
+    'r': lambda batch, left, right: _reroll(batch, left, right, numpy.equal),
+    'R': _until_clear(reroll_unconditional_on),
+    'r<': lambda batch, left, right: _reroll(batch, left, right, numpy.less),
+    'R<': _until_clear(reroll_unconditional_lower),
+    'rl': lambda batch, left, right: _reroll(batch, left, right, numpy.less),
+    'Rl': _until_clear(reroll_unconditional_lower),
+    'r>': lambda batch, left, right: _reroll(batch, left, right, numpy.greater),
+    'R>': _until_clear(reroll_unconditional_higher),
+    'rh': lambda batch, left, right: _reroll(batch, left, right, numpy.greater),
+    'Rh': _until_clear(reroll_unconditional_higher),
+    't': lambda batch, left, right: _threshold(left, right, numpy.greater_equal),
+    'T': lambda batch, left, right: _threshold(left, right, numpy.less_equal),
+    '^': _binary(_power),
+    'm': lambda batch, left, right: numpy.negative(_scalar(right)),
+    'p': lambda batch, left, right: numpy.positive(_scalar(right)),
+    '*': _binary(numpy.multiply),
+    '/': _binary(numpy.true_divide),
+    '%': _binary(numpy.mod),
+    '-': _binary(numpy.subtract),
+    '+': _binary(numpy.add),
+    '>': _binary(numpy.greater),
+    'gt': _binary(numpy.greater),
+    '>=': _binary(numpy.greater_equal),
+    'ge': _binary(numpy.greater_equal),
+    '<': _binary(numpy.less),
+    'lt': _binary(numpy.less),
+    '<=': _binary(numpy.less_equal),
+    'le': _binary(numpy.less_equal),
+    '=': _binary(numpy.equal),
+    '|': _binary(lambda x, y: numpy.where(numpy.asarray(x) != 0, x, y)),
+    '&': _binary(lambda x, y: numpy.where(numpy.asarray(x) == 0, x, y)),
+} if numpy is not None else {}
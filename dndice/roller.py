@@ -2,7 +2,7 @@
 import argparse
 import sys
 
-from dndice import verbose, basic, Mode, compile
+from dndice import verbose, basic, basic_many, Mode, compile
 
 
 def parse() -> argparse.Namespace:
@@ -22,6 +22,9 @@ def parse() -> argparse.Namespace:
 
     parser.add_argument('-n', '--number', default=1, type=int,
                         help='roll each expression this many times')
+    parser.add_argument('-b', '--batch', action='store_true',
+                        help='roll all repetitions at once, which is much faster for large numbers '
+                             'of rolls (requires numpy, ignored in verbose mode)')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='roll in verbose mode, showing the results of each dice roll')
     parser.add_argument('-w', '--wrap', default=80, type=int,
@@ -48,8 +51,11 @@ def main():
     for expr in args.expression:
         length = 0
         compiled = compile(expr)
-        for each in range(args.number):
-            val = func(compiled, mode)
+        if args.batch and not args.verbose:
+            values = basic_many(compiled, args.number, mode).tolist()
+        else:
+            values = (func(compiled, mode) for _ in range(args.number))
+        for val in values:
             s = "{} ".format(val)
             if wrap > 0:
                 length += len(s)
@@ -5,3 +5,33 @@ resolve import path problems. Running the nose script from the project
 root will set the python path to look at the package as an external
 import would.
 """
+import itertools
+import random as builtin_random
+from unittest import mock
+
+from dndice.lib.evaltree import EvalTree, EvalTreeNode
+
+
+def trees_equal(a: EvalTree, b: EvalTree) -> bool:
+    for nodeA, nodeB in itertools.zip_longest(a.pre_order(), b.pre_order(),
+                                              fillvalue=EvalTreeNode(None)):
+        if nodeA.payload != nodeB.payload:
+            return False
+    return True
+
+
+class SeededRandomMixin:
+    """Roll the dice of a test case from a generator that it can seed.
+
+    The global generator used by the operators is patched for the length
+    of each test. Mix this in ahead of ``unittest.TestCase``.
+    """
+    def setUp(self) -> None:
+        patcher = mock.patch('dndice.lib.operators.random')
+        self.addCleanup(patcher.stop)
+        self.randomMocker = patcher.start()
+
+    def seed(self, seed: int) -> None:
+        source = builtin_random.Random(seed)
+        self.randomMocker.randint = source.randint
+        self.randomMocker.choice = source.choice
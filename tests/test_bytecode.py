@@ -0,0 +1,85 @@
+import unittest
+
+from dndice import basic, compile, Engine
+from dndice.lib.bytecode import Program, OPCODES
+from dndice.lib.evaltree import EvalTree, EvalTreeNode
+from dndice.lib.exceptions import EvaluationError, InputTypeError
+from dndice.lib.operators import Operator
+from tests import SeededRandomMixin
+from tests.test_compiler import EXPRESSIONS
+
+
+class BytecodeTester(SeededRandomMixin, unittest.TestCase):
+    def test_layout(self):
+        program = Program.from_tree(EvalTree('3d4+3'))
+        self.assertEqual(program.constants, (3, 4))
+        self.assertEqual(list(program.code), [~0, ~1, OPCODES.index('d'), ~0, OPCODES.index('+')])
+
+    def test_unary_layout(self):
+        program = Program.from_tree(EvalTree('-4!'))
+        self.assertEqual(program.constants, (None, 4))
+        self.assertEqual(list(program.code),
+                         [~0, ~1, ~0, OPCODES.index('!'), OPCODES.index('m')])
+
+    def test_identical_results(self):
+        for expr in EXPRESSIONS:
+            for seed in range(20):
+                self.seed(seed)
+                expected = EvalTree(expr).evaluate()
+                self.seed(seed)
+                actual = Program.from_tree(EvalTree(expr)).evaluate()
+                self.assertEqual(expected, actual, '{} differed with seed {}'.format(expr, seed))
+
+    def test_roundtrip(self):
+        for expr in EXPRESSIONS:
+            tree = EvalTree(expr)
+            program = Program.from_tree(tree)
+            self.assertEqual(repr(program.to_tree()), repr(tree))
+            self.assertEqual(Program.from_tree(program.to_tree()), program)
+
+    def test_verbose(self):
+        for expr in EXPRESSIONS:
+            self.seed(5)
+            tree = EvalTree(expr)
+            tree.evaluate()
+            self.seed(5)
+            annotated = Program.from_tree(EvalTree(expr)).annotated()
+            self.assertEqual(annotated.verbose_result(), tree.verbose_result())
+
+    def test_deep(self):
+        terms = 5000
+        tree = EvalTree('+'.join(['1'] * terms))
+        self.assertEqual(tree.evaluate(), terms)
+        self.assertEqual(Program.from_tree(tree).evaluate(), terms)
+        self.assertEqual(basic(compile('+'.join(['1'] * terms), engine=Engine.BYTECODE)), terms)
+
+    def test_errors(self):
+        with self.assertRaises(EvaluationError):
+            Program.from_tree(EvalTree('2d20h(7/2)')).evaluate()
+        with self.assertRaises(EvaluationError):
+            Program.from_tree(EvalTree('2d20h(7/2)')).trace()
+
+    def test_unregistered(self):
+        tree = EvalTree(None)
+        tree.root = EvalTreeNode(Operator('?', 1, lambda x, y: x), EvalTreeNode(1), EvalTreeNode(2))
+        with self.assertRaises(InputTypeError):
+            Program.from_tree(tree)
+
+    def test_empty(self):
+        program = Program.from_tree(EvalTree(None))
+        self.assertEqual(len(program), 0)
+        self.assertEqual(program.evaluate(), 0)
+        self.assertEqual(program.trace(), [])
+        self.assertIsNone(program.to_tree().root)
+
+    def test_compile_engine(self):
+        tree = compile('3d4+2', engine=Engine.BYTECODE)
+        self.assertIsInstance(tree.evaluator, Program)
+        self.seed(3)
+        expected = EvalTree('3d4+2').evaluate()
+        self.seed(3)
+        self.assertEqual(basic(tree), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import threading
+import unittest
+
+from dndice import basic, cache_clear, cache_info, Mode, set_cache_size, verbose
+from dndice.lib.cache import CacheInfo, LRUCache
+from dndice.lib.exceptions import ParseError
+from tests import SeededRandomMixin
+
+
+class LRUCacheTester(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = LRUCache(2)
+        self.assertEqual(cache.get('a', lambda: 1), 1)
+        self.assertEqual(cache.get('a', lambda: 2), 1)
+        self.assertEqual(cache.info(), CacheInfo(1, 1, 0, 1, 2))
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.get('a', lambda: 1)
+        cache.get('b', lambda: 2)
+        cache.get('a', lambda: 1)
+        cache.get('c', lambda: 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.info().evictions, 1)
+
+    def test_resize(self):
+        cache = LRUCache(3)
+        for key in 'abc':
+            cache.get(key, lambda: key)
+        cache.resize(1)
+        self.assertEqual(len(cache), 1)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.info(), CacheInfo(0, 3, 2, 1, 1))
+        self.assertRaises(ValueError, cache.resize, -1)
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.get('a', lambda: 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_failed_build(self):
+        cache = LRUCache()
+
+        def fail():
+            raise KeyError
+
+        self.assertRaises(KeyError, cache.get, 'a', fail)
+        self.assertNotIn('a', cache)
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.get('a', lambda: 1)
+        cache.clear()
+        self.assertEqual(cache.info(), CacheInfo(0, 0, 0, 0, 1024))
+
+    def test_threads(self):
+        cache = LRUCache(8)
+
+        def work():
+            for i in range(200):
+                cache.get(i % 16, lambda: i)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        info = cache.info()
+        self.assertEqual(info.hits + info.misses, 800)
+        self.assertLessEqual(info.size, 8)
+
+
+class ParseCacheTester(SeededRandomMixin, unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        cache_clear()
+        self.addCleanup(cache_clear)
+        self.addCleanup(set_cache_size, cache_info().maxsize)
+        self.seed(0)
+
+    def test_reuse(self):
+        basic('1d20+5')
+        basic('1d20+5')
+        verbose('1d20+5')
+        info = cache_info()
+        self.assertEqual((info.hits, info.misses, info.size), (2, 1, 1))
+
+    def test_same_results(self):
+        for expr in ['4d6h3', '1d20+5', '10d4r1', '2d(1d4)', '1d[1,2,3]']:
+            self.seed(1)
+            first = basic(expr)
+            self.seed(1)
+            self.assertEqual(basic(expr), first)
+
+    def test_modes_do_not_leak(self):
+        basic('4d6h3')
+        self.assertEqual(basic('4d6h3', Mode.MAX), 18)
+        self.assertEqual(verbose('4d6h3', Mode.MAX), '[d6: 6, 6, 6; (6)] = 18')
+        self.randomMocker.randint = lambda a, b: 2
+        self.assertEqual(basic('4d6h3'), 6)
+        self.assertEqual(verbose('4d6h3'), '[d6: 2, 2, 2; (2)] = 6')
+
+    def test_verbose_fresh(self):
+        self.randomMocker.randint = lambda a, b: 1
+        self.assertEqual(verbose('1d4', modifiers=2), '[d4: 1]+2 = 3')
+        self.randomMocker.randint = lambda a, b: 3
+        self.assertEqual(verbose('1d4'), '[d4: 3] = 3')
+
+    def test_size(self):
+        set_cache_size(2)
+        for expr in ['1d4', '1d6', '1d8']:
+            basic(expr)
+        info = cache_info()
+        self.assertEqual((info.size, info.maxsize, info.evictions), (2, 2, 1))
+        set_cache_size(0)
+        basic('1d4')
+        self.assertEqual(cache_info().size, 0)
+
+    def test_errors_not_cached(self):
+        self.assertRaises(ParseError, basic, '1d')
+        self.assertRaises(ParseError, basic, '1d')
+        self.assertEqual(cache_info().size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import random as builtin_random
+import statistics
+import unittest
+from unittest import mock
+
+from dndice import basic, compile, Engine
+from dndice.lib.bytecode import Program
+from dndice.lib.compiler import lower, lower_tree
+from dndice.lib.evaltree import EvalTree, EvalTreeNode
+from dndice.lib.exceptions import EvaluationError
+from dndice.lib.operators import OPERATORS, Operator, Roll
+from dndice.lib.rng import BufferedRandom
+from tests import SeededRandomMixin
+
+EXPRESSIONS = [
+    "1d4+1", "1d4-1", "2d20h1", "2d20l1", "40d20r1h1", "10d4r1", "10d4R1", "1d4d4d4",
+    "-5", "+1d4", "2*-1d4", "-2^1d4", "8d6/2", "1+(1+4)d6", "(1d6)!", "1d6!", "1d100<14",
+    "1d100<=18", "8d6f2", "1d20+5>10", "5d20r<15", "5d20R<15", "(1d4-1)&(1d3-2>0)",
+    "(1d4-1)|(1d3-2>0)", "1dc8+1dc4+3", "1dm6+1d6", "2d4c2", "2da6", "3da6", "2d10%2",
+    "1d4=4|1d4=3", "1d8>=6", "10d8r>4", "10d8R>4", "10d[3,3,3,5]", "15d6t5", "15d6T1",
+    "2d(1d4)", "3d[0.1,0.2,0.7]", "4dF", "(2+3)*4", "2^3^2", "1d6 gt 3", "",
+    "1d4+2+3d6h2+1d[0.1,0.2]+1", "2*1d4*(1d6+1)*3", "1d4+(1d6+1d8+2)+1d10",
+]
+# Lowering draws these counts of successes in one go, so they only come
+# out like the tree walker in distribution
+SUCCESS_COUNTS = {"15d6t5", "15d6T1"}
+
+
+class CompilerTester(SeededRandomMixin, unittest.TestCase):
+    def test_identical_results(self):
+        for expr in set(EXPRESSIONS) - SUCCESS_COUNTS:
+            for seed in range(20):
+                self.seed(seed)
+                expected = EvalTree(expr).evaluate()
+                self.seed(seed)
+                actual = lower(EvalTree(expr).root)()
+                self.assertEqual(expected, actual, '{} differed with seed {}'.format(expr, seed))
+
+    def test_does_not_annotate(self):
+        self.seed(0)
+        tree = EvalTree('1d20+4')
+        lower(tree.root)()
+        for node in tree.pre_order():
+            self.assertIsNone(node.value)
+
+    def test_empty(self):
+        self.assertEqual(lower(None)(), 0)
+
+    def test_errors(self):
+        with self.assertRaises(EvaluationError):
+            lower(EvalTree('2d20h(7/2)').root)()
+        with self.assertRaises(EvaluationError):
+            lower(EvalTree('1/0').root)()
+
+    def test_malformed(self):
+        tree = EvalTree(None)
+        tree.root = EvalTreeNode(OPERATORS['+'], EvalTreeNode(1))
+        with self.assertRaises(EvaluationError):
+            lower(tree.root)()
+
+    def test_custom_operator(self):
+        pair = Operator('&', 1, lambda x, y: (x, y))
+        tree = EvalTree(None)
+        tree.root = EvalTreeNode(OPERATORS['+'],
+                                 EvalTreeNode(pair, EvalTreeNode(1), EvalTreeNode(2)),
+                                 EvalTreeNode(3))
+        self.assertEqual(lower(tree.root)(), tree.evaluate())
+
+    def test_compile_engine(self):
+        tree = compile('3d4+2', engine=Engine.CLOSURE)
+        self.assertIsNotNone(tree.evaluator)
+        self.assertIsNone(compile('3d4+2').evaluator)
+        self.seed(3)
+        expected = EvalTree('3d4+2').evaluate() + 1
+        self.seed(3)
+        self.assertEqual(basic(tree, modifiers=1), expected)
+
+    def test_mode_drops_evaluator(self):
+        self.randomMocker.randint = lambda start, end: 4
+        tree = compile('3d4', engine=Engine.CLOSURE)
+        tree.critify()
+        self.assertIsNone(tree.evaluator)
+        self.assertEqual(basic(tree), 24)
+
+    def test_sum_only(self):
+        for expr in ['100d6+20', '1d20', '(2d4)d6*2', '-3d8', '0d6+1', '2d6+1d[1,2]']:
+            for seed in range(5):
+                expected = EvalTree(expr).evaluate(builtin_random.Random(seed))
+                actual = lower(EvalTree(expr).root)(builtin_random.Random(seed))
+                self.assertEqual(expected, actual, '{} differed with seed {}'.format(expr, seed))
+                expected = EvalTree(expr).evaluate(BufferedRandom(seed))
+                actual = lower(EvalTree(expr).root)(BufferedRandom(seed))
+                self.assertEqual(expected, actual, '{} differed with seed {}'.format(expr, seed))
+
+    def test_sum_only_skips_roll(self):
+        self.randomMocker.randint = mock.Mock(return_value=3)
+        with mock.patch.object(Roll, '__init__', side_effect=AssertionError):
+            self.assertEqual(lower(EvalTree('100d6+20').root)(), 320)
+            self.assertEqual(lower(EvalTree('4d6').root)(), 12)
+        self.assertEqual(self.randomMocker.randint.call_count, 104)
+
+    def test_success_counts(self):
+        for expr in ['15d6t5', '15d6T1', '60d10t8+1', '2*8d4T3', '(1d4)d6t4', '6d6t0', '6d6t7']:
+            rng = builtin_random.Random(6)
+            rolled = [EvalTree(expr).evaluate(rng) for _ in range(2000)]
+            lowered = lower(EvalTree(expr).root)
+            drawn = [lowered(rng) for _ in range(2000)]
+            spread = max(statistics.pstdev(rolled), 0.1)
+            self.assertAlmostEqual(statistics.mean(drawn), statistics.mean(rolled),
+                                   delta=spread / 10, msg=expr)
+            self.assertAlmostEqual(statistics.pstdev(drawn), statistics.pstdev(rolled),
+                                   delta=spread / 10, msg=expr)
+
+    def test_success_count_no_sides(self):
+        for expr in ['3d0t1', '3d0T1', '3d(-2)t1']:
+            with self.assertRaises(EvaluationError, msg=expr):
+                lower(EvalTree(expr).root)()
+            with self.assertRaises(EvaluationError, msg=expr):
+                basic(expr)
+
+    def test_success_count_single_draw(self):
+        self.randomMocker.randint = mock.Mock(return_value=0)
+        with mock.patch.object(Roll, '__init__', side_effect=AssertionError):
+            self.assertEqual(lower(EvalTree('15d6t5').root)(), 0)
+        self.assertEqual(self.randomMocker.randint.call_count, 1)
+        with self.assertRaises(EvaluationError):
+            lower(EvalTree('(7/2)d6t5').root)()
+
+    def test_sum_only_keeps_dice(self):
+        # Dice that something else looks at must still be rolled in full
+        self.randomMocker.randint = lambda start, end: end
+        self.assertEqual(lower(EvalTree('4d6h3').root)(), 18)
+        self.assertEqual(lower(EvalTree('4d6l1').root)(), 6)
+
+    def test_chains(self):
+        # Long sums are added up in a loop, in the same order as the tree
+        self.seed(0)
+        tree = EvalTree('1d6')
+        for _ in range(4999):
+            tree += EvalTree('1d6+1')
+        expected = tree.evaluate()
+        self.seed(0)
+        self.assertEqual(lower(tree.root)(), expected)
+        fractions = '+'.join(['1/3'] * 10 + ['1/7'] * 10)
+        self.assertEqual(lower(EvalTree(fractions).root)(), EvalTree(fractions).evaluate())
+        products = '*'.join(['(11/10)'] * 30)
+        self.assertEqual(lower(EvalTree(products).root)(), EvalTree(products).evaluate())
+
+    def test_lower_tree(self):
+        self.assertNotIsInstance(lower_tree(EvalTree('4d6h3')), Program)
+        # Too deep to lower, so it falls back to the bytecode engine
+        tree = EvalTree('20' + '-1d4' * 5000)
+        with self.assertRaises(RecursionError):
+            lower(tree.root)
+        self.seed(0)
+        expected = tree.evaluate()
+        self.seed(0)
+        self.assertEqual(lower_tree(tree)(), expected)
+
+    def test_chains_keep_verbose(self):
+        tree = compile('1d4+2+3d6+1', engine=Engine.CLOSURE)
+        self.randomMocker.randint = lambda start, end: 2
+        self.assertEqual(basic(tree), 11)
+        self.assertEqual(tree.verbose_result(), '[d4: 2]+2+[d6: 2, 2, 2]+1 = 11')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+from fractions import Fraction
+from unittest import mock
+
+from dndice import compile, distribution, Mode
+from dndice.lib.distribution import Distribution
+from dndice.lib.evaltree import EvalTree
+from dndice.lib.exceptions import EvaluationError, InputTypeError
+
+
+class Enumerator:
+    """Stand in for the random module, walking through every possible sequence of rolls."""
+
+    def __init__(self):
+        self.pending = [[]]
+        self.choices = []
+        self.position = 0
+        self.weight = Fraction(1)
+
+    def start(self) -> bool:
+        if not self.pending:
+            return False
+        self.choices = self.pending.pop()
+        self.position = 0
+        self.weight = Fraction(1)
+        return True
+
+    def pick(self, options: int) -> int:
+        if self.position == len(self.choices):
+            self.choices.append(0)
+            for other in range(1, options):
+                self.pending.append(self.choices[:-1] + [other])
+        choice = self.choices[self.position]
+        self.position += 1
+        self.weight /= options
+        return choice
+
+    def randint(self, a, b):
+        return a + self.pick(b - a + 1)
+
+    def choice(self, seq):
+        return seq[self.pick(len(seq))]
+
+
+def enumerate_outcomes(expr: str) -> dict:
+    enumerator = Enumerator()
+    outcomes = {}
+    with mock.patch('dndice.lib.operators.random', enumerator):
+        while enumerator.start():
+            # Rolled in full, as lowering counts successes in a single draw
+            value = EvalTree(expr).evaluate()
+            outcomes[value] = outcomes.get(value, 0) + enumerator.weight
+    return outcomes
+
+
+class DistributionTester(unittest.TestCase):
+    def assertMatchesRolling(self, expr: str):
+        self.assertEqual(distribution(expr), enumerate_outcomes(expr), expr)
+
+    def test_constant(self):
+        self.assertEqual(distribution('2+3*4'), {14: 1})
+        self.assertEqual(distribution(5), {5: 1})
+        self.assertEqual(distribution(''), {0: 1})
+
+    def test_single_die(self):
+        self.assertEqual(distribution('1d4'), {1: Fraction(1, 4), 2: Fraction(1, 4),
+                                               3: Fraction(1, 4), 4: Fraction(1, 4)})
+        self.assertEqual(distribution('1d[1,1,3]'), {1: Fraction(2, 3), 3: Fraction(1, 3)})
+
+    def test_sums(self):
+        for expr in ['2d6', '3d4+1d6-2', '2d6*3', '1d20>10', '1d6^2', '-1d4', '1d4!',
+                     '1d6=1d6', '2dc4']:
+            self.assertMatchesRolling(expr)
+
+    def test_keep(self):
+        for expr in ['2d20h1', '2d20l1', '4d6h3', '5d4l2', '4d6h3l2', '3d6h0', '2d6h5']:
+            self.assertMatchesRolling(expr)
+
+    def test_per_die(self):
+        for expr in ['3d6r1', '2d6r<3', '2d6r>4', '3d6f2', '3d6c4', '4d6t5', '4d6T2',
+                     '2d6rh4', '2d6rl2', '2d6t5r1']:
+            self.assertMatchesRolling(expr)
+
+    def test_keep_then_per_die(self):
+        for expr in ['3d6h2r1', '3d6l2t4', '4d4h3f2', '3d4h2c3']:
+            self.assertMatchesRolling(expr)
+
+    def test_reroll_unconditional(self):
+        # Rolling can't be enumerated here as it never ends, so use the
+        # closed form: the die is conditioned on not being rerolled
+        self.assertEqual(distribution('1d6R<3'),
+                         {3: Fraction(1, 4), 4: Fraction(1, 4), 5: Fraction(1, 4),
+                          6: Fraction(1, 4)})
+        self.assertEqual(distribution('1d6R1'), distribution('1d5+1'))
+        self.assertEqual(distribution('2d6h1R>3').at_least(4), 0)
+
+    def test_rolled_dice(self):
+        for expr in ['(1d3)d4', '2d(1d4)', '1d(1d3+1)', '(1d2)d4h1', '2d4h(1d2)']:
+            self.assertMatchesRolling(expr)
+
+    def test_fixed_dice(self):
+        self.assertEqual(distribution('3da6'), {10.5: 1})
+        self.assertEqual(distribution('3dm6'), {18: 1})
+        self.assertEqual(distribution('3da6r3'), distribution('3da6'))
+        self.assertEqual(distribution('2dm6r6'), distribution('2d6'))
+
+    def test_modes(self):
+        self.assertEqual(distribution('4d6h3', Mode.MAX), {18: 1})
+        self.assertEqual(distribution('2d6', Mode.AVERAGE), {7.0: 1})
+        self.assertEqual(distribution('1d4', Mode.CRIT), distribution('2d4'))
+
+    def test_modifiers(self):
+        self.assertEqual(distribution('1d4', modifiers=2), distribution('1d4+2'))
+
+    def test_compiled(self):
+        tree = compile('4d6h3')
+        self.assertEqual(distribution(tree), distribution('4d6h3'))
+        distribution(tree, Mode.MAX)
+        self.assertEqual(distribution(tree), distribution('4d6h3'))
+
+    def test_summaries(self):
+        result = distribution('4d6h3')
+        self.assertIsInstance(result, Distribution)
+        self.assertEqual(sum(result.values()), 1)
+        self.assertEqual(result.mean(), Fraction(15869, 1296))
+        self.assertEqual(result.at_least(15), Fraction(25, 108))
+        self.assertEqual(result.at_most(14), 1 - result.at_least(15))
+        self.assertEqual(distribution('1d6').variance(), Fraction(35, 12))
+        self.assertEqual(list(result), sorted(result))
+
+    def test_errors(self):
+        self.assertRaises(EvaluationError, distribution, '1d6R<7')
+        self.assertRaises(EvaluationError, distribution, '1d1R1')
+        self.assertRaises(EvaluationError, distribution, '1d6/(1d2-1)')
+        self.assertRaises(EvaluationError, distribution, '3d6h2r1h1')
+        self.assertRaises(EvaluationError, distribution, '2dm(1d4)')
+        self.assertRaises(EvaluationError, distribution, '(1/2)d6')
+        self.assertRaises(InputTypeError, distribution, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,14 @@
-import itertools
 import unittest
+from unittest import mock
 
-from dndice import basic, Mode, compile, tokenize, verbose, tokenize_lazy
+from dndice import (basic, Engine, Mode, compile, tokenize, verbose, tokenize_lazy,
+                    set_trusted)
+from dndice.lib.bytecode import Program
 from dndice.lib.evaltree import EvalTree, EvalTreeNode
-from dndice.lib.exceptions import InputTypeError
+from dndice.lib.exceptions import (ArgumentTypeError, EvaluationError, InputTypeError,
+                                   RollError)
 from dndice.lib.operators import OPERATORS, random, Roll
-
-
-def trees_equal(a: EvalTree, b: EvalTree) -> bool:
-    for nodeA, nodeB in itertools.zip_longest(a.pre_order(), b.pre_order(),
-                                              fillvalue=EvalTreeNode(None)):
-        if nodeA.payload != nodeB.payload:
-            return False
-    return True
+from tests import trees_equal
 
 
 class TestCoreFunctions(unittest.TestCase):
@@ -31,6 +27,35 @@ class TestCoreFunctions(unittest.TestCase):
         with self.assertRaises(InputTypeError):
             basic([40, 2])
 
+    def test_mode_errors(self):
+        # Half a die is never rolled, whichever mode it is rolled in
+        for mode in Mode:
+            with self.subTest(mode=mode):
+                with self.assertRaises(EvaluationError):
+                    basic('(5/2)d6', mode=mode)
+                with self.assertRaises(EvaluationError):
+                    basic(compile('(5/2)d6'), mode=mode)
+                with self.assertRaises(EvaluationError):
+                    basic(compile('(5/2)d6', modes=[mode]), mode=mode)
+        with self.assertRaises(EvaluationError):
+            basic('(1d4)d6', mode=Mode.AVERAGE)
+        with mock.patch('dndice.core.fold_constants', side_effect=TypeError):
+            with self.assertRaises(EvaluationError):
+                basic(compile('1d6'), mode=Mode.MAX)
+
+    def test_mode_engine(self):
+        # Modes are rolled with the engine the tree was compiled with
+        for engine in Engine:
+            with self.subTest(engine=engine):
+                tree = compile('15d6t5', engine=engine)
+                expected = compile('15dc6t5', engine=engine)
+                self.assertEqual([basic(tree, Mode.CRIT, rng=seed) for seed in range(10)],
+                                 [basic(expected, rng=seed) for seed in range(10)])
+        bytecode = compile('1d6', engine=Engine.BYTECODE, modes=[Mode.CRIT])
+        self.assertIsInstance(bytecode.variants[Mode.CRIT], Program)
+        closure = compile('1d6', engine=Engine.CLOSURE, modes=[Mode.CRIT])
+        self.assertNotIsInstance(closure.variants[Mode.CRIT], Program)
+
     def test_compile(self):
         tree = compile('3d4')
         expected = EvalTree(None)
@@ -85,6 +110,59 @@ class TestCoreFunctions(unittest.TestCase):
         with self.assertRaises(InputTypeError):
             verbose([40, 2])
 
+    def test_shared_tree_untouched(self):
+        tree = compile('3d4+2')
+        self.assertEqual(basic(tree, mode=Mode.MAX), 14)
+        self.assertEqual(verbose(tree, mode=Mode.CRIT, modifiers=1),
+                         '[d4: 4, 4, 4, 4, 4, 4]+2+1 = 27')
+        self.assertEqual(basic(tree), 14)
+        self.assertEqual(tree.root.payload, OPERATORS['+'])
+        self.assertEqual(tree.root.left.payload, OPERATORS['d'])
+        self.assertTrue(all(node.value is None for node in tree.pre_order()))
+
+    def test_mode_variants(self):
+        tree = compile('3d4+2', modes=[Mode.CRIT])
+        self.assertEqual(set(tree.variants), {Mode.CRIT})
+        self.assertEqual(basic(tree, mode=Mode.CRIT), 26)
+        self.assertEqual(basic(tree, mode=Mode.MAX), 14)
+        self.assertEqual(set(tree.variants), {Mode.CRIT, Mode.MAX})
+        variant = tree.variants[Mode.MAX]
+        basic(tree, mode=Mode.MAX)
+        self.assertIs(tree.variants[Mode.MAX], variant)
+        # No randomness is left in the average or maximum
+        tree = compile('3d4h2+1d20*2')
+
+        class NoRandom:
+            def randint(self, a, b):
+                raise AssertionError('Rolled a die')
+
+            choice = randint
+
+        self.assertEqual(basic(tree, mode=Mode.AVERAGE, rng=NoRandom()), 26.0)
+        self.assertEqual(basic(tree, mode=Mode.MAX, rng=NoRandom()), 48)
+
+    def test_variants_follow_changes(self):
+        tree = compile('1d4')
+        self.assertEqual(basic(tree, mode=Mode.MAX), 4)
+        tree += EvalTree('1d6')
+        self.assertEqual(basic(tree, mode=Mode.MAX), 10)
+        tree.critify()
+        self.assertEqual(basic(tree, mode=Mode.MAX), 10)
+        self.assertEqual(basic(tree), 16)
+
+    def test_deep(self):
+        # Too deep to lower into closures, so rolled without recursing instead
+        expr = '20' + '-1d4' * 5000
+        self.assertEqual(basic(expr), 20 - 4 * 5000)
+        self.assertEqual(basic(expr, mode=Mode.MAX), 20 - 4 * 5000)
+        self.assertEqual(basic(compile(expr, engine=Engine.CLOSURE)), 20 - 4 * 5000)
+        self.assertTrue(verbose(expr).endswith(' = {}'.format(20 - 4 * 5000)))
+
+    def test_verbose_does_not_lower(self):
+        with mock.patch('dndice.core.lower_tree') as lower:
+            verbose('1d4+1d6+17')
+        lower.assert_not_called()
+
     def test_tokenize(self):
         self.assertEqual(tokenize('3d4+2'), [3, OPERATORS['d'], 4, OPERATORS['+'], 2])
 
@@ -149,5 +227,63 @@ class TestCoreFunctions(unittest.TestCase):
             next(iterator)
 
 
+class TestTrusted(unittest.TestCase):
+    def setUp(self) -> None:
+        patcher = mock.patch.object(random, 'randint', lambda start, end: 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(set_trusted, False)
+        set_trusted(True)
+
+    def test_same_results(self):
+        for expr in ['4d6h3', '3!+2', '1d20l1t3', '10d6T2', '2d6f3c5']:
+            for engine in Engine:
+                for optimize in (False, True):
+                    with self.subTest(expr=expr, engine=engine, optimize=optimize):
+                        tree = compile(expr, engine=engine, optimize=optimize)
+                        set_trusted(False)
+                        expected = basic(compile(expr, engine=engine, optimize=optimize))
+                        set_trusted(True)
+                        self.assertEqual(basic(tree), expected)
+        self.assertEqual(basic('4d6h3'), 12)
+        self.assertEqual(basic('4d6h3', mode=Mode.MAX), 18)
+
+    def test_checked_at_compile(self):
+        with self.assertRaises(ArgumentTypeError):
+            compile('5h2')
+        with self.assertRaises(ArgumentTypeError):
+            basic('1d6+3!h1')
+
+    def test_unchecked_while_rolling(self):
+        for engine in Engine:
+            with self.subTest(engine=engine):
+                tree = compile('4d6h(3/2)', engine=engine)
+                with self.assertRaises(Exception) as caught:
+                    basic(tree)
+                self.assertNotIsInstance(caught.exception, RollError)
+
+    def test_switch_off(self):
+        # Leaves a trusted tree in the cache, which must not be used once switched off
+        self.assertRaises(TypeError, basic, '4d6h(3/2)')
+        set_trusted(False)
+        for engine in Engine:
+            with self.subTest(engine=engine):
+                with self.assertRaises(EvaluationError):
+                    basic(compile('4d6h(3/2)', engine=engine))
+        with self.assertRaises(EvaluationError):
+            basic('4d6h(3/2)')
+
+    def test_copies_follow(self):
+        # Copied trees hold their own operators, which must switch along with the rest
+        tree = EvalTree('4d6h(3/2)').copy()
+        self.assertIsNot(tree.root.payload, OPERATORS['h'])
+        self.assertRaises(TypeError, basic, tree)
+        set_trusted(False)
+        self.assertRaises(EvaluationError, basic, tree)
+        with self.assertRaises(EvaluationError) as caught:
+            tree.evaluate()
+        self.assertIsInstance(caught.exception.__cause__, ArgumentTypeError)
+
+
 if __name__ == '__main__':
     unittest.main()
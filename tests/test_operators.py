@@ -1,3 +1,7 @@
+import collections
+import copy
+import pickle
+import random as builtin_random
 import unittest
 from unittest import mock
 
@@ -72,6 +76,52 @@ class TestOperator(unittest.TestCase):
         self.assertEqual(arityLeft(*leftOperand), (1, 2, 3))
         self.assertEqual(arityRight(*rightOperand), (4, 5, 6))
 
+    def test_apply(self):
+        # The specialized call agrees with the general one for every arrangement of operands
+        roll = operators.Roll([1, 2, 3], 6)
+        cases = [
+            (operators.Operator('=', 1, TestOperator.echo), [(roll, (4, 5)), (2, 3), (None, 3)]),
+            (operators.Operator('d', 0, TestOperator.echo, cajole=operators.Side.LEFT),
+             [(roll, (4, 5)), ((1, 2), roll)]),
+            (operators.Operator('!', 8, TestOperator.echo_one, arity=operators.Side.LEFT),
+             [(roll, None), ((1, 2), None), (None, 3)]),
+            (operators.Operator('m', 4, TestOperator.echo_one, arity=operators.Side.RIGHT),
+             [(None, roll), (None, 3), (3, None)]),
+        ]
+        for op, operands in cases:
+            for left, right in operands:
+                with self.subTest(op=op.code, left=left, right=right):
+                    self.assertEqual(self.outcome(op.apply, left, right),
+                                     self.outcome(op._generic, left, right))
+                    self.assertEqual(self.outcome(op, left, right),
+                                     self.outcome(op._generic, left, right))
+
+    @staticmethod
+    def outcome(call, left, right):
+        try:
+            return call(left, right)
+        except TypeError as e:
+            return type(e)
+
+    def test_apply_stochastic(self):
+        seen = []
+
+        def roll(x, y, rng=None):
+            seen.append(rng)
+            return x + y
+
+        op = operators.Operator('d', 7, roll, cajole=operators.Side.LEFT, stochastic=True)
+        rng = builtin_random.Random(1)
+        self.assertEqual(op.apply((1, 2), 3, rng), 6)
+        self.assertEqual(op.apply(1, 3), 4)
+        self.assertEqual(seen, [rng, None])
+
+    def test_slots(self):
+        op = operators.OPERATORS['+']
+        self.assertFalse(hasattr(op, '__dict__'))
+        self.assertEqual(copy.copy(op).apply(2, 3), 5)
+        self.assertEqual(pickle.loads(pickle.dumps(op)).apply(2, 3), 5)
+
 
 class TestRoll(unittest.TestCase):
 
@@ -179,6 +229,34 @@ class TestDeterministicFunctions(unittest.TestCase):
         self.assertEqual(result.rolls, [1, 2, 3, 4, 5, 6])
         self.assertEqual(result.discards, [])
 
+    def test_take_selected(self):
+        # Large unsorted rolls have the dice to keep picked out instead
+        rng = builtin_random.Random(2)
+        values = [rng.randint(1, 10) for _ in range(100)]
+        ordered = sorted(values)
+        for number in [0, 1, 3, 50, 99, 100]:
+            high = operators.take_high(operators.Roll(values[:], 10), number)
+            self.assertEqual(high.rolls, ordered[len(ordered) - number:])
+            self.assertEqual(high.discards, ordered[:len(ordered) - number])
+            low = operators.take_low(operators.Roll(values[:], 10), number)
+            self.assertEqual(low.rolls, ordered[:number])
+            self.assertEqual(low.discards, ordered[number:])
+
+    def test_take_chained(self):
+        rng = builtin_random.Random(3)
+        values = [rng.randint(1, 20) for _ in range(60)]
+        roll = operators.Roll(values, 20)
+        result = operators.take_low(operators.take_high(roll, 40), 10)
+        ordered = sorted(values)
+        self.assertEqual(result.rolls, ordered[20:30])
+        self.assertEqual(result.discards, ordered[:20] + ordered[30:])
+        self.assertEqual(str(result), '[d20: {}; ({})]'.format(
+            ', '.join(map(str, ordered[20:30])),
+            ', '.join(map(str, ordered[:20] + ordered[30:]))))
+        # The original is untouched
+        self.assertEqual(roll.rolls, ordered)
+        self.assertEqual(roll.discards, [])
+
     def test_floor_val(self):
         result = operators.floor_val(self.roll, 3)
         self.assertEqual(result.rolls, [3, 3, 3, 4, 5, 6])
@@ -197,6 +275,80 @@ class TestDeterministicFunctions(unittest.TestCase):
             operators.factorial(-1)
 
 
+class TestCountedRoll(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.values = [1, 1, 2, 3, 3, 3, 5, 6, 6]
+        self.counts = {1: 2, 2: 1, 3: 3, 4: 0, 5: 1, 6: 2}
+
+    def same(self, counted: operators.Roll, listed: operators.Roll):
+        self.assertIsInstance(counted, operators.CountedRoll)
+        self.assertTrue(counted.is_counted())
+        self.assertEqual(len(counted), len(listed))
+        self.assertEqual(list(counted), listed.rolls)
+        self.assertEqual(counted.total(), sum(listed))
+        self.assertEqual(str(counted), str(listed))
+        self.assertFalse(counted.is_counted())
+
+    def test_construction(self):
+        counted = operators.CountedRoll(self.counts, 6)
+        self.assertEqual(counted.die, 6)
+        self.same(counted, operators.Roll(self.values, 6))
+        self.assertEqual(counted.discards, [])
+
+    def test_functions(self):
+        functions = [
+            (operators.threshold_lower, 3), (operators.threshold_upper, 3),
+            (operators.take_high, 4), (operators.take_high, 20), (operators.take_high, -1),
+            (operators.take_low, 4), (operators.take_low, 0),
+            (operators.floor_val, 3), (operators.ceil_val, 2),
+        ]
+        for function, argument in functions:
+            counted = function(operators.CountedRoll(self.counts, 6), argument)
+            self.same(counted, function(operators.Roll(self.values, 6), argument))
+
+    def test_chained(self):
+        counted = operators.CountedRoll(self.counts, 6)
+        listed = operators.Roll(self.values, 6)
+        for function, argument in [(operators.take_high, 7), (operators.floor_val, 3),
+                                   (operators.take_low, 5), (operators.threshold_lower, 4)]:
+            counted = function(counted, argument)
+            listed = function(listed, argument)
+        self.same(counted, listed)
+        self.assertEqual(counted.discards, listed.discards)
+
+    def test_expanded(self):
+        counted = operators.CountedRoll(self.counts, 6)
+        counted.discard(0)
+        self.assertEqual(counted.rolls, self.values[1:])
+        self.assertEqual(counted.discards, [1])
+        # Once listed out, it carries on like any other roll
+        result = operators.take_high(counted, 2)
+        self.assertEqual(result.rolls, [6, 6])
+        self.assertEqual(result.discards, [1, 1, 2, 3, 3, 3, 5])
+
+    def test_copy(self):
+        counted = operators.take_high(operators.CountedRoll(self.counts, 6), 3)
+        copy = counted.copy()
+        copy.replace(0, 1)
+        self.assertEqual(counted.rolls, [5, 6, 6])
+        self.assertEqual(counted.discards, [1, 1, 2, 3, 3, 3])
+        self.assertEqual(copy.discards, [1, 1, 2, 3, 3, 3, 5])
+
+    def test_rolled(self):
+        rng = builtin_random.Random(3)
+        result = operators.roll_basic(operators.COUNTED_MINIMUM, 6, rng)
+        self.assertIsInstance(result, operators.CountedRoll)
+        self.assertEqual(len(result), operators.COUNTED_MINIMUM)
+        self.assertTrue(set(result) <= set(range(1, 7)))
+        result = operators.roll_basic(operators.COUNTED_MINIMUM, (1, 1, 2), rng)
+        self.assertEqual(len(result), operators.COUNTED_MINIMUM)
+        self.assertTrue(set(result) <= {1, 2})
+        # Too many faces for the number of dice
+        self.assertNotIsInstance(operators.roll_basic(operators.COUNTED_MINIMUM, 100, rng),
+                                 operators.CountedRoll)
+
+
 class TestRollFunctions(unittest.TestCase):
 
     def setUp(self) -> None:
@@ -276,23 +428,84 @@ class TestRollFunctions(unittest.TestCase):
 
     def test_reroll_unconditional_on(self):
         result = operators.reroll_unconditional_on(self.roll, 4)
-        self.assertEqual(result.rolls, [1, 2, 3, 5, 6, 10])
-        self.assertEqual(result.discards, [4, 4, 4, 4, 4, 4])
+        # The faces that are left aren't all in a row, so one is chosen from them
+        self.assertEqual(result.rolls, [1, 2, 3, 5, 6, 1190])
+        self.assertEqual(result.discards, [4])
+        with self.assertRaises(exceptions.ArgumentValueError):
+            operators.reroll_unconditional_on(operators.Roll([1, 1], 1), 1)
 
     def test_reroll_unconditional_higher(self):
+        self.randomMocker.randint = mock.Mock(side_effect=[3, 1, 2])
         result = operators.reroll_unconditional_higher(self.roll, 3)
-        self.assertEqual(result.rolls, [1, 1, 1, 1, 2, 3])
-        self.assertEqual(result.discards, [4, 4, 4, 4, 4, 4, 10, 10, 10, 10, 5, 6])
+        self.assertEqual(result.rolls, [1, 1, 2, 2, 3, 3])
+        self.assertEqual(result.discards, [4, 5, 6])
+        self.assertEqual(self.randomMocker.randint.call_args_list, [mock.call(1, 3)] * 3)
         with self.assertRaises(exceptions.ArgumentValueError):
             operators.reroll_unconditional_higher(self.roll, 0)
 
     def test_reroll_unconditional_lower(self):
+        self.randomMocker.randint = mock.Mock(side_effect=[5, 6, 5, 6])
         result = operators.reroll_unconditional_lower(self.roll, 5)
-        self.assertEqual(result.rolls, [5, 6, 10, 10, 10, 10])
-        self.assertEqual(result.discards, [1, 4, 4, 4, 4, 4, 2, 3, 4])
+        self.assertEqual(result.rolls, [5, 5, 5, 6, 6, 6])
+        self.assertEqual(result.discards, [1, 2, 3, 4])
+        self.assertEqual(self.randomMocker.randint.call_args_list, [mock.call(5, 6)] * 4)
         with self.assertRaises(exceptions.ArgumentValueError):
             operators.reroll_unconditional_lower(self.roll, 7)
 
+    def test_reroll_unconditional_sides(self):
+        roll = operators.Roll([1, 2, 2, 3], (1, 2, 2, 3))
+        self.randomMocker.choice = mock.Mock(return_value=3)
+        result = operators.reroll_unconditional_lower(roll, 2)
+        self.assertEqual(result.rolls, [2, 2, 3, 3])
+        self.randomMocker.choice.assert_called_once_with((2, 2, 3))
+        with self.assertRaises(exceptions.ArgumentValueError):
+            operators.reroll_unconditional_on(operators.Roll([2], (2, 2)), 2)
+
+    def test_reroll_unconditional_distribution(self):
+        # One draw of what is left is the same as rerolling until clear
+        rng = builtin_random.Random(5)
+        counts = collections.Counter()
+        for _ in range(6000):
+            counts.update(operators.reroll_unconditional_lower(self.roll, 3, rng))
+        self.assertEqual(set(counts), {3, 4, 5, 6})
+        # Every die that was below 3 became one of the four faces left
+        for face in range(3, 7):
+            expected = 6000 * (1 + 2 / 4)
+            self.assertAlmostEqual(counts[face] / expected, 1, delta=0.05)
+
+    def test_surviving_faces(self):
+        conditions = [operators.reroll_unconditional_on, operators.reroll_unconditional_higher,
+                      operators.reroll_unconditional_lower]
+        comparisons = [operators._equal, operators._higher, operators._lower]
+        for die in range(1, 8):
+            for target in [-1, 0, 1, 2.5, 3, 3.0, die, die + 1]:
+                for comp in comparisons:
+                    listed = tuple(face for face in range(1, die + 1) if not comp(face, target))
+                    if not listed:
+                        with self.assertRaises(exceptions.ArgumentValueError):
+                            operators.surviving_faces(die, target, comp)
+                        continue
+                    faces = operators.surviving_faces(die, target, comp)
+                    self.assertEqual(tuple(faces), listed, (die, target, comp))
+                    self.assertEqual([faces[i] for i in range(-len(faces), len(faces))],
+                                     list(listed) * 2)
+                    self.assertEqual([face in faces for face in range(die + 2)],
+                                     [face in listed for face in range(die + 2)])
+        # Nothing is listed out, however many faces the die has
+        faces = operators.surviving_faces(10 ** 12, 1, operators._equal)
+        self.assertEqual((len(faces), faces[0], faces[-1]), (10 ** 12 - 1, 2, 10 ** 12))
+        for condition, target in zip(conditions, [1, 10 ** 12 - 1, 2]):
+            result = condition(operators.Roll([1, 10 ** 12], 10 ** 12), target)
+            self.assertEqual(len(result), 2)
+
+    def test_reroll_unconditional_counted(self):
+        roll = operators.CountedRoll({1: 300, 2: 100, 6: 100}, 6)
+        result = operators.reroll_unconditional_on(roll, 1, builtin_random.Random(1))
+        self.assertTrue(result.is_counted())
+        self.assertEqual(len(result), 500)
+        self.assertNotIn(1, set(result))
+        self.assertEqual(result.discards, [1] * 300)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from unittest import mock
+
+from dndice import basic, compile, Engine, verbose
+from dndice.lib.evaltree import EvalTree, EvalTreeNode
+from dndice.lib.exceptions import ArgumentTypeError, ArgumentValueError, EvaluationError
+from dndice.lib.operators import OPERATORS
+from dndice.lib.optimizer import check_rerolls, check_types, fold_constants
+from tests import SeededRandomMixin, trees_equal
+from tests.test_compiler import EXPRESSIONS
+
+
+class FoldTester(SeededRandomMixin, unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        EvalTree.__eq__ = trees_equal
+
+    def test_arithmetic(self):
+        expected = EvalTree(None)
+        expected.root = EvalTreeNode(20)
+        self.assertEqual(fold_constants(EvalTree('(2+3)*4')), expected)
+
+    def test_around_dice(self):
+        expected = EvalTree(None)
+        expected.root = EvalTreeNode(OPERATORS['+'],
+                                     EvalTreeNode(OPERATORS['d'],
+                                                  EvalTreeNode(1),
+                                                  EvalTreeNode(20)),
+                                     EvalTreeNode(-3))
+        self.assertEqual(fold_constants(EvalTree('1d20+(2-5)')), expected)
+        expected.root = EvalTreeNode(OPERATORS['d'],
+                                     EvalTreeNode(5),
+                                     EvalTreeNode(6))
+        self.assertEqual(fold_constants(EvalTree('(2+3)d(2*3)')), expected)
+
+    def test_dice_not_folded(self):
+        for expr in ['1da6', '1dm6', '1dc6', '1d6']:
+            self.assertEqual(fold_constants(EvalTree(expr)), EvalTree(expr))
+
+    def test_original_untouched(self):
+        tree = EvalTree('1d20+(2+3)*4')
+        fold_constants(tree)
+        self.assertEqual(tree, EvalTree('1d20+(2+3)*4'))
+
+    def test_errors_deferred(self):
+        folded = fold_constants(EvalTree('1d4+1/0'))
+        self.assertEqual(folded, EvalTree('1d4+1/0'))
+        with self.assertRaises(EvaluationError):
+            folded.evaluate()
+        # Even errors that aren't one of ours, like rolling half a die
+        folded = fold_constants(EvalTree('(1da4)da6'), frozenset())
+        self.assertEqual(folded.root.payload, OPERATORS['da'])
+        with self.assertRaises(EvaluationError):
+            folded.evaluate()
+
+    def test_identical_results(self):
+        for expr in EXPRESSIONS:
+            for seed in range(10):
+                self.seed(seed)
+                expected = EvalTree(expr).evaluate()
+                self.seed(seed)
+                actual = fold_constants(EvalTree(expr)).evaluate()
+                self.assertEqual(expected, actual, '{} differed with seed {}'.format(expr, seed))
+
+    def test_compile(self):
+        self.randomMocker.randint = lambda start, end: 4
+        for engine in Engine:
+            tree = compile('1d20+(2+3)*4', engine=engine, optimize=True)
+            self.assertEqual(basic(tree), 24)
+            self.assertEqual(tree, EvalTree('1d20+(2+3)*4'))
+            self.assertEqual(verbose(tree), '[d20: 4]+(2+3)*4 = 24')
+
+    def test_compile_leaves_nodes(self):
+        # The folded tree is shared between rolls, so nothing may be written into it
+        self.randomMocker.randint = lambda start, end: 4
+        tree = compile('1d20+(2+3)*4', optimize=True)
+        with mock.patch.object(EvalTreeNode, 'value', new_callable=mock.PropertyMock) as value:
+            self.assertEqual(basic(tree), 24)
+        value.assert_not_called()
+
+    def test_deterministic_dice(self):
+        tree = EvalTree('4dm6h3+2*1da4')
+        # Every die is random by default
+        self.assertEqual(fold_constants(tree).root.payload, OPERATORS['+'])
+        folded = fold_constants(tree, frozenset({'d', 'dc'}))
+        self.assertTrue(folded.root.is_leaf())
+        self.assertEqual(folded.root.payload, 23)
+        partial = fold_constants(EvalTree('1d20+3dm6*1'), frozenset({'d'}))
+        self.assertEqual(partial.root.right.payload, 18)
+
+    def test_deep(self):
+        folded = fold_constants(EvalTree('+'.join(['1'] * 5000)))
+        self.assertEqual(folded.root.payload, 5000)
+
+
+class RerollCheckTester(unittest.TestCase):
+    def test_impossible(self):
+        for expr in ['1d1R1', '1d6R<7', '1d6R>0', '2d[2,2]R2', '4d6h3R<7', '1+3d4Rh0', '2dc4R<5']:
+            with self.assertRaises(ArgumentValueError, msg=expr):
+                check_rerolls(EvalTree(expr))
+            with self.assertRaises(ArgumentValueError, msg=expr):
+                compile(expr)
+        self.assertRaises(ArgumentValueError, basic, '1d1R1')
+
+    def test_possible(self):
+        for expr in ['1d6R<6', '1d6R>1', '1d2R1', '1d[1,2]R1', '1d(1d6)R1', '1d6R(1d6)', '']:
+            check_rerolls(EvalTree(expr))
+
+
+class TypeCheckTester(unittest.TestCase):
+    def test_wrong(self):
+        for expr in ['5h2', '3l1+1d6', '4t2', '3!h1', '1d6+(3!)l2']:
+            with self.assertRaises(ArgumentTypeError, msg=expr):
+                check_types(EvalTree(expr))
+
+    def test_right_or_unknown(self):
+        for expr in ['4d6h3', '3!', '(1d6)!', '4d6h(3/2)', '4d6h1l1t2', '(1+2)!', '']:
+            check_types(EvalTree(expr))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import itertools
+import unittest
+
+from dndice import compile, Parser
+from dndice.lib import pratt
+from dndice.lib.evaltree import EvalTree, EvalTreeNode
+from dndice.lib.exceptions import ParseError
+from tests.test_compiler import EXPRESSIONS
+
+
+def shape(node: EvalTreeNode):
+    if node is None:
+        return None
+    return node.payload, type(node.payload), shape(node.left), shape(node.right)
+
+
+class PrattTester(unittest.TestCase):
+    def assertSameTree(self, expr: str):
+        expected = shape(EvalTree(expr).root)
+        self.assertEqual(shape(pratt.parse(expr).root), expected, expr)
+
+    def test_expressions(self):
+        for expr in EXPRESSIONS:
+            self.assertSameTree(expr)
+
+    def test_precedence(self):
+        for expr in ['1+2*3', '1*2+3', '2^3^2', '1-2-3', '-2^2', '-2*3', '2*-3', '4d6h3!',
+                     '1d6!', '2d6d4', '-1d4', '+3', '(1+2)*3', '((2))', '3!!', '1 >= 2 & 3',
+                     '', '  ', '1d[1, 2.5]', '4dF', '2d(1d4)', '-(-3)', '1+-2']:
+            self.assertSameTree(expr)
+
+    def test_handed_back(self):
+        # These give odd trees or errors with the shunting-yard parser,
+        # which must be reproduced exactly
+        for expr in ['2^-3', '1+2^-3', '--3', '1!)(', '4d6h304)>=(3']:
+            try:
+                expected = shape(EvalTree(expr).root)
+            except Exception as e:
+                with self.assertRaises(type(e)):
+                    pratt.parse(expr)
+            else:
+                self.assertEqual(shape(pratt.parse(expr).root), expected, expr)
+
+    def test_exhaustive(self):
+        pieces = ['2', '-', '+', '*', '^', 'd', '!', '(', ')', '4']
+        for length in range(1, 5):
+            for combination in itertools.product(pieces, repeat=length):
+                expr = ''.join(combination)
+                try:
+                    expected = shape(EvalTree(expr).root)
+                except Exception as e:
+                    self.assertRaises(type(e), pratt.parse, expr)
+                else:
+                    self.assertEqual(shape(pratt.parse(expr).root), expected, expr)
+
+    def test_errors(self):
+        for expr in ['1d', '(1d4d2', '1+4)', '1 > = 4', '1d[1.4.4,2]', '1+F']:
+            with self.assertRaises(ParseError) as expected:
+                EvalTree(expr)
+            with self.assertRaises(ParseError) as raised:
+                pratt.parse(expr)
+            self.assertEqual(str(raised.exception), str(expected.exception))
+            # Nothing is left over from handing the expression back
+            self.assertIs(type(raised.exception.__context__), type(expected.exception.__context__))
+
+    def test_compile(self):
+        tree = compile('4d6h3+2', modifiers=1, parser=Parser.PRATT)
+        self.assertEqual(shape(tree.root), shape(compile('4d6h3+2', modifiers=1).root))
+        self.assertEqual(compile(5, parser=Parser.PRATT).root.payload, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
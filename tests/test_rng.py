@@ -0,0 +1,126 @@
+import random as builtin_random
+import unittest
+
+from dndice import basic, compile, Engine, verbose
+from dndice.lib.evaltree import EvalTree
+from dndice.lib.exceptions import InputTypeError
+from dndice.lib.operators import OPERATORS, roll_basic, single_die
+from dndice.lib.rng import as_rng, BufferedRandom, NumpyRandom
+from tests import SeededRandomMixin
+from tests.test_compiler import EXPRESSIONS, SUCCESS_COUNTS
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+class RNGTester(SeededRandomMixin, unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        # Nothing here should touch the global generator
+        self.randomMocker.randint.side_effect = AssertionError('The global generator was used')
+        self.randomMocker.choice.side_effect = AssertionError('The global generator was used')
+
+    def test_as_rng(self):
+        self.assertIsNone(as_rng(None))
+        source = builtin_random.Random(1)
+        self.assertIs(as_rng(source), source)
+        self.assertEqual(as_rng(5).randint(1, 1000), builtin_random.Random(5).randint(1, 1000))
+        self.assertRaises(InputTypeError, as_rng, 'random')
+
+    def test_operators(self):
+        self.assertEqual(single_die(20, builtin_random.Random(3)),
+                         builtin_random.Random(3).randint(1, 20))
+        source = builtin_random.Random(3)
+        self.assertEqual(roll_basic(4, (1, 2, 3), builtin_random.Random(3)).rolls,
+                         sorted(source.choice((1, 2, 3)) for _ in range(4)))
+        self.assertEqual(OPERATORS['r'](roll_basic(8, 2, builtin_random.Random(4)), 1,
+                                        builtin_random.Random(5)).rolls,
+                         OPERATORS['r'](roll_basic(8, 2, builtin_random.Random(4)), 1,
+                                        builtin_random.Random(5)).rolls)
+
+    def test_reproducible(self):
+        for expr in EXPRESSIONS:
+            self.assertEqual(basic(expr, rng=builtin_random.Random(11)),
+                             basic(expr, rng=builtin_random.Random(11)), expr)
+            self.assertEqual(verbose(expr, rng=12), verbose(expr, rng=12), expr)
+
+    def test_engines(self):
+        for expr in EXPRESSIONS:
+            expected = EvalTree(expr).evaluate(builtin_random.Random(7))
+            for engine in Engine:
+                if engine == Engine.CLOSURE and expr in SUCCESS_COUNTS:
+                    continue
+                for optimize in (False, True):
+                    tree = compile(expr, engine=engine, optimize=optimize)
+                    self.assertEqual(basic(tree, rng=builtin_random.Random(7)), expected,
+                                     (expr, engine, optimize))
+
+    def test_streams_are_independent(self):
+        first = builtin_random.Random(1)
+        second = builtin_random.Random(1)
+        rolls = [basic('1d1000', rng=first) for _ in range(5)]
+        basic('10d1000', rng=builtin_random.Random(2))
+        self.assertEqual([basic('1d1000', rng=second) for _ in range(5)], rolls)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        rng = as_rng(numpy.random.default_rng(3))
+        self.assertIsInstance(rng, NumpyRandom)
+        rolls = [basic('1d6', rng=rng) for _ in range(200)]
+        self.assertEqual(set(rolls), {1, 2, 3, 4, 5, 6})
+        self.assertIn(basic('1d[2,4,8]', rng=numpy.random.RandomState(3)), (2, 4, 8))
+        self.assertEqual(basic('4d6h3', rng=numpy.random.default_rng(9)),
+                         basic('4d6h3', rng=numpy.random.default_rng(9)))
+
+
+class BufferedRandomTester(unittest.TestCase):
+    def test_range(self):
+        rng = BufferedRandom(1, block_size=16)
+        rolls = [rng.randint(1, 6) for _ in range(1000)]
+        self.assertEqual(set(rolls), {1, 2, 3, 4, 5, 6})
+        self.assertEqual({rng.randint(-2, 0) for _ in range(100)}, {-2, -1, 0})
+        self.assertEqual(rng.randint(5, 5), 5)
+        self.assertRaises(ValueError, rng.randint, 1, 0)
+
+    def test_large_range(self):
+        rng = BufferedRandom(2)
+        rolls = [rng.randint(0, 2 ** 70) for _ in range(100)]
+        self.assertTrue(all(0 <= roll <= 2 ** 70 for roll in rolls))
+        self.assertGreater(max(rolls), 2 ** 64)
+
+    def test_bulk_matches_single(self):
+        for sides in (1, 3, 6, 20, 100, 2 ** 31 + 1):
+            single = BufferedRandom(3, block_size=8)
+            bulk = BufferedRandom(3, block_size=8)
+            self.assertEqual(bulk.randints(sides, 50),
+                             [single.randint(1, sides) for _ in range(50)], sides)
+            self.assertEqual(bulk.randint(1, sides), single.randint(1, sides))
+
+    def test_reproducible(self):
+        self.assertEqual(BufferedRandom(4).randints(20, 100), BufferedRandom(4).randints(20, 100))
+        self.assertNotEqual(BufferedRandom(4).randints(20, 100),
+                            BufferedRandom(5).randints(20, 100))
+
+    def test_choice(self):
+        rng = BufferedRandom(6)
+        self.assertEqual({rng.choice('abc') for _ in range(100)}, {'a', 'b', 'c'})
+        self.assertRaises(IndexError, rng.choice, ())
+
+    def test_urandom(self):
+        rng = BufferedRandom(urandom=True, block_size=4)
+        self.assertTrue(all(1 <= roll <= 8 for roll in rng.randints(8, 20)))
+
+    def test_rolling(self):
+        source = BufferedRandom(7)
+        self.assertEqual(roll_basic(10, 20, BufferedRandom(7)).rolls,
+                         sorted(single_die(20, source) for _ in range(10)))
+        for expr in EXPRESSIONS:
+            self.assertEqual(basic(expr, rng=BufferedRandom(8)),
+                             basic(compile(expr, engine=Engine.CLOSURE), rng=BufferedRandom(8)),
+                             expr)
+
+
+if __name__ == '__main__':
+    unittest.main()
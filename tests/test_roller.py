@@ -36,6 +36,12 @@ class TestParser(TestCase):
         with patch.object(sys, 'argv', ['roller.py', '-n', 'b', '1d4']):
             self.assertRaises(SystemExit, roller.parse)
 
+    def test_batch(self):
+        with patch.object(sys, 'argv', ['roller.py', '-b', '-n', '10', '1d4']):
+            self.assertTrue(roller.parse().batch)
+        with patch.object(sys, 'argv', ['roller.py', '1d4']):
+            self.assertFalse(roller.parse().batch)
+
     def test_display_flags(self):
         with patch.object(sys, 'argv', ['roller.py', '-w', '10', '1d4']):
             self.assertEqual(roller.parse().wrap, 10)
@@ -61,6 +67,7 @@ def base_args(**kwargs):
         'wrap': 80,
         'verbose': False,
         'number': 1,
+        'batch': False,
     }
     return Namespace(**{**default, **kwargs})
 
@@ -84,6 +91,15 @@ class TestMain(TestCase):
         roller.main()
         self.assertEqual(self.stdout.getvalue().strip(), '5 5 5')
 
+    @patch.object(roller, 'parse', Mock(return_value=base_args(number=3, batch=True)))
+    @patch.object(roller, 'compile', Mock(return_value=sentinel))
+    @patch.object(roller, 'basic_many')
+    def test_batch(self, basic_many: Mock):
+        basic_many.return_value = Mock(tolist=Mock(return_value=[1, 2, 3]))
+        roller.main()
+        self.assertEqual(self.stdout.getvalue().strip(), '1 2 3')
+        basic_many.assert_called_with(sentinel, 3, roller.Mode.NORMAL)
+
     @patch.object(roller, 'parse', Mock(return_value=base_args(average=True)))
     @patch.object(roller, 'compile', Mock(return_value=sentinel))
     @patch.object(roller, 'basic')
@@ -0,0 +1,71 @@
+import random as builtin_random
+import statistics
+import unittest
+
+from dndice.lib.rng import NumpyRandom
+from dndice.lib.sampling import binomial, multinomial, uniform
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+class OnlyRandint:
+    """A generator with nothing but ``randint``, which is all sampling may use."""
+
+    def __init__(self, seed):
+        self.source = builtin_random.Random(seed)
+
+    def randint(self, a, b):
+        return self.source.randint(a, b)
+
+
+class SamplingTester(unittest.TestCase):
+    def test_uniform(self):
+        rng = OnlyRandint(0)
+        values = [uniform(rng) for _ in range(1000)]
+        self.assertTrue(all(0 <= value < 1 for value in values))
+        self.assertAlmostEqual(statistics.mean(values), 0.5, delta=0.05)
+
+    def test_edges(self):
+        rng = OnlyRandint(0)
+        self.assertEqual(binomial(0, 0.5, rng), 0)
+        self.assertEqual(binomial(-3, 0.5, rng), 0)
+        self.assertEqual(binomial(10, 0, rng), 0)
+        self.assertEqual(binomial(10, 1, rng), 10)
+        self.assertEqual(multinomial(0, [1, 1, 1], rng), [0, 0, 0])
+
+    def test_binomial(self):
+        # Inversion, rejection, and both of them for probabilities over one half
+        for number, probability in [(20, 0.1), (30, 0.8), (1000, 0.3), (5000, 0.9)]:
+            rng = OnlyRandint(number)
+            samples = [binomial(number, probability, rng) for _ in range(4000)]
+            self.assertTrue(all(0 <= sample <= number for sample in samples))
+            mean = number * probability
+            variance = mean * (1 - probability)
+            error = 5 * (variance / len(samples)) ** 0.5
+            self.assertAlmostEqual(statistics.mean(samples), mean, delta=error)
+            self.assertAlmostEqual(statistics.pvariance(samples) / variance, 1, delta=0.1)
+
+    def test_multinomial(self):
+        rng = OnlyRandint(1)
+        totals = [0, 0, 0]
+        for _ in range(500):
+            counts = multinomial(600, [1, 2, 3], rng)
+            self.assertEqual(sum(counts), 600)
+            totals = [total + count for total, count in zip(totals, counts)]
+        for total, expected in zip(totals, [50000, 100000, 150000]):
+            self.assertAlmostEqual(total / expected, 1, delta=0.02)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        rng = NumpyRandom(numpy.random.default_rng(4))
+        counts = multinomial(1000, [1] * 6, rng)
+        self.assertEqual(sum(counts), 1000)
+        self.assertEqual(len(counts), 6)
+        self.assertTrue(0 <= binomial(100, 0.5, rng) <= 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
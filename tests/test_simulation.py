@@ -0,0 +1,81 @@
+import collections
+import pickle
+import random
+import unittest
+from unittest import mock
+
+from dndice import basic, compile, Engine, Mode, simulate
+from dndice.lib import simulation
+from dndice.lib.exceptions import ArgumentValueError, InputTypeError, ParseError
+
+
+class SimulationTester(unittest.TestCase):
+    def setUp(self) -> None:
+        shards = mock.patch.object(simulation, 'SHARD_SIZE', 100)
+        self.addCleanup(shards.stop)
+        shards.start()
+
+    def test_counts(self):
+        histogram = simulate('1d6', 1050, workers=2, seed=3)
+        self.assertEqual(sum(histogram.values()), 1050)
+        self.assertEqual(set(histogram), {1, 2, 3, 4, 5, 6})
+
+    def test_reproducible(self):
+        self.assertEqual(simulate('4d6h3', 1000, workers=2, seed=10),
+                         simulate('4d6h3', 1000, workers=2, seed=10))
+        self.assertNotEqual(simulate('4d6h3', 1000, workers=2, seed=10),
+                            simulate('4d6h3', 1000, workers=2, seed=11))
+
+    def test_independent_of_workers(self):
+        self.assertEqual(simulate('3d6', 1000, workers=1, seed=5),
+                         simulate('3d6', 1000, workers=3, seed=5))
+
+    def test_shards(self):
+        plan = simulation.shards(250, 7)
+        self.assertEqual([size for size, _ in plan], [100, 100, 50])
+        self.assertEqual(plan, simulation.shards(250, 7))
+        self.assertEqual(len({seed for _, seed in plan}), 3)
+        self.assertEqual(simulation.shards(0, 7), [])
+
+    def test_mode_and_modifiers(self):
+        self.assertEqual(simulate('4d6h3', 10, workers=1, mode=Mode.MAX), {18: 10})
+        self.assertEqual(simulate('2d6', 10, workers=1, mode=Mode.AVERAGE, modifiers=1),
+                         {8.0: 10})
+
+    def test_tree(self):
+        tree = compile('4d6h3', engine=Engine.CLOSURE)
+        self.assertEqual(simulate(tree, 500, workers=2, seed=4),
+                         simulate('4d6h3', 500, workers=2, seed=4))
+        self.assertEqual(simulate(tree, 10, workers=1, mode=Mode.MAX), {18: 10})
+
+    def test_engine(self):
+        # Workers roll a compiled tree just as basic would, once it is
+        # sent to them
+        tree = compile('15d6t5', engine=Engine.BYTECODE)
+        rng = random.Random(8)
+        self.assertEqual(simulation.roll_shard(pickle.loads(pickle.dumps(tree)), 50, 8),
+                         collections.Counter(basic(tree, rng=rng) for _ in range(50)))
+
+    def test_deep(self):
+        # Too deep to lower, so the workers roll it as a program
+        expr = '20' + '-1d4' * 5000
+        self.assertEqual(simulate(expr, 10, workers=1, mode=Mode.MAX), {20 - 4 * 5000: 10})
+
+    def test_empty(self):
+        self.assertEqual(simulate('1d20', 0), {})
+
+    def test_errors(self):
+        self.assertRaises(ParseError, simulate, '1d', 10)
+        self.assertRaises(InputTypeError, simulate, [], 10)
+        self.assertRaises(InputTypeError, simulate, '1d6', 1.5)
+        self.assertRaises(ArgumentValueError, simulate, '1d6', -1)
+
+    def test_endless_reroll(self):
+        # Caught up front rather than in every worker
+        with mock.patch('dndice.core._simulate', side_effect=AssertionError):
+            self.assertRaises(ArgumentValueError, simulate, '1d1R1', 10)
+            self.assertRaises(ArgumentValueError, simulate, '1d[2,2]R2', 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
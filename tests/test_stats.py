@@ -0,0 +1,57 @@
+import unittest
+from fractions import Fraction
+from unittest import mock
+
+from dndice import compile, distribution
+from dndice.lib.evaltree import EvalTree
+from dndice.lib.exceptions import EvaluationError
+from dndice.lib.stats import Stats, stats
+
+
+class StatsTester(unittest.TestCase):
+    def assertMatchesDistribution(self, expr: str):
+        exact = distribution(expr)
+        expected = Stats(exact.mean(), exact.variance(), min(exact), max(exact))
+        self.assertEqual(EvalTree(expr).stats(), expected, expr)
+
+    def test_constants(self):
+        self.assertEqual(EvalTree('2+3*4').stats(), Stats(14, 0, 14, 14))
+        self.assertEqual(EvalTree(None).stats(), Stats(0, 0, 0, 0))
+
+    def test_dice(self):
+        self.assertEqual(EvalTree('1d6').stats(), Stats(Fraction(7, 2), Fraction(35, 12), 1, 6))
+        self.assertEqual(EvalTree('3d8+2d6+5').stats().mean, Fraction(51, 2))
+        self.assertEqual(EvalTree('1d[1,1,4]').stats(), Stats(2, 2, 1, 4))
+
+    def test_linear(self):
+        for expr in ['3d8+2d6+5', '2d6-1d4', '2*1d6', '1d4*1d6', '-1d6+3', '+1d4',
+                     '(1d4)d6', '2dc6', '(1d3-1)d4', '1d[1,2,3,5]*2']:
+            self.assertMatchesDistribution(expr)
+
+    def test_fixed_dice(self):
+        self.assertEqual(EvalTree('2da6+1').stats(), Stats(8, 0, 8, 8))
+        self.assertEqual(EvalTree('2dm6').stats(), Stats(12, 0, 12, 12))
+
+    def test_fallback(self):
+        for expr in ['4d6h3', '2d20l1+5', '1d6r1*2', '(1d4)d(1d4)', '1d6/2', '1d20>10']:
+            self.assertMatchesDistribution(expr)
+
+    def test_no_rolling(self):
+        with mock.patch('dndice.lib.operators.random') as randomMocker:
+            randomMocker.randint.side_effect = AssertionError
+            tree = compile('4d6h3+3d8+2d6*2')
+            tree.stats()
+        randomMocker.randint.assert_not_called()
+
+    def test_not_modified(self):
+        tree = compile('4d6h3+1d8')
+        before = repr(tree)
+        tree.stats()
+        self.assertEqual(repr(tree), before)
+
+    def test_errors(self):
+        self.assertRaises(EvaluationError, stats, EvalTree('1d6R<7'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import collections
+import os
+import pickle
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import dndice
+from dndice import (basic, cache_clear, cache_info, compile, load_cache, save_cache,
+                    set_cache_size, verbose)
+from dndice.lib import store
+from dndice.lib.bytecode import Program
+from dndice.lib.exceptions import InputTypeError
+from dndice.lib.operators import OPERATORS
+from tests.test_compiler import EXPRESSIONS
+
+
+class StoreTester(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'expressions.cache')
+
+    def test_round_trip(self):
+        trees = {expr: compile(expr) for expr in EXPRESSIONS}
+        store.save(self.path, trees)
+        loaded = store.load(self.path)
+        self.assertEqual(set(loaded), set(EXPRESSIONS))
+        for expr, program in loaded.items():
+            self.assertEqual(program, Program.from_tree(trees[expr]), expr)
+            self.assertEqual(Program.from_tree(program.to_tree()), program, expr)
+            self.assertEqual(program(random.Random(3)), trees[expr].evaluate(random.Random(3)),
+                             expr)
+
+    def test_stale_version(self):
+        store.save(self.path, {'1d20': compile('1d20')})
+        with mock.patch.object(dndice, '__version__', '0.0.0'):
+            self.assertEqual(store.load(self.path), {})
+        self.assertEqual(len(store.load(self.path)), 1)
+
+    def test_changed_operators(self):
+        store.save(self.path, {'1d20': compile('1d20')})
+        before = store.fingerprint()
+        with mock.patch.object(OPERATORS['+'], 'precedence', 9):
+            self.assertNotEqual(store.fingerprint(), before)
+            self.assertEqual(store.load(self.path), {})
+
+    def test_not_a_cache(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'not a cache')
+        self.assertEqual(store.load(self.path), {})
+        # Nothing but plain values may be loaded
+        with open(self.path, 'wb') as file:
+            pickle.dump(store._header(), file)
+        self.assertEqual(store.load(self.path), {})
+        with open(self.path, 'wb') as file:
+            pickle.dump((store._header(), [('1', ((), mock.sentinel))]), file)
+        self.assertEqual(store.load(self.path), {})
+
+    def test_malformed(self):
+        for entries in [{}, {'1': ((-1,), (1,))}, [('1',)], [['1', ((-1,), (1,))]],
+                        [(1, ((-1,), (1,)))], [('1', ((-1,),))], [('1', ([-1], (1,)))],
+                        [('1', ((-2,), (1,)))], [('1', ((len(store.OPCODES),), ()))],
+                        [('1+', ((-1, 0), (1,)))], [('1 1', ((-1, -1), (1,)))]]:
+            with open(self.path, 'wb') as file:
+                pickle.dump((store._header(), entries), file)
+            with self.assertRaises(InputTypeError, msg=entries):
+                store.load(self.path)
+
+    def test_order(self):
+        exprs = ['1d{}'.format(sides) for sides in (20, 4, 12, 6, 100, 8, 10)]
+        store.save(self.path, collections.OrderedDict((expr, compile(expr)) for expr in exprs))
+        self.assertEqual(list(store.load(self.path)), exprs)
+
+
+class CacheFileTester(unittest.TestCase):
+    def setUp(self) -> None:
+        cache_clear()
+        self.addCleanup(cache_clear)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'expressions.cache')
+
+    def test_warm_start(self):
+        cold = {expr: [basic(expr, rng=seed) for seed in range(5)] for expr in EXPRESSIONS}
+        save_cache(self.path)
+        cache_clear()
+        self.assertEqual(load_cache(self.path), len(set(EXPRESSIONS)))
+        for expr in EXPRESSIONS:
+            # Rolled the same way whether or not the tree came from the file
+            self.assertEqual([basic(expr, rng=seed) for seed in range(5)], cold[expr], expr)
+            self.assertEqual(verbose(expr, rng=5), verbose(compile(expr), rng=5), expr)
+        self.assertEqual(cache_info().misses, 0)
+
+    def test_missing(self):
+        self.assertEqual(load_cache(self.path), 0)
+
+    def test_more_than_held(self):
+        store.save(self.path, {str(i): compile(str(i)) for i in range(10)})
+        self.addCleanup(set_cache_size, cache_info().maxsize)
+        set_cache_size(4)
+        self.assertEqual(load_cache(self.path), 4)
+        self.assertEqual(cache_info().size, 4)
+
+    def test_recency_kept(self):
+        for expr in ['1d4', '1d6', '1d8', '1d4']:
+            basic(expr)
+        save_cache(self.path)
+        cache_clear()
+        self.addCleanup(set_cache_size, cache_info().maxsize)
+        set_cache_size(2)
+        # The least recently used expression is the one that makes way
+        self.assertEqual(load_cache(self.path), 2)
+        basic('1d8')
+        basic('1d4')
+        self.assertEqual(cache_info().misses, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
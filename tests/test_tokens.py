@@ -134,6 +134,36 @@ class TokenTester(unittest.TestCase):
             self.assertEqual(tokenizer.tokens(s), tok,
                              '{} was supposed to parse into {}'.format(s, tok))
 
+    def test_scanner_matches_state_machine(self):
+        # Every combination of a few pieces, valid or not; wherever the fast
+        # scanner produces tokens, they must be exactly what the state
+        # machine produces
+        pieces = ['4', 'd', 'dc', '6', 'F', '[1, 2.5]', 'h', 'r<', '>=', '-', '(', ')', '!', ' ']
+        accepted = 0
+        for length in range(1, 5):
+            for combination in itertools.product(pieces, repeat=length):
+                expr = ''.join(combination)
+                scanned = tokenizer._scan(expr)
+                if scanned is None:
+                    continue
+                accepted += 1
+                expected = list(tokenizer.tokens_lazy(expr))
+                self.assertEqual(scanned, expected, expr)
+                self.assertEqual([type(t) for t in scanned], [type(t) for t in expected], expr)
+        self.assertGreater(accepted, 100)
+
+    def test_fallback(self):
+        for expr in ['1+F', '1 > = 4', '1d[1.4.4,2]', '2*((4+)8)', '1+4)', '']:
+            try:
+                expected = list(tokenizer.tokens_lazy(expr))
+            except exceptions.ParseError as e:
+                with self.assertRaises(exceptions.ParseError) as raised:
+                    tokenizer.tokens(expr)
+                self.assertEqual(str(raised.exception), str(e))
+                self.assertEqual(raised.exception.character, e.character)
+            else:
+                self.assertEqual(tokenizer.tokens(expr), expected)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,17 +1,18 @@
-import itertools
+import copy
+import operator
+import pickle
+import random as builtin_random
+import threading
+import typing
 import unittest
+from unittest import mock
 
-from dndice.lib.evaltree import EvalTreeNode, EvalTree
+from dndice import basic, compile, Engine, set_trusted
+from dndice.lib.bytecode import Program
+from dndice.lib.evaltree import AVERAGE, EvalTreeNode, EvalTree, MAXIMUM
 from dndice.lib.exceptions import EvaluationError, InputTypeError
-from dndice.lib.operators import OPERATORS, random, Roll
-
-
-def trees_equal(a: EvalTree, b: EvalTree) -> bool:
-    for nodeA, nodeB in itertools.zip_longest(a.pre_order(), b.pre_order(),
-                                              fillvalue=EvalTreeNode(None)):
-        if nodeA.payload != nodeB.payload:
-            return False
-    return True
+from dndice.lib.operators import Operator, OPERATORS, random, Roll
+from tests import trees_equal
 
 
 def tree_empty(tree: EvalTree) -> bool:
@@ -388,6 +389,177 @@ class TreeTester(unittest.TestCase):
         reconstructed = EvalTree(tokens)
         self.assertEqual(tree, reconstructed)
 
+    def test_traversal_order(self):
+        tree = EvalTree('(1+2)*3d6h2-4!')
+        self.assertEqual([str(node.payload) for node in tree.in_order()],
+                         ['(', '1', '+', '2', ')', '*', '3', 'd', '6', 'h', '2', '-', '4', '!'])
+        self.assertEqual([str(node.payload) for node in tree.pre_order()],
+                         ['-', '*', '+', '1', '2', 'h', 'd', '3', '6', '2', '!', '4'])
+        visited = []
+
+        def abort(node):
+            visited.append(str(node.payload))
+            return node.payload.precedence >= 6
+
+        self.assertEqual([str(node.payload) for node in tree.in_order(abort)],
+                         ['(', '1', '+', '2', ')', '*', 'h', '-', '!'])
+        self.assertEqual(visited, ['-', '*', '+', 'h', '!'])
+
+        def skip(node):
+            return node.is_leaf() or node.payload == '*'
+
+        self.assertEqual([str(node.payload) for node in tree.pre_order(skip)],
+                         ['-', '*', '!', '4'])
+        self.assertEqual(list(EvalTree(None).in_order()), [])
+        self.assertEqual(list(EvalTree(None).pre_order()), [])
+
+    @mock.patch.object(random, 'randint', lambda start, end: 4)
+    def test_deep(self):
+        terms = 5000
+        tree = EvalTree('1d20')
+        for _ in range(terms - 1):
+            tree += EvalTree('1d20')
+        self.assertTrue(repr(tree).startswith('EvalTree("1d20+1d20+'))
+        self.assertEqual(tree.evaluate(), 4 * terms)
+        copied = tree.copy()
+        self.assertEqual(copied, tree)
+        self.assertEqual(copied.root.value, tree.root.value)
+        self.assertEqual((tree + EvalTree('1')).evaluate(), 4 * terms + 1)
+        self.assertEqual((tree - EvalTree('1')).evaluate(), 4 * terms - 1)
+        self.assertTrue(tree.verbose_result().endswith(' = {}'.format(4 * terms)))
+        self.assertFalse(tree.is_critical())
+        tree.critify()
+        self.assertEqual(tree.evaluate(), 8 * terms)
+        tree.maxify()
+        self.assertEqual(tree.evaluate(), 20 * terms)
+        self.assertTrue(tree.is_critical())
+
+    def test_deep_node_repr(self):
+        # Each level is indented further, so this is kept just deep enough
+        # that recursing would fail
+        tree = EvalTree('1')
+        for _ in range(1500):
+            tree += EvalTree('1')
+        shown = repr(tree.root)
+        self.assertTrue(shown.startswith('EvalTreeNode(+,\n'))
+        self.assertEqual(shown.count('EvalTreeNode(1, None, None)'), 1501)
+
+
+class EvaluationTester(unittest.TestCase):
+    def test_untouched(self):
+        tree = compile('4d6h3+1d20')
+        evaluation = tree.roll(builtin_random.Random(1))
+        self.assertTrue(tree_empty(tree))
+        self.assertEqual(evaluation.final,
+                         EvalTree('4d6h3+1d20').evaluate(builtin_random.Random(1)))
+        self.assertEqual(evaluation.value(tree.root), evaluation.final)
+        self.assertIsNone(evaluation.value(EvalTreeNode(4)))
+
+    def test_same_as_evaluate(self):
+        for expr in ['4d6h3+2*(1d8r1)-3!', '-1d20', '1d[1,2.5]', '2dF', '5', '1d20>10']:
+            tree = EvalTree(expr)
+            evaluation = tree.roll(builtin_random.Random(2))
+            tree.evaluate(builtin_random.Random(2))
+            self.assertEqual(evaluation.verbose_result(), tree.verbose_result(), expr)
+            self.assertEqual(evaluation.is_critical(), tree.is_critical(), expr)
+            self.assertEqual(evaluation.is_fail(), tree.is_fail(), expr)
+        self.assertEqual(EvalTree(None).roll().final, 0)
+        self.assertEqual(EvalTree(None).roll().verbose_result(), '')
+
+    def test_rewrite(self):
+        tree = EvalTree('3d6+1d4')
+        self.assertEqual(tree.roll(rewrite=MAXIMUM).final, 22)
+        self.assertEqual(tree.roll(rewrite=AVERAGE).final, 13)
+        self.assertNotIn(OPERATORS['dm'], [node.payload for node in tree.pre_order()])
+
+    def test_threads(self):
+        tree = compile('1d20')
+        results = {}
+
+        def work(seed):
+            source = builtin_random.Random(seed)
+            results[seed] = [tree.roll(source).final for _ in range(100)]
+
+        threads = [threading.Thread(target=work, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for seed in range(8):
+            source = builtin_random.Random(seed)
+            self.assertEqual(results[seed], [source.randint(1, 20) for _ in range(100)])
+        self.assertTrue(tree_empty(tree))
+
+    def test_errors(self):
+        self.assertRaises(EvaluationError, EvalTree('1/0').roll)
+
+
+class PickleTester(unittest.TestCase):
+    def assertSameShape(self, a: typing.Optional[EvalTreeNode], b: typing.Optional[EvalTreeNode]):
+        if a is None or b is None:
+            self.assertIs(a, b)
+            return
+        self.assertIs(a.payload, b.payload) if isinstance(a.payload, Operator) \
+            else self.assertEqual(a.payload, b.payload)
+        self.assertSameShape(a.left, b.left)
+        self.assertSameShape(a.right, b.right)
+
+    def test_operators(self):
+        for op in OPERATORS.values():
+            self.assertIs(pickle.loads(pickle.dumps(op)), op)
+        custom = Operator('add', 2, operator.add)
+        restored = pickle.loads(pickle.dumps(custom))
+        self.assertIsNot(restored, custom)
+        self.assertEqual((restored.code, restored.function), ('add', operator.add))
+        # Copies are still independent objects
+        self.assertIsNot(copy.copy(OPERATORS['+']), OPERATORS['+'])
+        self.assertIsNot(copy.deepcopy(OPERATORS['+']), OPERATORS['+'])
+
+    def test_round_trip(self):
+        for expr in ['4d6h3+2*(1d8r1)-3!', '-1d20', '1d[1,2.5]', '2dF', '5']:
+            tree = EvalTree(expr)
+            tree.evaluate(builtin_random.Random(1))
+            restored = pickle.loads(pickle.dumps(tree))
+            self.assertSameShape(restored.root, tree.root)
+            self.assertTrue(tree_empty(restored), expr)
+        self.assertIsNone(pickle.loads(pickle.dumps(EvalTree(None))).root)
+        node = EvalTree('1+2').root
+        self.assertSameShape(pickle.loads(pickle.dumps(node)), node)
+
+    def test_evaluators(self):
+        self.addCleanup(set_trusted, False)
+        for trusted in (False, True):
+            set_trusted(trusted)
+            for engine in Engine:
+                for optimize in (False, True):
+                    for expr in ['4d6h3+2*3', '15d6t5']:
+                        tree = compile(expr, engine=engine, optimize=optimize)
+                        restored = pickle.loads(pickle.dumps(tree))
+                        case = expr, engine, optimize, trusted
+                        self.assertEqual([basic(restored, rng=seed) for seed in range(10)],
+                                         [basic(tree, rng=seed) for seed in range(10)], case)
+                        self.assertIs(type(restored.evaluator), type(tree.evaluator), case)
+                        self.assertEqual(restored.recipe, tree.recipe, case)
+
+    def test_evaluator_mode(self):
+        # The evaluator is made again as it was compiled, not in the
+        # mode of the process that unpickles it
+        self.addCleanup(set_trusted, False)
+        set_trusted(True)
+        data = pickle.dumps(compile('1d20/0', engine=Engine.CLOSURE))
+        set_trusted(False)
+        self.assertRaises(ZeroDivisionError, basic, pickle.loads(data))
+
+    def test_compact(self):
+        tree = EvalTree('+'.join(['1d20'] * 50))
+        # Each operator is written out once and referred to after that
+        self.assertLess(len(pickle.dumps(tree)), 700)
+
+    def test_deep(self):
+        tree = EvalTree('+'.join(['1'] * 5000))
+        self.assertEqual(Program.from_tree(pickle.loads(pickle.dumps(tree))),
+                         Program.from_tree(tree))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+
+from dndice import basic_many, compile, Mode
+from dndice.lib import vectorized
+from dndice.lib.evaltree import EvalTree, EvalTreeNode
+from dndice.lib.exceptions import ArgumentValueError, EvaluationError
+from dndice.lib.operators import Operator, OPERATORS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class BatchTester(unittest.TestCase):
+    def assertBetween(self, values, low, high):
+        self.assertGreaterEqual(values.min(), low)
+        self.assertLessEqual(values.max(), high)
+
+    def test_shape(self):
+        values = basic_many('1d20', 1000, rng=1)
+        self.assertEqual(values.shape, (1000,))
+        self.assertBetween(values, 1, 20)
+        self.assertEqual(set(values.tolist()), set(range(1, 21)))
+
+    def test_reproducible(self):
+        self.assertEqual(basic_many('4d6h3', 100, rng=7).tolist(),
+                         basic_many('4d6h3', 100, rng=7).tolist())
+
+    def test_constant(self):
+        self.assertEqual(basic_many('(2+3)*4', 5).tolist(), [20] * 5)
+        self.assertEqual(basic_many(3, 2, modifiers=1).tolist(), [4, 4])
+        self.assertEqual(basic_many('', 2).tolist(), [0, 0])
+
+    def test_arithmetic(self):
+        cases = {
+            '7/2': 3.5, '7%3': 1, '-7%3': 2, '2^3^2': 512, '2^(-1)': 0.5, '4!': 24, '-4': -4,
+            '+4': 4, '3>2': 1, '3<2': 0, '3>=3': 1, '3<=2': 0, '3=3': 1, '0|5': 5, '2|5': 2,
+            '0&5': 0, '2&5': 5, '(3>2)+(3>2)': 2, '3 gt 2': 1,
+        }
+        for expr, expected in cases.items():
+            self.assertEqual(basic_many(expr, 3).tolist(), [expected] * 3, expr)
+
+    def test_modes(self):
+        self.assertEqual(basic_many('3d4', 3, mode=Mode.AVERAGE).tolist(), [7.5] * 3)
+        self.assertEqual(basic_many('3d6', 3, mode=Mode.MAX).tolist(), [18] * 3)
+        self.assertBetween(basic_many('3d4', 1000, mode=Mode.CRIT), 6, 24)
+        tree = compile('3d4')
+        basic_many(tree, 3, mode=Mode.CRIT)
+        self.assertEqual(tree.root.payload, OPERATORS['d'])
+
+    def test_selection(self):
+        self.assertBetween(basic_many('2d20h1', 1000), 1, 20)
+        advantage = basic_many('2d20h1', 20000, rng=3).mean()
+        disadvantage = basic_many('2d20l1', 20000, rng=3).mean()
+        self.assertAlmostEqual(advantage, 13.825, delta=0.2)
+        self.assertAlmostEqual(disadvantage, 7.175, delta=0.2)
+        self.assertEqual(basic_many('4d6h0', 3).tolist(), [0] * 3)
+        self.assertBetween(basic_many('4d6h9', 1000), 4, 24)
+        self.assertBetween(basic_many('4d6h(1d2)', 1000), 1, 12)
+
+    def test_rerolls(self):
+        self.assertBetween(basic_many('5d20R<15', 1000), 75, 100)
+        self.assertBetween(basic_many('10d8R>4', 1000), 10, 40)
+        self.assertBetween(basic_many('1d4R1', 1000), 2, 4)
+        self.assertBetween(basic_many('1d4r1', 1000), 1, 4)
+        rerolled = basic_many('1d6r1', 60000, rng=2)
+        self.assertAlmostEqual((rerolled == 1).mean(), 1 / 36, delta=0.005)
+        with self.assertRaises(EvaluationError):
+            basic_many('1d6R<7', 2)
+        with self.assertRaises(EvaluationError):
+            basic_many('1d6R>0', 2)
+        for expr in ['1d1R1', '1d[2,2]R2']:
+            with self.assertRaises(ArgumentValueError, msg=expr):
+                basic_many(expr, 2)
+        # Dice that are only known once rolled fail while rolling, never looping
+        for expr in ['1d(1d1)R1', '2d(1d1)R<2']:
+            with self.assertRaises(EvaluationError, msg=expr):
+                basic_many(expr, 2)
+        # Rerolling until clear draws the replacement once, from the faces that are left
+        rerolled = basic_many('1d(1d1+2)R<3+0*1d4', 1000, rng=3)
+        self.assertTrue((rerolled == 3).all())
+        self.assertBetween(basic_many('1d[1,1,5]R1', 100), 5, 5)
+
+    def test_thresholds_and_clamps(self):
+        self.assertBetween(basic_many('15d6t5', 1000), 0, 15)
+        self.assertBetween(basic_many('15d6T1', 1000), 0, 15)
+        self.assertBetween(basic_many('8d6f2', 1000), 16, 48)
+        self.assertBetween(basic_many('2d4c2', 1000), 2, 4)
+
+    def test_dice_forms(self):
+        self.assertEqual(set(basic_many('1d[3,3,3,5]', 1000).tolist()), {3, 5})
+        self.assertBetween(basic_many('4dF', 1000), -4, 4)
+        self.assertBetween(basic_many('2d(1d4)', 1000), 2, 8)
+        self.assertBetween(basic_many('(1d4)d6', 1000), 1, 24)
+        self.assertEqual(basic_many('2da6', 2).tolist(), [7.0] * 2)
+        self.assertEqual(basic_many('2dm[1,5]', 2).tolist(), [10] * 2)
+        self.assertBetween(basic_many('1dm(1d4)', 1000), 1, 4)
+
+    def test_errors(self):
+        for expr in ['2d20h(7/2)', '1/0', '(7/2)d6', '2d(7/2)', '(-1)!', '5h2']:
+            with self.assertRaises(EvaluationError, msg=expr):
+                basic_many(expr, 3)
+
+    def test_custom_operator(self):
+        tree = EvalTree(None)
+        tree.root = EvalTreeNode(Operator('?', 1, lambda x, y: x), EvalTreeNode(1), EvalTreeNode(2))
+        with self.assertRaises(EvaluationError):
+            vectorized.evaluate_batch(tree, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()